@@ -0,0 +1,82 @@
+"""
+Benchmark comparing thread and process scaling of memory update message generation.
+
+Usage::
+
+    python benchmarks/thread_scaling.py --updates 100000 --workers 1 2 4 8
+
+On builds with the GIL, thread scaling is limited by the Python parts of generation;
+on free-threaded builds threads are expected to scale like processes without the
+pickling overhead.
+
+"""
+
+import argparse
+import random
+import sys
+import sysconfig
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, SecurityFlags
+from secure_hardware_extension.engine import BatchGenerator, generate_messages
+
+
+def random_updates(count: int, distinct_keys: int, seed: int = 0):
+    generator = random.Random(seed)
+    keys = [
+        generator.getrandbits(128).to_bytes(16, "big") for _ in range(distinct_keys)
+    ]
+    return [
+        MemoryUpdateInfo(
+            new_key=generator.choice(keys),
+            auth_key=generator.choice(keys),
+            new_key_id=generator.randrange(1, 15),
+            auth_key_id=1,
+            counter=generator.randrange(2**28),
+            uid=generator.getrandbits(120).to_bytes(15, "big"),
+            flags=SecurityFlags(),
+        )
+        for _ in range(count)
+    ]
+
+
+def run_threads(updates, workers: int, chunk_size: int) -> float:
+    start = time.perf_counter()
+    with BatchGenerator(workers=workers, chunk_size=chunk_size) as engine:
+        for _ in engine.generate(updates):
+            pass
+    return time.perf_counter() - start
+
+
+def run_processes(updates, workers: int, chunk_size: int) -> float:
+    chunks = [updates[i : i + chunk_size] for i in range(0, len(updates), chunk_size)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(generate_messages, chunks):
+            pass
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--distinct-keys", type=int, default=64)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    arguments = parser.parse_args()
+
+    free_threaded = bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+    print(f"Python {sys.version.split()[0]}, free-threaded: {free_threaded}")
+    updates = random_updates(arguments.updates, arguments.distinct_keys)
+    print(f"{'workers':>8} {'threads [upd/s]':>16} {'processes [upd/s]':>18}")
+    for workers in arguments.workers:
+        threads = run_threads(updates, workers, arguments.chunk_size)
+        processes = run_processes(updates, workers, arguments.chunk_size)
+        print(
+            f"{workers:>8} {len(updates) / threads:>16.0f} {len(updates) / processes:>18.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,23 @@ Secure Hardware Extension package.
 
 """
 
-__all__ = ["constants", "datatypes", "memory_update"]
+__all__ = [
+    "archive",
+    "boot_mac",
+    "constants",
+    "counter_monitor",
+    "crypto",
+    "data_commands",
+    "datatypes",
+    "engine",
+    "memory_update",
+    "planner",
+    "prefetch",
+    "ram_key_export",
+    "serialization",
+    "service",
+    "sharding",
+    "trace",
+    "validation",
+    "verification",
+]
@@ -0,0 +1,640 @@
+"""
+Module contains append-only archive of issued memory update messages.
+
+"""
+
+__all__ = ["ArchivedUpdate", "UpdateArchive"]
+
+import heapq
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from secure_hardware_extension.datatypes import (
+    HexType,
+    MemoryUpdateInfo,
+    MemoryUpdateMessageSet,
+    uid_bytes,
+)
+from secure_hardware_extension.key_slots.base import KeySlots
+
+_RECORD = struct.Struct(">dI16s32s16s32s16s")
+_INDEX_ENTRY = struct.Struct(">15sBIdQ")
+_DATA_FILE = "records.dat"
+_MANIFEST_FILE = "index.manifest"
+_SEGMENT_NAME = "index-{:08d}.idx"
+_MAX_COUNTER = 0xFFFFFFF
+
+
+class ArchivedUpdate(NamedTuple):
+    """
+    Memory update messages stored in archive.
+
+    """
+
+    uid: bytes
+    new_key_id: int
+    auth_key_id: int
+    counter: int
+    timestamp: float
+    messages: MemoryUpdateMessageSet
+
+
+class _Segment:
+    """
+    Immutable, sorted file of fixed size index entries.
+
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.count = path.stat().st_size // _INDEX_ENTRY.size
+        self._file = open(path, "rb")
+        self._map = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.count
+            else b""
+        )
+
+    def close(self) -> None:
+        if self.count:
+            self._map.close()
+        self._file.close()
+
+    def _lower_bound(self, prefix: bytes) -> int:
+        low, high = 0, self.count
+        size = len(prefix)
+        while low < high:
+            middle = (low + high) // 2
+            offset = middle * _INDEX_ENTRY.size
+            if self._map[offset : offset + size] < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def scan(self, start: bytes, prefix: bytes) -> Iterator[bytes]:
+        """
+        Yields raw entries starting at ``start`` while they begin with ``prefix``.
+
+        """
+        for position in range(self._lower_bound(start), self.count):
+            offset = position * _INDEX_ENTRY.size
+            entry = self._map[offset : offset + _INDEX_ENTRY.size]
+            if not entry.startswith(prefix):
+                return
+            yield entry
+
+    def __iter__(self) -> Iterator[bytes]:
+        for offset in range(0, self.count * _INDEX_ENTRY.size, _INDEX_ENTRY.size):
+            yield self._map[offset : offset + _INDEX_ENTRY.size]
+
+
+class UpdateArchive:
+    """
+    Class holds an append-only archive of issued M1-M5 messages with an on-disk index.
+
+    Records are appended to a data file of fixed size records. Index entries sorted by
+    (UID, slot, counter, timestamp) are buffered in memory and flushed to immutable
+    segment files. Segments are size-tiered: a background thread merges
+    ``merge_factor`` segments of similar size into one of the next tier, so every entry
+    is rewritten about log(N / flush_threshold) / log(merge_factor) times and appends
+    never wait for a merge. Lookups by UID or by (UID, slot) are binary searches over
+    memory mapped segments, so their cost grows logarithmically with the archive size.
+    Timestamps shall not decrease, which keeps the data file ordered by time for time
+    range scans.
+
+    Examples
+    --------
+    >>> with UpdateArchive("campaign_archive") as archive:
+    ...     archive.append_update(update_info, messages)
+    ...     list(archive.find(uid, new_key_id=AutosarKeySlots.KEY_1, counters=(10, 20)))
+
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        flush_threshold: int = 100_000,
+        merge_factor: int = 4,
+    ) -> None:
+        """
+        Opens or creates archive directory and indexes records appended after the last
+        index flush.
+
+        Parameters
+        ----------
+        path : `Union` [`str`, `Path`]
+            Archive directory.
+
+        flush_threshold : `int`
+            Number of buffered index entries which triggers writing a segment.
+
+        merge_factor : `int`
+            Number of segments of the same size tier merged into one.
+
+        Raises
+        ------
+        `ValueError`
+            When threshold or merge factor is improper.
+
+        """
+        if flush_threshold < 1:
+            raise ValueError(
+                f"flush_threshold shall be at least 1. Value given: {flush_threshold}."
+            )
+        if merge_factor < 2:
+            raise ValueError(
+                f"merge_factor shall be at least 2. Value given: {merge_factor}."
+            )
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.flush_threshold = flush_threshold
+        self.merge_factor = merge_factor
+        self.merged_entries = 0
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+        self._merging = False
+        self._closed = False
+        self._pending: List[bytes] = []
+        self._segments = [self._open_segment(name) for name in self._read_manifest()]
+        self._next_number = 1 + max(
+            (int(segment.path.stem.split("-")[1]) for segment in self._segments),
+            default=-1,
+        )
+        self._remove_orphans()
+        self._data = open(self.path / _DATA_FILE, "a+b")
+        self._records = self._truncate_partial_record()
+        self._last_timestamp = self._read_last_timestamp()
+        self._reindex_tail()
+        self._compactor = threading.Thread(target=self._compact_tiers, daemon=True)
+        self._compactor.start()
+
+    def __enter__(self) -> "UpdateArchive":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._records
+
+    def close(self) -> None:
+        """
+        Flushes buffered index entries, waits for a running merge and closes files.
+        Segments left unmerged are merged after the archive is opened again.
+
+        """
+        with self._condition:
+            self.flush()
+            self._closed = True
+            self._condition.notify_all()
+        self._compactor.join()
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._data.close()
+
+    def _read_manifest(self) -> List[str]:
+        manifest = self.path / _MANIFEST_FILE
+        if not manifest.is_file():
+            return []
+        return [line for line in manifest.read_text().splitlines() if line]
+
+    def _write_manifest(self) -> None:
+        manifest = self.path / _MANIFEST_FILE
+        temporary = manifest.with_name(manifest.name + ".tmp")
+        temporary.write_text(
+            "".join(f"{segment.path.name}\n" for segment in self._segments)
+        )
+        os.replace(temporary, manifest)
+
+    def _open_segment(self, name: str) -> _Segment:
+        return _Segment(self.path / name)
+
+    def _remove_orphans(self) -> None:
+        live = {segment.path.name for segment in self._segments}
+        for path in self.path.glob("index-*.idx*"):
+            if path.name not in live:
+                path.unlink()
+
+    def _next_segment_path(self) -> Path:
+        path = self.path / _SEGMENT_NAME.format(self._next_number)
+        self._next_number += 1
+        return path
+
+    def _truncate_partial_record(self) -> int:
+        size = self._data.seek(0, os.SEEK_END)
+        records, rest = divmod(size, _RECORD.size)
+        if rest:
+            self._data.truncate(records * _RECORD.size)
+        return records
+
+    def _read_record(self, number: int) -> Tuple:
+        self._data.seek(number * _RECORD.size)
+        return _RECORD.unpack(self._data.read(_RECORD.size))
+
+    def _read_last_timestamp(self) -> float:
+        return self._read_record(self._records - 1)[0] if self._records else 0.0
+
+    def _reindex_tail(self) -> None:
+        indexed = sum(segment.count for segment in self._segments)
+        for number in range(indexed, self._records):
+            timestamp, counter, m1, *_ = self._read_record(number)
+            self._pending.append(self._index_entry(m1, counter, timestamp, number))
+        self._data.seek(0, os.SEEK_END)
+
+    @staticmethod
+    def _index_entry(m1: bytes, counter: int, timestamp: float, number: int) -> bytes:
+        return _INDEX_ENTRY.pack(m1[:15], m1[15] >> 4, counter, timestamp, number)
+
+    def append(
+        self,
+        messages: MemoryUpdateMessageSet,
+        counter: int,
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """
+        Appends issued messages to archive.
+
+        Parameters
+        ----------
+        messages : `MemoryUpdateMessageSet`
+            Issued M1-M5 messages.
+
+        counter : `int`
+            Counter of update (28 bits).
+
+        timestamp : `float`, optional
+            Time of issue as seconds since epoch, current time by default.
+
+        Returns
+        -------
+        `int`
+            Number of appended record.
+
+        Raises
+        ------
+        `ValueError`
+            When counter is out of range or timestamp is older than the last record.
+
+        """
+        if not 0 <= counter <= _MAX_COUNTER:
+            raise ValueError(
+                f"counter shall be between 0 and {_MAX_COUNTER}. Value given: {counter}."
+            )
+        with self._lock:
+            if timestamp is None:
+                timestamp = max(time.time(), self._last_timestamp)
+            if timestamp < self._last_timestamp:
+                raise ValueError(
+                    f"timestamp shall not be older than the last record ({self._last_timestamp}). Value given: {timestamp}."
+                )
+            number = self._records
+            m1 = bytes(messages.m1)
+            self._data.write(
+                _RECORD.pack(
+                    timestamp,
+                    counter,
+                    m1,
+                    bytes(messages.m2),
+                    bytes(messages.m3),
+                    bytes(messages.m4),
+                    bytes(messages.m5),
+                )
+            )
+            self._pending.append(self._index_entry(m1, counter, timestamp, number))
+            self._records += 1
+            self._last_timestamp = timestamp
+            if len(self._pending) >= self.flush_threshold:
+                self.flush()
+            return number
+
+    def append_update(
+        self,
+        update_info: MemoryUpdateInfo,
+        messages: MemoryUpdateMessageSet,
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """
+        Appends messages issued for update to archive.
+
+        Parameters
+        ----------
+        update_info : `MemoryUpdateInfo`
+            Update the messages were generated from.
+
+        messages : `MemoryUpdateMessageSet`
+            Issued M1-M5 messages.
+
+        timestamp : `float`, optional
+            Time of issue as seconds since epoch, current time by default.
+
+        Returns
+        -------
+        `int`
+            Number of appended record.
+
+        """
+        return self.append(messages, update_info.counter, timestamp)
+
+    def flush(self) -> None:
+        """
+        Writes data file buffers and buffered index entries as a new segment.
+
+        """
+        with self._condition:
+            self._data.flush()
+            if not self._pending:
+                return
+            os.fsync(self._data.fileno())
+            self._pending.sort()
+            path = self._next_segment_path()
+            self._write_entries(path, iter(self._pending))
+            self._install(path)
+            self._pending = []
+            self._condition.notify_all()
+
+    @staticmethod
+    def _write_entries(path: Path, entries: Iterator[bytes]) -> int:
+        """
+        Writes sorted entries to a segment file.
+
+        Parameters
+        ----------
+        path : `Path`
+            Path of segment.
+
+        entries : `Iterator` [`bytes`]
+            Sorted index entries.
+
+        Returns
+        -------
+        `int`
+            Number of written entries.
+
+        """
+        temporary = path.with_name(path.name + ".tmp")
+        count = 0
+        with open(temporary, "wb") as file:
+            for entry in entries:
+                file.write(entry)
+                count += 1
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        return count
+
+    def _install(self, path: Path, replaced: Tuple[_Segment, ...] = ()) -> None:
+        """
+        Replaces merged segments with a new one in manifest, holding the lock.
+
+        Parameters
+        ----------
+        path : `Path`
+            Path of written segment.
+
+        replaced : `Tuple` [`_Segment`, ...]
+            Segments merged into the new one, removed once manifest is updated.
+
+        """
+        for segment in replaced:
+            self._segments.remove(segment)
+        self._segments.append(self._open_segment(path.name))
+        self._write_manifest()
+        for segment in replaced:
+            segment.close()
+            segment.path.unlink()
+
+    def _tier(self, count: int) -> int:
+        tier, size = 0, self.flush_threshold * self.merge_factor
+        while count >= size:
+            tier, size = tier + 1, size * self.merge_factor
+        return tier
+
+    def _mergeable(self) -> Optional[Tuple[_Segment, ...]]:
+        """
+        Finds ``merge_factor`` oldest segments of the lowest full size tier.
+
+        Returns
+        -------
+        `Tuple` [`_Segment`, ...], optional
+            Segments to merge, None when no tier is full.
+
+        """
+        tiers: Dict[int, List[_Segment]] = {}
+        for segment in self._segments:
+            tiers.setdefault(self._tier(segment.count), []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tuple(tiers[tier][: self.merge_factor])
+        return None
+
+    def _compact_tiers(self) -> None:
+        """
+        Merges full size tiers in background until archive is closed.
+
+        Segments are immutable, so they are merged without holding the lock, which is
+        taken only to swap segments in manifest.
+
+        """
+        while True:
+            with self._condition:
+                segments = None
+                while not self._closed:
+                    segments = self._mergeable()
+                    if segments is not None:
+                        break
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self._merging = True
+                path = self._next_segment_path()
+            try:
+                count = self._write_entries(path, heapq.merge(*segments))
+            except BaseException:
+                with self._condition:
+                    self._merging = False
+                    self._closed = True
+                    self._condition.notify_all()
+                raise
+            with self._condition:
+                self._install(path, segments)
+                self.merged_entries += count
+                self._merging = False
+                self._condition.notify_all()
+
+    def wait_for_compaction(self) -> None:
+        """
+        Waits until background merges of full size tiers are done.
+
+        """
+        with self._condition:
+            while not self._closed and (self._merging or self._mergeable() is not None):
+                self._condition.wait()
+
+    def compact(self) -> None:
+        """
+        Flushes buffered entries and merges all segments into one.
+
+        """
+        with self._condition:
+            self.flush()
+            while self._merging:
+                self._condition.wait()
+            if len(self._segments) > 1:
+                segments = tuple(self._segments)
+                path = self._next_segment_path()
+                self.merged_entries += self._write_entries(path, heapq.merge(*segments))
+                self._install(path, segments)
+
+    def _read(self, entry: bytes) -> ArchivedUpdate:
+        uid, new_key_id, counter, timestamp, number = _INDEX_ENTRY.unpack(entry)
+        return self._archived(self._read_record(number))
+
+    @staticmethod
+    def _archived(record: Tuple) -> ArchivedUpdate:
+        timestamp, counter, m1, m2, m3, m4, m5 = record
+        return ArchivedUpdate(
+            uid=m1[:15],
+            new_key_id=m1[15] >> 4,
+            auth_key_id=m1[15] & 0b1111,
+            counter=counter,
+            timestamp=timestamp,
+            messages=MemoryUpdateMessageSet(m1, m2, m3, m4, m5),
+        )
+
+    def find(
+        self,
+        uid: HexType,
+        new_key_id: Optional[Union[KeySlots, int]] = None,
+        counters: Optional[Tuple[int, int]] = None,
+        timestamps: Optional[Tuple[float, float]] = None,
+    ) -> List[ArchivedUpdate]:
+        """
+        Finds messages issued to UID, optionally for a key slot and ranges of counter
+        and time.
+
+        Parameters
+        ----------
+        uid : `HexType`
+            Unique Identification Identifier (120bits).
+
+        new_key_id : `Union` [`KeySlots`, `int`], optional
+            Updated key slot.
+
+        counters : `Tuple` [`int`, `int`], optional
+            Inclusive range of counters, requires ``new_key_id``.
+
+        timestamps : `Tuple` [`float`, `float`], optional
+            Inclusive range of issue time.
+
+        Returns
+        -------
+        `List` [`ArchivedUpdate`]
+            Archived updates sorted by slot, counter and time.
+
+        Raises
+        ------
+        `ValueError`
+            When counter range is given without key slot.
+
+        """
+        prefix = uid_bytes(uid)
+        if isinstance(new_key_id, KeySlots):
+            new_key_id = new_key_id.value
+        if new_key_id is not None:
+            prefix += bytes([new_key_id])
+        elif counters is not None:
+            raise ValueError("counters range requires new_key_id.")
+        start = prefix
+        if counters is not None:
+            start += struct.pack(">I", max(counters[0], 0))
+        with self._lock:
+            entries = [
+                entry
+                for segment in self._segments
+                for entry in self._scan_counters(segment.scan(start, prefix), counters)
+            ]
+            entries.extend(
+                entry
+                for entry in self._pending
+                if entry.startswith(prefix)
+                and (
+                    counters is None
+                    or counters[0] <= _INDEX_ENTRY.unpack(entry)[2] <= counters[1]
+                )
+            )
+            entries.sort()
+            results = []
+            for entry in entries:
+                if timestamps is not None:
+                    timestamp = _INDEX_ENTRY.unpack(entry)[3]
+                    if not timestamps[0] <= timestamp <= timestamps[1]:
+                        continue
+                results.append(self._read(entry))
+            return results
+
+    @staticmethod
+    def _scan_counters(
+        entries: Iterator[bytes], counters: Optional[Tuple[int, int]]
+    ) -> Iterator[bytes]:
+        for entry in entries:
+            if counters is not None and _INDEX_ENTRY.unpack(entry)[2] > counters[1]:
+                return
+            yield entry
+
+    def scan_time(self, start: float, end: float) -> Iterator[ArchivedUpdate]:
+        """
+        Scans records issued within inclusive time range, in order of issue.
+
+        Parameters
+        ----------
+        start : `float`
+            Beginning of time range.
+
+        end : `float`
+            End of time range.
+
+        Yields
+        ------
+        `ArchivedUpdate`
+            Archived updates.
+
+        """
+        with self._lock:
+            self._data.flush()
+            low, high = 0, self._records
+            while low < high:
+                middle = (low + high) // 2
+                if self._read_record(middle)[0] < start:
+                    low = middle + 1
+                else:
+                    high = middle
+            records = self._records
+        with open(self.path / _DATA_FILE, "rb") as data:
+            data.seek(low * _RECORD.size)
+            yield from self._scan_file(data, records - low, end)
+
+    def _scan_file(
+        self, data: BinaryIO, count: int, end: float
+    ) -> Iterator[ArchivedUpdate]:
+        for _ in range(count):
+            record = _RECORD.unpack(data.read(_RECORD.size))
+            if record[0] > end:
+                return
+            yield self._archived(record)
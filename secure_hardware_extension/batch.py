@@ -0,0 +1,482 @@
+"""
+Module contains columnar representation of memory update batches.
+Requires NumPy (``pip install SecureHardwareExtension[numpy]``).
+
+"""
+
+__all__ = [
+    "BatchMessages",
+    "UpdateBatch",
+    "diversify_keys",
+    "fids_from_flags",
+    "flags_from_fids",
+]
+
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Tuple
+
+import numpy as np
+from Crypto.Cipher import AES
+
+from secure_hardware_extension.constants import SheConstants
+from secure_hardware_extension.crypto import (
+    BLOCK_SIZE,
+    cmac_many,
+    compress_many,
+    diversify_many,
+)
+from secure_hardware_extension.datatypes import (
+    UID_SIZE,
+    MemoryUpdateInfo,
+    SecurityFlag,
+    SecurityFlags,
+)
+
+FLAG_BITS = {
+    name: flag._bit_index
+    for name, flag in vars(SecurityFlags).items()
+    if isinstance(flag, SecurityFlag)
+}
+
+
+def fids_from_flags(flags: Mapping[str, Iterable[bool]]) -> np.ndarray:
+    """
+    Packs columns of security flags into fids, following `SecurityFlags` bit layout.
+
+    Parameters
+    ----------
+    flags : `Mapping` [`str`, `Iterable` [`bool`]]
+        Columns of flags indexed by `SecurityFlags` attribute name. Missing flags are cleared.
+
+    Returns
+    -------
+    `np.ndarray`
+        Column of fids (uint8).
+
+    Raises
+    ------
+    `ValueError`
+        When unknown flag is given or columns have different lengths.
+
+    """
+    unknown = set(flags) - set(FLAG_BITS)
+    if unknown:
+        raise ValueError(f"Unknown security flags: {sorted(unknown)}.")
+    columns = {name: np.asarray(column, dtype=bool) for name, column in flags.items()}
+    lengths = {column.shape for column in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("Security flag columns shall have equal lengths.")
+    fids = np.zeros(lengths.pop() if lengths else (0,), dtype=np.uint8)
+    for name, column in columns.items():
+        fids |= column.astype(np.uint8) << FLAG_BITS[name]
+    return fids
+
+
+def flags_from_fids(fids: Iterable[int]) -> Dict[str, np.ndarray]:
+    """
+    Unpacks fids into columns of security flags, following `SecurityFlags` bit layout.
+
+    Parameters
+    ----------
+    fids : `Iterable` [`int`]
+        Column of fids.
+
+    Returns
+    -------
+    `Dict` [`str`, `np.ndarray`]
+        Columns of flags (bool) indexed by `SecurityFlags` attribute name.
+
+    """
+    fids = np.asarray(fids, dtype=np.uint8)
+    return {name: (fids >> bit & 1).astype(bool) for name, bit in FLAG_BITS.items()}
+
+
+def diversify_keys(master_key: bytes, constant: bytes, uids) -> np.ndarray:
+    """
+    Derives keys of many devices from master key and their UIDs in memory.
+
+    The column may be passed to `UpdateBatch` directly, e.g. as ``new_keys``, so keys
+    are neither converted to `she_bytes` objects nor written to files.
+
+    Parameters
+    ----------
+    master_key : `bytes`
+        Master key (128bits).
+
+    constant : `bytes`
+        Diversification constant (128bits).
+
+    uids : `array_like`
+        Unique Identification Identifiers, shape (N, 15) or concatenated bytes.
+
+    Returns
+    -------
+    `np.ndarray`
+        Diversified keys, shape (N, 16).
+
+    Raises
+    ------
+    `ValueError`
+        When master key, constant or UIDs have improper size.
+
+    """
+    uids = UpdateBatch._byte_column("uids", uids, UID_SIZE)
+    keys = diversify_many(master_key, constant, uids.tobytes())
+    return np.frombuffer(keys, dtype=np.uint8).reshape(-1, BLOCK_SIZE)
+
+
+class BatchMessages(NamedTuple):
+    """
+    Memory update messages of a batch, one row per update.
+
+    """
+
+    m1: np.ndarray
+    m2: np.ndarray
+    m3: np.ndarray
+    m4: np.ndarray
+    m5: np.ndarray
+
+
+class UpdateBatch:
+    """
+    Class holds memory update information as contiguous NumPy columns.
+
+    Byte columns (``new_keys``, ``auth_keys``, ``uids``) are two dimensional uint8 arrays
+    with one row per update, integer columns are one dimensional.
+
+    Examples
+    --------
+    >>> batch = UpdateBatch.from_update_infos(update_infos)
+    >>> messages = batch.messages()
+    >>> messages.m1.shape
+        (1000, 16)
+
+    """
+
+    def __init__(
+        self,
+        new_keys,
+        auth_keys,
+        new_key_ids,
+        auth_key_ids,
+        counters,
+        uids,
+        fids,
+    ) -> None:
+        """
+        Initializes batch with validated columns.
+
+        Parameters
+        ----------
+        new_keys : `array_like`
+            Keys which shall be updated, shape (N, 16) or concatenated bytes.
+
+        auth_keys : `array_like`
+            Keys used for authentication, shape (N, 16) or concatenated bytes.
+
+        new_key_ids : `array_like`
+            Key slots of keys to update (4 bits).
+
+        auth_key_ids : `array_like`
+            Key slots of authentication keys (4 bits).
+
+        counters : `array_like`
+            Counters of update operations (28 bits).
+
+        uids : `array_like`
+            Unique Identification Identifiers, shape (N, 15) or concatenated bytes.
+
+        fids : `array_like`
+            Integer representations of security flags (5 bits).
+
+        Raises
+        ------
+        `TypeError`
+            When column has improper type.
+
+        `ValueError`
+            When column has improper shape or values out of range.
+
+        """
+        self.new_keys = self._byte_column("new_keys", new_keys, 16)
+        self.auth_keys = self._byte_column("auth_keys", auth_keys, 16)
+        self.new_key_ids = self._integer_column("new_key_ids", new_key_ids, 4, np.uint8)
+        self.auth_key_ids = self._integer_column(
+            "auth_key_ids", auth_key_ids, 4, np.uint8
+        )
+        self.counters = self._integer_column("counters", counters, 28, np.uint32)
+        self.uids = self._byte_column("uids", uids, UID_SIZE)
+        self.fids = self._integer_column("fids", fids, 5, np.uint8)
+        lengths = {
+            len(column)
+            for column in (
+                self.new_keys,
+                self.auth_keys,
+                self.new_key_ids,
+                self.auth_key_ids,
+                self.counters,
+                self.uids,
+                self.fids,
+            )
+        }
+        if len(lengths) != 1:
+            raise ValueError("UpdateBatch columns shall have equal lengths.")
+
+    @staticmethod
+    def _byte_column(name: str, values, width: int) -> np.ndarray:
+        if isinstance(values, (bytes, bytearray, memoryview)):
+            if len(values) % width:
+                raise ValueError(
+                    f"{name} buffer size ({len(values)} bytes) shall be a multiple of {width} bytes."
+                )
+            return np.frombuffer(values, dtype=np.uint8).reshape(-1, width)
+        column = np.asarray(values)
+        if column.dtype != np.uint8:
+            raise TypeError(f"{name} shall be uint8 array instead of {column.dtype}.")
+        if column.ndim != 2 or column.shape[1] != width:
+            raise ValueError(
+                f"{name} shall have shape (N, {width}). Shape given: {column.shape}."
+            )
+        return np.ascontiguousarray(column)
+
+    @staticmethod
+    def _integer_column(name: str, values, bit_size: int, dtype) -> np.ndarray:
+        column = np.asarray(values)
+        if column.size == 0:
+            column = column.astype(dtype)
+        if column.dtype.kind not in "iu":
+            raise TypeError(f"{name} shall be integer array instead of {column.dtype}.")
+        if column.ndim != 1:
+            raise ValueError(
+                f"{name} shall be one dimensional. Shape given: {column.shape}."
+            )
+        max_value = 2**bit_size - 1
+        if column.size and (column.min() < 0 or column.max() > max_value):
+            raise ValueError(
+                f"{name} shall be between 0 and {max_value} (bit size {bit_size})."
+            )
+        return np.ascontiguousarray(column, dtype=dtype)
+
+    @classmethod
+    def from_update_infos(
+        cls, update_infos: Iterable[MemoryUpdateInfo]
+    ) -> "UpdateBatch":
+        """
+        Creates batch from memory update info objects.
+
+        Parameters
+        ----------
+        update_infos : `Iterable` [`MemoryUpdateInfo`]
+            Updates to convert.
+
+        Returns
+        -------
+        `UpdateBatch`
+            Batch with one row per update.
+
+        """
+        update_infos = list(update_infos)
+        return cls(
+            new_keys=b"".join(info.new_key for info in update_infos),
+            auth_keys=b"".join(info.auth_key for info in update_infos),
+            new_key_ids=np.fromiter(
+                (info.new_key_id for info in update_infos), np.uint8, len(update_infos)
+            ),
+            auth_key_ids=np.fromiter(
+                (info.auth_key_id for info in update_infos), np.uint8, len(update_infos)
+            ),
+            counters=np.fromiter(
+                (info.counter for info in update_infos), np.uint32, len(update_infos)
+            ),
+            uids=b"".join(info.uid for info in update_infos),
+            fids=np.fromiter(
+                (info.fid for info in update_infos), np.uint8, len(update_infos)
+            ),
+        )
+
+    def to_update_infos(self) -> List[MemoryUpdateInfo]:
+        """
+        Converts batch to memory update info objects.
+
+        Returns
+        -------
+        `List` [`MemoryUpdateInfo`]
+            One update per row.
+
+        """
+        return [
+            MemoryUpdateInfo(
+                new_key=new_key.tobytes(),
+                auth_key=auth_key.tobytes(),
+                new_key_id=int(new_key_id),
+                auth_key_id=int(auth_key_id),
+                counter=int(counter),
+                uid=uid.tobytes(),
+                flags=SecurityFlags(fid=int(fid)),
+            )
+            for new_key, auth_key, new_key_id, auth_key_id, counter, uid, fid in zip(
+                self.new_keys,
+                self.auth_keys,
+                self.new_key_ids,
+                self.auth_key_ids,
+                self.counters,
+                self.uids,
+                self.fids,
+            )
+        ]
+
+    def __len__(self) -> int:
+        return len(self.counters)
+
+    def take(self, indices) -> "UpdateBatch":
+        """
+        Selects rows of batch.
+
+        Parameters
+        ----------
+        indices : `array_like`
+            Indices or boolean mask of rows to select.
+
+        Returns
+        -------
+        `UpdateBatch`
+            Batch with selected rows.
+
+        """
+        return UpdateBatch(
+            new_keys=self.new_keys[indices],
+            auth_keys=self.auth_keys[indices],
+            new_key_ids=self.new_key_ids[indices],
+            auth_key_ids=self.auth_key_ids[indices],
+            counters=self.counters[indices],
+            uids=self.uids[indices],
+            fids=self.fids[indices],
+        )
+
+    @staticmethod
+    def _pack_high_words(high_words: np.ndarray) -> np.ndarray:
+        blocks = np.zeros((len(high_words), BLOCK_SIZE), dtype=np.uint8)
+        blocks[:, :8] = high_words.astype(">u8").view(np.uint8).reshape(-1, 8)
+        return blocks
+
+    @property
+    def m1(self) -> np.ndarray:
+        """
+        M1 messages, shape (N, 16).
+
+        """
+        slots = (self.new_key_ids << 4) | self.auth_key_ids
+        return np.concatenate((self.uids, slots[:, np.newaxis]), axis=1)
+
+    @property
+    def m2_plain(self) -> np.ndarray:
+        """
+        Plaintext of M2 messages (counter, fid and new key), shape (N, 32).
+
+        """
+        high_words = (self.counters.astype(np.uint64) << np.uint64(36)) | (
+            self.fids.astype(np.uint64) << np.uint64(31)
+        )
+        return np.concatenate(
+            (self._pack_high_words(high_words), self.new_keys), axis=1
+        )
+
+    @property
+    def m4_plain(self) -> np.ndarray:
+        """
+        Plaintext of encrypted M4 block (counter and padding bit), shape (N, 16).
+
+        """
+        high_words = (self.counters.astype(np.uint64) << np.uint64(36)) | np.uint64(
+            1 << 35
+        )
+        return self._pack_high_words(high_words)
+
+    @staticmethod
+    def _groups(keys: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Groups rows by key.
+
+        Parameters
+        ----------
+        keys : `np.ndarray`
+            Keys column, shape (N, 16).
+
+        Yields
+        ------
+        `Tuple` [`int`, `np.ndarray`]
+            Index of distinct key and indices of rows using it.
+
+        """
+        _, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind="stable")
+        boundaries = np.flatnonzero(np.diff(inverse[order])) + 1
+        for indices in np.split(order, boundaries):
+            if len(indices):
+                yield int(inverse[indices[0]]), indices
+
+    @staticmethod
+    def _derive(keys: np.ndarray, constant: bytes) -> List[bytes]:
+        unique_keys = np.unique(keys, axis=0)
+        derived = compress_many(unique_keys.tobytes(), constant)
+        return [
+            derived[offset : offset + BLOCK_SIZE]
+            for offset in range(0, len(derived), BLOCK_SIZE)
+        ]
+
+    def messages(self) -> BatchMessages:
+        """
+        Calculates M1-M5 messages of every update.
+
+        K1-K4 are derived once per distinct key and every group of rows sharing a key is
+        encrypted with multi-block AES calls.
+
+        Returns
+        -------
+        `BatchMessages`
+            Messages, one row per update.
+
+        """
+        count = len(self)
+        m1 = self.m1
+        m2 = np.empty((count, 2 * BLOCK_SIZE), dtype=np.uint8)
+        m3 = np.empty((count, BLOCK_SIZE), dtype=np.uint8)
+        m4 = np.empty((count, 2 * BLOCK_SIZE), dtype=np.uint8)
+        m5 = np.empty((count, BLOCK_SIZE), dtype=np.uint8)
+        if not count:
+            return BatchMessages(m1, m2, m3, m4, m5)
+
+        m2_plain = self.m2_plain
+        k1s = self._derive(self.auth_keys, SheConstants.KEY_UPDATE_ENC_C)
+        k2s = self._derive(self.auth_keys, SheConstants.KEY_UPDATE_MAC_C)
+        for key_index, indices in self._groups(self.auth_keys):
+            cipher = AES.new(k1s[key_index], AES.MODE_ECB)
+            plain = m2_plain[indices]
+            first = self._encrypt(cipher, plain[:, :BLOCK_SIZE])
+            second = self._encrypt(cipher, plain[:, BLOCK_SIZE:] ^ first)
+            m2[indices, :BLOCK_SIZE] = first
+            m2[indices, BLOCK_SIZE:] = second
+            m3[indices] = self._cmac(
+                k2s[key_index], np.concatenate((m1[indices], m2[indices]), axis=1)
+            )
+
+        m4_plain = self.m4_plain
+        k3s = self._derive(self.new_keys, SheConstants.KEY_UPDATE_ENC_C)
+        k4s = self._derive(self.new_keys, SheConstants.KEY_UPDATE_MAC_C)
+        m4[:, :BLOCK_SIZE] = m1
+        for key_index, indices in self._groups(self.new_keys):
+            cipher = AES.new(k3s[key_index], AES.MODE_ECB)
+            m4[indices, BLOCK_SIZE:] = self._encrypt(cipher, m4_plain[indices])
+            m5[indices] = self._cmac(k4s[key_index], m4[indices])
+        return BatchMessages(m1, m2, m3, m4, m5)
+
+    @staticmethod
+    def _encrypt(cipher, blocks: np.ndarray) -> np.ndarray:
+        encrypted = cipher.encrypt(np.ascontiguousarray(blocks).tobytes())
+        return np.frombuffer(encrypted, dtype=np.uint8).reshape(-1, BLOCK_SIZE)
+
+    @staticmethod
+    def _cmac(key: bytes, messages: np.ndarray) -> np.ndarray:
+        tags = cmac_many(key, messages.tobytes(), messages.shape[1])
+        return np.frombuffer(tags, dtype=np.uint8).reshape(-1, BLOCK_SIZE)
@@ -0,0 +1,280 @@
+"""
+Module contains Secure Hardware Extension secure boot BOOT_MAC calculation.
+
+"""
+
+__all__ = ["BootMacCalculator"]
+
+import hashlib
+import os
+import struct
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from Crypto.Cipher import AES
+from Crypto.Hash import CMAC
+
+from secure_hardware_extension.crypto import BLOCK_SIZE, cmac_finalize, cmac_subkeys
+from secure_hardware_extension.datatypes import (
+    BITS_IN_BYTE,
+    HexType,
+    SheBytes,
+    she_bytes,
+)
+
+_CHECKPOINT_MAGIC = b"SHEBMAC1"
+_CHECKPOINT_HEADER = struct.Struct(">8sIIQ8s")
+_CHECKPOINT_LABEL = b"BOOT_MAC checkpoints"
+_DIGEST_SIZE = 16
+
+Checkpoint = Tuple[bytes, bytes]
+
+
+class BootMacCalculator:
+    """
+    Class calculates BOOT_MAC of a bootloader image with optional checkpointing.
+
+    BOOT_MAC is defined as CMAC over ``0...0 (96 bits) | SIZE (32 bits) | BOOTLOADER``
+    where SIZE is the bootloader size in bits. When ``checkpoint_path`` is given, CBC-MAC
+    chaining states are saved every ``checkpoint_interval`` bytes of the image, together
+    with a digest of every interval. A subsequent calculation over a patched image of the
+    same size restarts from the last checkpoint preceding the first changed interval.
+
+    Only the CBC-MAC work is limited to the changed suffix. Finding the first changed
+    interval by digests hashes every interval of the image, so such a calculation is
+    still linear in the image size. When the offset of the first change is known, e.g.
+    from the patch, pass it as ``changed_from`` to hash the changed suffix only.
+
+    The sidecar file holds intermediate MAC states, so it shall be kept as confidential
+    as the build artifacts and never shipped with the image.
+
+    Examples
+    --------
+    >>> calculator = BootMacCalculator(boot_mac_key, checkpoint_path="image.bmac")
+    >>> calculator.calculate(image)
+    >>> calculator.calculate(patched_image)
+    >>> calculator.resumed_from
+        1048576
+
+    """
+
+    boot_mac_key: she_bytes = SheBytes(16 * BITS_IN_BYTE)
+
+    def __init__(
+        self,
+        boot_mac_key: HexType,
+        checkpoint_path: Optional[Union[str, Path]] = None,
+        checkpoint_interval: int = 64 * 1024,
+    ) -> None:
+        """
+        Initializes calculator.
+
+        Parameters
+        ----------
+        boot_mac_key : `HexType`
+            Key stored in BOOT_MAC_KEY slot (128bits).
+
+        checkpoint_path : `Union` [`str`, `Path`], optional
+            Sidecar file to keep chaining state checkpoints in.
+
+        checkpoint_interval : `int`
+            Distance between checkpoints in bytes, multiple of 16.
+
+        Raises
+        ------
+        `ValueError`
+            When checkpoint interval isn't a positive multiple of AES block size.
+
+        """
+        if checkpoint_interval <= 0 or checkpoint_interval % BLOCK_SIZE:
+            raise ValueError(
+                f"checkpoint_interval shall be a positive multiple of {BLOCK_SIZE}. Value given: {checkpoint_interval}."
+            )
+        self.boot_mac_key = boot_mac_key
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.checkpoint_interval = checkpoint_interval
+        self.resumed_from: Optional[int] = None
+        self._subkeys = cmac_subkeys(self.boot_mac_key)
+        self._key_check = CMAC.new(
+            self.boot_mac_key, _CHECKPOINT_LABEL, ciphermod=AES
+        ).digest()[:8]
+
+    def calculate(
+        self, bootloader: bytes, changed_from: Optional[int] = None
+    ) -> she_bytes:
+        """
+        Calculates BOOT_MAC of bootloader image.
+
+        Parameters
+        ----------
+        bootloader : `bytes`
+            Bootloader image.
+
+        changed_from : `int`, optional
+            Offset of the first byte changed since the previous calculation. When not
+            given, stored interval digests are used to find the first changed interval,
+            which hashes the whole image.
+
+        Returns
+        -------
+        `she_bytes`
+            BOOT_MAC value.
+
+        Raises
+        ------
+        `ValueError`
+            When bootloader size doesn't fit into 32 bits SIZE field.
+
+        """
+        size_in_bits = len(bootloader) * BITS_IN_BYTE
+        if size_in_bits > 0xFFFFFFFF:
+            raise ValueError(
+                f"bootloader size shall fit into 32 bits. Size given: {size_in_bits} bits."
+            )
+        prefix = size_in_bits.to_bytes(BLOCK_SIZE, byteorder="big")
+        self.resumed_from = None
+        if not bootloader:
+            return she_bytes(
+                cmac_finalize(
+                    self.boot_mac_key, bytes(BLOCK_SIZE), prefix, self._subkeys
+                )
+            )
+
+        image = memoryview(bootloader)
+        interval = self.checkpoint_interval
+        final_offset = (len(bootloader) - 1) // BLOCK_SIZE * BLOCK_SIZE
+        checkpoints = self._load_checkpoints(len(bootloader))
+        start = self._resume_index(checkpoints, image, changed_from)
+        if start is None:
+            start = 0
+            checkpoints = []
+            state = AES.new(self.boot_mac_key, AES.MODE_ECB).encrypt(prefix)
+        else:
+            self.resumed_from = start * interval
+            state = checkpoints[start][0]
+            checkpoints = checkpoints[:start]
+
+        for offset in range(start * interval, final_offset, interval):
+            checkpoints.append((state, self._digest(image[offset : offset + interval])))
+            chunk = image[offset : min(offset + interval, final_offset)]
+            state = AES.new(self.boot_mac_key, AES.MODE_CBC, iv=state).encrypt(chunk)[
+                -BLOCK_SIZE:
+            ]
+        tag = cmac_finalize(
+            self.boot_mac_key, state, bytes(image[final_offset:]), self._subkeys
+        )
+        self._save_checkpoints(len(bootloader), checkpoints)
+        return she_bytes(tag)
+
+    @staticmethod
+    def _digest(data: memoryview) -> bytes:
+        return hashlib.blake2b(data, digest_size=_DIGEST_SIZE).digest()
+
+    def _resume_index(
+        self,
+        checkpoints: List[Checkpoint],
+        image: memoryview,
+        changed_from: Optional[int],
+    ) -> Optional[int]:
+        """
+        Finds index of checkpoint to resume calculation from.
+
+        Parameters
+        ----------
+        checkpoints : `List` [`Checkpoint`]
+            Checkpoints loaded from sidecar file.
+
+        image : `memoryview`
+            Bootloader image.
+
+        changed_from : `int`, optional
+            Offset of the first changed byte.
+
+        Returns
+        -------
+        `int`, optional
+            Index of checkpoint or None when calculation shall start from scratch.
+
+        """
+        if not checkpoints:
+            return None
+        interval = self.checkpoint_interval
+        if changed_from is not None:
+            return min(max(changed_from, 0) // interval, len(checkpoints) - 1)
+        for index, (_, digest) in enumerate(checkpoints):
+            offset = index * interval
+            if self._digest(image[offset : offset + interval]) != digest:
+                return index
+        return len(checkpoints) - 1
+
+    def _load_checkpoints(self, image_size: int) -> List[Checkpoint]:
+        """
+        Loads checkpoints matching current key, interval and image size.
+
+        Parameters
+        ----------
+        image_size : `int`
+            Size of bootloader image in bytes.
+
+        Returns
+        -------
+        `List` [`Checkpoint`]
+            Pairs of chaining state and interval digest, empty when unusable.
+
+        """
+        if self.checkpoint_path is None or not self.checkpoint_path.is_file():
+            return []
+        data = self.checkpoint_path.read_bytes()
+        if len(data) < _CHECKPOINT_HEADER.size:
+            return []
+        magic, interval, count, size, key_check = _CHECKPOINT_HEADER.unpack_from(data)
+        entry_size = BLOCK_SIZE + _DIGEST_SIZE
+        if (
+            magic != _CHECKPOINT_MAGIC
+            or interval != self.checkpoint_interval
+            or size != image_size
+            or key_check != self._key_check
+            or len(data) != _CHECKPOINT_HEADER.size + count * entry_size
+        ):
+            return []
+        checkpoints = []
+        for offset in range(_CHECKPOINT_HEADER.size, len(data), entry_size):
+            checkpoints.append(
+                (
+                    data[offset : offset + BLOCK_SIZE],
+                    data[offset + BLOCK_SIZE : offset + entry_size],
+                )
+            )
+        return checkpoints
+
+    def _save_checkpoints(self, image_size: int, checkpoints: List[Checkpoint]) -> None:
+        """
+        Atomically replaces sidecar file with given checkpoints.
+
+        Parameters
+        ----------
+        image_size : `int`
+            Size of bootloader image in bytes.
+
+        checkpoints : `List` [`Checkpoint`]
+            Pairs of chaining state and interval digest.
+
+        """
+        if self.checkpoint_path is None:
+            return
+        header = _CHECKPOINT_HEADER.pack(
+            _CHECKPOINT_MAGIC,
+            self.checkpoint_interval,
+            len(checkpoints),
+            image_size,
+            self._key_check,
+        )
+        temporary_path = self.checkpoint_path.with_name(
+            self.checkpoint_path.name + ".tmp"
+        )
+        with open(temporary_path, "wb") as file:
+            file.write(header)
+            for state, digest in checkpoints:
+                file.write(state)
+                file.write(digest)
+        os.replace(temporary_path, self.checkpoint_path)
@@ -0,0 +1,304 @@
+"""
+Module contains streaming detection of counter reuse and regression.
+
+"""
+
+__all__ = ["CounterMonitor", "CounterStatus", "CounterViolation"]
+
+import hashlib
+import math
+import sqlite3
+from enum import IntEnum
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from secure_hardware_extension.datatypes import MemoryUpdateInfo
+from secure_hardware_extension.key_slots.base import KeySlots
+
+
+class CounterStatus(IntEnum):
+    """
+    Status of counter compared to high-water mark of its key slot.
+
+    """
+
+    NEW = 0
+    INCREASED = 1
+    DUPLICATE = 2
+    REGRESSION = 3
+
+
+class CounterViolation(NamedTuple):
+    """
+    Counter reused or decreased for a key slot.
+
+    """
+
+    uid: bytes
+    key_id: int
+    counter: int
+    high_water_mark: int
+    status: CounterStatus
+
+
+class _BloomFilter:
+    """
+    Bloom filter of byte strings with double hashing of a single BLAKE2b digest.
+
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, item: bytes) -> Iterator[int]:
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], byteorder="big")
+        second = int.from_bytes(digest[8:], byteorder="big") | 1
+        for number in range(self.hashes):
+            yield (first + number * second) % self.size
+
+    def add(self, item: bytes) -> None:
+        for index in self._indexes(item):
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, item: bytes) -> bool:
+        return all(
+            self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item)
+        )
+
+
+class CounterMonitor:
+    """
+    Class tracks high-water marks of counters per UID and key slot and flags counters
+    which are reused or decreased.
+
+    Recent key slots are held in a dictionary of at most ``max_entries`` items. When it
+    is full, marks are spilled to a SQLite database and the dictionary is cleared.
+    A Bloom filter of all seen key slots prevents disk lookups of key slots seen for
+    the first time, so cost per record stays small and constant, while memory is
+    bounded by ``max_entries`` and size of the filter (about 1.2 bytes per expected
+    key slot at 1% error rate, e.g. 120 MB for 100M key slots).
+
+    Examples
+    --------
+    >>> with CounterMonitor("marks.sqlite", expected_keys=100_000_000) as monitor:
+    ...     for messages in engine.generate(monitor.watch(update_infos)):
+    ...         send(messages)
+
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_entries: int = 1_000_000,
+        expected_keys: int = 10_000_000,
+        error_rate: float = 0.01,
+        on_violation: Optional[Callable[[CounterViolation], None]] = None,
+    ) -> None:
+        """
+        Initializes monitor.
+
+        Parameters
+        ----------
+        path : `Union` [`str`, `Path`], optional
+            Path of SQLite database of spilled marks, temporary database by default.
+            Marks of existing database are monitored as well.
+
+        max_entries : `int`
+            Maximal number of marks held in memory.
+
+        expected_keys : `int`
+            Expected number of distinct key slots, used to size the Bloom filter.
+
+        error_rate : `float`
+            False positive rate of the Bloom filter at expected number of key slots.
+
+        on_violation : `Callable` [[`CounterViolation`], `None`], optional
+            Called on every violation found by `watch`. When not given, `watch`
+            raises `ValueError`.
+
+        Raises
+        ------
+        `ValueError`
+            When sizes aren't positive or error rate isn't between 0 and 1.
+
+        """
+        if max_entries < 1 or expected_keys < 1:
+            raise ValueError(
+                f"max_entries and expected_keys shall be positive. Values given: {max_entries}, {expected_keys}."
+            )
+        if not 0 < error_rate < 1:
+            raise ValueError(
+                f"error_rate shall be between 0 and 1. Value given: {error_rate}."
+            )
+        self.max_entries = max_entries
+        self.on_violation = on_violation
+        self.records = 0
+        self.violations = 0
+        self.spills = 0
+        self.disk_lookups = 0
+        self._marks: Dict[bytes, int] = {}
+        self._filter = _BloomFilter(expected_keys, error_rate)
+        self._database = sqlite3.connect(str(path) if path else "")
+        self._database.execute(
+            "CREATE TABLE IF NOT EXISTS marks (slot BLOB PRIMARY KEY, counter INTEGER)"
+        )
+        for (slot,) in self._database.execute("SELECT slot FROM marks"):
+            self._filter.add(slot)
+
+    def __enter__(self) -> "CounterMonitor":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Spills marks held in memory and closes database.
+
+        """
+        self._spill()
+        self._database.close()
+
+    def _spill(self) -> None:
+        if not self._marks:
+            return
+        with self._database:
+            self._database.executemany(
+                "INSERT INTO marks VALUES (?, ?) ON CONFLICT(slot) DO UPDATE "
+                "SET counter = max(counter, excluded.counter)",
+                self._marks.items(),
+            )
+        self._marks.clear()
+        self.spills += 1
+
+    def _high_water_mark(self, slot: bytes) -> Optional[int]:
+        mark = self._marks.get(slot)
+        if mark is not None or slot not in self._filter:
+            return mark
+        self.disk_lookups += 1
+        row = self._database.execute(
+            "SELECT counter FROM marks WHERE slot = ?", (slot,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _observe(self, slot: bytes, counter: int) -> Tuple[CounterStatus, int]:
+        self.records += 1
+        mark = self._high_water_mark(slot)
+        if mark is None:
+            status = CounterStatus.NEW
+            self._filter.add(slot)
+        elif counter > mark:
+            status = CounterStatus.INCREASED
+        elif counter == mark:
+            status = CounterStatus.DUPLICATE
+        else:
+            status = CounterStatus.REGRESSION
+        if status >= CounterStatus.DUPLICATE:
+            self.violations += 1
+            counter = mark
+        if slot not in self._marks and len(self._marks) >= self.max_entries:
+            self._spill()
+        self._marks[slot] = counter
+        return status, counter
+
+    def observe(
+        self, uid: bytes, key_id: Union[KeySlots, int], counter: int
+    ) -> CounterStatus:
+        """
+        Compares counter with high-water mark of key slot and updates the mark.
+
+        Parameters
+        ----------
+        uid : `bytes`
+            Unique Identification Identifier of device (120bits).
+
+        key_id : `Union` [`KeySlots`, `int`]
+            Key slot.
+
+        counter : `int`
+            Counter of update.
+
+        Returns
+        -------
+        `CounterStatus`
+            Status of counter.
+
+        """
+        if isinstance(key_id, KeySlots):
+            key_id = key_id.value
+        return self._observe(bytes(uid) + bytes([key_id]), counter)[0]
+
+    def watch(self, updates: Iterable[MemoryUpdateInfo]) -> Iterator[MemoryUpdateInfo]:
+        """
+        Passes updates through, checking their counters on the fly.
+
+        Parameters
+        ----------
+        updates : `Iterable` [`MemoryUpdateInfo`]
+            Updates, e.g. of campaign being generated.
+
+        Yields
+        ------
+        `MemoryUpdateInfo`
+            The same updates.
+
+        Raises
+        ------
+        `ValueError`
+            When counter is reused or decreased and no ``on_violation`` callback is set.
+
+        """
+        for update_info in updates:
+            uid = bytes(update_info.uid)
+            status, mark = self._observe(
+                uid + bytes([update_info.new_key_id]), update_info.counter
+            )
+            if status >= CounterStatus.DUPLICATE:
+                violation = CounterViolation(
+                    uid, update_info.new_key_id, update_info.counter, mark, status
+                )
+                if self.on_violation is None:
+                    raise ValueError(
+                        f"Counter {violation.counter} of slot {violation.key_id} of device "
+                        f"{violation.uid.hex()} is {status.name.lower()} "
+                        f"(high-water mark {violation.high_water_mark})."
+                    )
+                self.on_violation(violation)
+            yield update_info
+
+    def watch_messages(
+        self, m1s: Iterable[bytes], counters: Iterable[int]
+    ) -> Iterator[CounterStatus]:
+        """
+        Checks counters of captured messages, e.g. decoded by `decode_m2_headers`.
+
+        Parameters
+        ----------
+        m1s : `Iterable` [`bytes`]
+            M1 messages identifying UID and key slot.
+
+        counters : `Iterable` [`int`]
+            Counters of messages.
+
+        Yields
+        ------
+        `CounterStatus`
+            Status of every message.
+
+        """
+        for m1, counter in zip(m1s, counters):
+            yield self.observe(m1[:15], m1[15] >> 4, counter)
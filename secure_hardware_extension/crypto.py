@@ -0,0 +1,390 @@
+"""
+Module contains AES building blocks shared by Secure Hardware Extension commands.
+
+"""
+
+__all__ = [
+    "BLOCK_SIZE",
+    "KeyDerivationCache",
+    "cmac_finalize",
+    "cmac_many",
+    "cmac_subkeys",
+    "compress",
+    "compress_many",
+    "diversify",
+    "diversify_many",
+    "xor_bytes",
+]
+
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+from Crypto.Cipher import AES
+
+from secure_hardware_extension.datatypes import UID_SIZE
+
+BLOCK_SIZE = 16
+_CMAC_RB = 0x87
+_UID_PADDING = b"\x80"
+
+
+def xor_bytes(a: bytes, b: bytes) -> bytes:
+    """
+    XORs two byte strings of any, but equal, length in a single operation.
+
+    Parameters
+    ----------
+    a : `bytes`
+        First operand.
+
+    b : `bytes`
+        Second operand.
+
+    Returns
+    -------
+    `bytes`
+        Result of XOR.
+
+    Raises
+    ------
+    `ValueError`
+        When operands have different lengths.
+
+    """
+    if len(a) != len(b):
+        raise ValueError("Cannot XOR bytes with different lengths.")
+    return (
+        int.from_bytes(a, byteorder="big") ^ int.from_bytes(b, byteorder="big")
+    ).to_bytes(len(a), byteorder="big")
+
+
+def _double(block: bytes) -> bytes:
+    value = int.from_bytes(block, byteorder="big") << 1
+    if value >> 128:
+        value = (value & ((1 << 128) - 1)) ^ _CMAC_RB
+    return value.to_bytes(BLOCK_SIZE, byteorder="big")
+
+
+def cmac_subkeys(key: bytes) -> Tuple[bytes, bytes]:
+    """
+    Generates CMAC subkeys as defined in NIST SP 800-38B.
+
+    Parameters
+    ----------
+    key : `bytes`
+        AES-128 key.
+
+    Returns
+    -------
+    `Tuple` [`bytes`, `bytes`]
+        Subkeys K1 and K2.
+
+    """
+    k1 = _double(AES.new(key, AES.MODE_ECB).encrypt(bytes(BLOCK_SIZE)))
+    return k1, _double(k1)
+
+
+def cmac_finalize(
+    key: bytes, state: bytes, last_block: bytes, subkeys: Tuple[bytes, bytes]
+) -> bytes:
+    """
+    Processes the last message block of CMAC starting from a CBC-MAC chaining state.
+
+    Parameters
+    ----------
+    key : `bytes`
+        AES-128 key.
+
+    state : `bytes`
+        CBC-MAC chaining state after all blocks preceding the last one.
+
+    last_block : `bytes`
+        Last, possibly incomplete, message block (at most 16 bytes).
+
+    subkeys : `Tuple` [`bytes`, `bytes`]
+        CMAC subkeys as returned by `cmac_subkeys`.
+
+    Returns
+    -------
+    `bytes`
+        CMAC tag.
+
+    """
+    if len(last_block) == BLOCK_SIZE:
+        block = xor_bytes(last_block, subkeys[0])
+    else:
+        padded = last_block + b"\x80" + bytes(BLOCK_SIZE - len(last_block) - 1)
+        block = xor_bytes(padded, subkeys[1])
+    return AES.new(key, AES.MODE_ECB).encrypt(xor_bytes(block, state))
+
+
+def compress(*messages: bytes) -> bytes:
+    """
+    Miyaguchi-Preneel one-way compression function, uses AES-ECB under the hood.
+
+    Parameters
+    ----------
+    *messages : `bytes`
+        Blocks to be compressed.
+
+    Returns
+    -------
+    `bytes`
+        Compressed blocks.
+
+    """
+    key = bytes(BLOCK_SIZE)
+    for message in messages:
+        key = xor_bytes(
+            xor_bytes(AES.new(key, AES.MODE_ECB).encrypt(message), key), message
+        )
+    return key
+
+
+def compress_many(keys: bytes, constant: bytes) -> bytes:
+    """
+    Compresses every key with the same constant, e.g. to derive K1-K4 in bulk.
+
+    The first Miyaguchi-Preneel round uses the all-zero key for every input, so it is
+    calculated with a single multi-block AES call.
+
+    Parameters
+    ----------
+    keys : `bytes`
+        Concatenated 16 bytes keys.
+
+    constant : `bytes`
+        Derivation constant, e.g. `SheConstants.KEY_UPDATE_ENC_C`.
+
+    Returns
+    -------
+    `bytes`
+        Concatenated compression results, in order of keys.
+
+    """
+    first_round = xor_bytes(
+        AES.new(bytes(BLOCK_SIZE), AES.MODE_ECB).encrypt(keys), keys
+    )
+    view = memoryview(first_round)
+    return b"".join(
+        xor_bytes(
+            xor_bytes(
+                AES.new(view[offset : offset + BLOCK_SIZE], AES.MODE_ECB).encrypt(
+                    constant
+                ),
+                view[offset : offset + BLOCK_SIZE],
+            ),
+            constant,
+        )
+        for offset in range(0, len(first_round), BLOCK_SIZE)
+    )
+
+
+def diversify(master_key: bytes, constant: bytes, uid: bytes) -> bytes:
+    """
+    Derives key of a single device from master key and its UID.
+
+    The key is compression of master key, constant and UID padded with 0x80 byte.
+
+    Parameters
+    ----------
+    master_key : `bytes`
+        Master key (128bits).
+
+    constant : `bytes`
+        Diversification constant (128bits), e.g. distinct per key slot.
+
+    uid : `bytes`
+        Unique Identification Identifier of device (120bits).
+
+    Returns
+    -------
+    `bytes`
+        Diversified key.
+
+    """
+    return diversify_many(master_key, constant, uid)
+
+
+def diversify_many(master_key: bytes, constant: bytes, uids: bytes) -> bytes:
+    """
+    Derives keys of many devices from master key and their UIDs, see `diversify`.
+
+    Compression of master key and constant is shared by all devices, so the last
+    Miyaguchi-Preneel round of every device uses the same AES key and all of them are
+    calculated with a single multi-block AES call.
+
+    Parameters
+    ----------
+    master_key : `bytes`
+        Master key (128bits).
+
+    constant : `bytes`
+        Diversification constant (128bits).
+
+    uids : `bytes`
+        Concatenated 15 bytes UIDs.
+
+    Returns
+    -------
+    `bytes`
+        Concatenated 16 bytes keys, in order of UIDs.
+
+    Raises
+    ------
+    `ValueError`
+        When master key or constant isn't 16 bytes long or UIDs aren't 15 bytes long.
+
+    """
+    if len(master_key) != BLOCK_SIZE or len(constant) != BLOCK_SIZE:
+        raise ValueError(
+            f"Master key and constant shall be {BLOCK_SIZE} bytes long. "
+            f"Lengths given: {len(master_key)}, {len(constant)}."
+        )
+    if len(uids) % UID_SIZE:
+        raise ValueError(
+            f"UIDs buffer size ({len(uids)} bytes) shall be a multiple of {UID_SIZE} bytes."
+        )
+    state = compress(bytes(master_key), bytes(constant))
+    view = memoryview(uids)
+    blocks = _UID_PADDING.join(
+        view[offset : offset + UID_SIZE] for offset in range(0, len(uids), UID_SIZE)
+    )
+    blocks += _UID_PADDING if blocks else b""
+    count = len(blocks) // BLOCK_SIZE
+    return xor_bytes(
+        xor_bytes(AES.new(state, AES.MODE_ECB).encrypt(blocks), state * count), blocks
+    )
+
+
+def cmac_many(key: bytes, messages: bytes, message_size: int) -> bytes:
+    """
+    Calculates CMAC of many equally long messages under the same key.
+
+    Every message consists of whole AES blocks, so the i-th blocks of all messages are
+    chained with a single multi-block AES call.
+
+    Parameters
+    ----------
+    key : `bytes`
+        AES-128 key.
+
+    messages : `bytes`
+        Concatenated messages.
+
+    message_size : `int`
+        Size of every message in bytes, positive multiple of 16.
+
+    Returns
+    -------
+    `bytes`
+        Concatenated 16 bytes tags, in order of messages.
+
+    Raises
+    ------
+    `ValueError`
+        When messages don't consist of whole AES blocks.
+
+    """
+    if message_size <= 0 or message_size % BLOCK_SIZE or len(messages) % message_size:
+        raise ValueError(
+            f"Messages shall consist of whole {BLOCK_SIZE} bytes blocks. Message size given: {message_size}."
+        )
+    count = len(messages) // message_size
+    cipher = AES.new(key, AES.MODE_ECB)
+    view = memoryview(messages)
+    state = bytes(BLOCK_SIZE * count)
+    for offset in range(0, message_size, BLOCK_SIZE):
+        column = b"".join(
+            view[start : start + BLOCK_SIZE]
+            for start in range(offset, len(messages), message_size)
+        )
+        if offset + BLOCK_SIZE == message_size:
+            column = xor_bytes(column, cmac_subkeys(key)[0] * count)
+        state = cipher.encrypt(xor_bytes(state, column))
+    return state
+
+
+class KeyDerivationCache:
+    """
+    Thread-safe LRU cache of keys derived with the compression function.
+
+    The cache may be shared by many `MemoryUpdateProtocol` objects and threads. Values are
+    calculated outside of the lock, so concurrent misses of the same key may derive it
+    twice, but never observe a partially updated cache.
+
+    Examples
+    --------
+    >>> cache = KeyDerivationCache(max_size=4096)
+    >>> cache.derive(auth_key, SheConstants.KEY_UPDATE_ENC_C)
+
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        """
+        Initializes cache.
+
+        Parameters
+        ----------
+        max_size : `int`
+            Maximal number of derived keys kept in cache.
+
+        Raises
+        ------
+        `ValueError`
+            When max size isn't positive.
+
+        """
+        if max_size <= 0:
+            raise ValueError(f"max_size shall be positive. Value given: {max_size}.")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def derive(self, key: bytes, constant: bytes) -> bytes:
+        """
+        Gets compression of key and constant, calculating it on cache miss.
+
+        Parameters
+        ----------
+        key : `bytes`
+            Key to derive from.
+
+        constant : `bytes`
+            Derivation constant.
+
+        Returns
+        -------
+        `bytes`
+            Derived key.
+
+        """
+        cache_key = bytes(key) + bytes(constant)
+        with self._lock:
+            derived = self._entries.get(cache_key)
+            if derived is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return derived
+            self.misses += 1
+        derived = compress(key, constant)
+        with self._lock:
+            self._entries[cache_key] = derived
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return derived
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self) -> None:
+        """
+        Removes all derived keys from cache.
+
+        """
+        with self._lock:
+            self._entries.clear()
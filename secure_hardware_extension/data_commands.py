@@ -0,0 +1,621 @@
+"""
+Module contains software reference of Secure Hardware Extension data commands
+(CMD_ENC_ECB, CMD_DEC_ECB, CMD_ENC_CBC, CMD_DEC_CBC, CMD_GENERATE_MAC, CMD_VERIFY_MAC).
+
+"""
+
+__all__ = ["SheDataCommands"]
+
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, Optional, Union
+
+from Crypto.Cipher import AES
+from Crypto.Hash import CMAC
+
+from secure_hardware_extension.crypto import BLOCK_SIZE
+from secure_hardware_extension.datatypes import (
+    HexType,
+    SheBytes,
+    SheKeyStore,
+    she_bytes,
+)
+from secure_hardware_extension.key_slots.base import KeySlots
+
+KeyId = Union[KeySlots, int]
+StreamType = Union[str, Path, BinaryIO]
+
+
+class _InitializationVector:
+    iv: she_bytes = SheBytes(BLOCK_SIZE * 8)
+
+    def __init__(self, iv: HexType) -> None:
+        self.iv = iv
+
+
+@contextmanager
+def _open_stream(stream: StreamType, mode: str) -> Iterator[BinaryIO]:
+    if isinstance(stream, (str, Path)):
+        with open(stream, mode) as file:
+            yield file
+    else:
+        yield stream
+
+
+class SheDataCommands:
+    """
+    Class calculates host-side reference results of SHE data commands.
+
+    Every command is available for bytes and as a streaming variant working on binary
+    file objects or paths. Streams are processed in chunks of ``chunk_size`` bytes, so
+    memory use doesn't depend on data size. CBC decryption of a chunk is split across
+    ``workers`` threads, as every plaintext block depends only on two ciphertext blocks.
+
+    Examples
+    --------
+    >>> key_store = SheKeyStore({AutosarKeySlots.KEY_1: "000102030405060708090a0b0c0d0e0f"})
+    >>> with SheDataCommands(key_store) as commands:
+    ...     commands.encrypt_cbc_stream(AutosarKeySlots.KEY_1, iv, "plain.bin", "cipher.bin")
+
+    """
+
+    def __init__(
+        self,
+        key_store: SheKeyStore,
+        chunk_size: int = 1024 * 1024,
+        workers: int = 1,
+    ) -> None:
+        """
+        Initializes commands.
+
+        Parameters
+        ----------
+        key_store : `SheKeyStore`
+            Keys available for commands.
+
+        chunk_size : `int`
+            Size of chunks processed at once in bytes, multiple of 16.
+
+        workers : `int`
+            Number of threads used for CBC decryption.
+
+        Raises
+        ------
+        `ValueError`
+            When chunk size or number of workers is improper.
+
+        """
+        if chunk_size <= 0 or chunk_size % BLOCK_SIZE:
+            raise ValueError(
+                f"chunk_size shall be a positive multiple of {BLOCK_SIZE}. Value given: {chunk_size}."
+            )
+        if workers < 1:
+            raise ValueError(f"workers shall be at least 1. Value given: {workers}.")
+        self.key_store = key_store
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> "SheDataCommands":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shuts down worker threads.
+
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _key(self, key_id: KeyId, mac_usage: bool) -> she_bytes:
+        """
+        Gets key for command and checks its KEY_USAGE flag.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot.
+
+        mac_usage : `bool`
+            True for MAC commands, False for encryption and decryption commands.
+
+        Returns
+        -------
+        `she_bytes`
+            Key value.
+
+        Raises
+        ------
+        `ValueError`
+            When key isn't allowed to be used by the command.
+
+        """
+        entry = self.key_store.entry(key_id)
+        if entry.flags is not None and entry.flags.key_usage != mac_usage:
+            raise ValueError(
+                f"Key slot {entry.key_id} KEY_USAGE flag forbids {'MAC' if mac_usage else 'cipher'} commands."
+            )
+        return entry.key
+
+    @staticmethod
+    def _check_blocks(data: bytes) -> None:
+        if len(data) % BLOCK_SIZE:
+            raise ValueError(
+                f"Data size shall be a multiple of {BLOCK_SIZE} bytes. Size given: {len(data)}."
+            )
+
+    def _read_chunks(self, source: BinaryIO) -> Iterator[bytes]:
+        """
+        Reads stream in chunks of whole AES blocks.
+
+        Parameters
+        ----------
+        source : `BinaryIO`
+            Stream to read.
+
+        Yields
+        ------
+        `bytes`
+            Chunks of at most ``chunk_size`` bytes.
+
+        Raises
+        ------
+        `ValueError`
+            When stream size isn't a multiple of AES block size.
+
+        """
+        while True:
+            chunk = source.read(self.chunk_size)
+            while chunk and len(chunk) < self.chunk_size:
+                rest = source.read(self.chunk_size - len(chunk))
+                if not rest:
+                    break
+                chunk += rest
+            if not chunk:
+                return
+            self._check_blocks(chunk)
+            yield chunk
+
+    def _transform_stream(
+        self,
+        source: StreamType,
+        destination: StreamType,
+        transform: Callable[[bytes], bytes],
+    ) -> int:
+        processed = 0
+        with _open_stream(source, "rb") as reader, _open_stream(
+            destination, "wb"
+        ) as writer:
+            for chunk in self._read_chunks(reader):
+                writer.write(transform(chunk))
+                processed += len(chunk)
+        return processed
+
+    def _decrypt_cbc_chunk(self, key: bytes, iv: bytes, ciphertext: bytes) -> bytes:
+        """
+        Decrypts CBC chunk, splitting it across worker threads.
+
+        Parameters
+        ----------
+        key : `bytes`
+            AES key.
+
+        iv : `bytes`
+            Ciphertext block preceding the chunk.
+
+        ciphertext : `bytes`
+            Chunk to decrypt.
+
+        Returns
+        -------
+        `bytes`
+            Plaintext.
+
+        """
+        blocks = len(ciphertext) // BLOCK_SIZE
+        if self.workers == 1 or blocks < 2 * self.workers:
+            return AES.new(key, AES.MODE_CBC, iv=iv).decrypt(ciphertext)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        part_size = -(-blocks // self.workers) * BLOCK_SIZE
+        view = memoryview(ciphertext)
+
+        def decrypt_part(offset: int) -> bytes:
+            part_iv = iv if offset == 0 else view[offset - BLOCK_SIZE : offset]
+            return AES.new(key, AES.MODE_CBC, iv=part_iv).decrypt(
+                view[offset : offset + part_size]
+            )
+
+        return b"".join(
+            self._executor.map(decrypt_part, range(0, len(ciphertext), part_size))
+        )
+
+    def encrypt_ecb(self, key_id: KeyId, plaintext: bytes) -> she_bytes:
+        """
+        CMD_ENC_ECB reference.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of encryption key.
+
+        plaintext : `bytes`
+            Data to encrypt, multiple of 16 bytes.
+
+        Returns
+        -------
+        `she_bytes`
+            Ciphertext.
+
+        """
+        self._check_blocks(plaintext)
+        return she_bytes(
+            AES.new(self._key(key_id, False), AES.MODE_ECB).encrypt(plaintext)
+        )
+
+    def decrypt_ecb(self, key_id: KeyId, ciphertext: bytes) -> she_bytes:
+        """
+        CMD_DEC_ECB reference.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of decryption key.
+
+        ciphertext : `bytes`
+            Data to decrypt, multiple of 16 bytes.
+
+        Returns
+        -------
+        `she_bytes`
+            Plaintext.
+
+        """
+        self._check_blocks(ciphertext)
+        return she_bytes(
+            AES.new(self._key(key_id, False), AES.MODE_ECB).decrypt(ciphertext)
+        )
+
+    def encrypt_cbc(self, key_id: KeyId, iv: HexType, plaintext: bytes) -> she_bytes:
+        """
+        CMD_ENC_CBC reference.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of encryption key.
+
+        iv : `HexType`
+            Initialization vector (128bits).
+
+        plaintext : `bytes`
+            Data to encrypt, multiple of 16 bytes.
+
+        Returns
+        -------
+        `she_bytes`
+            Ciphertext.
+
+        """
+        self._check_blocks(plaintext)
+        iv = _InitializationVector(iv).iv
+        return she_bytes(
+            AES.new(self._key(key_id, False), AES.MODE_CBC, iv=iv).encrypt(plaintext)
+        )
+
+    def decrypt_cbc(self, key_id: KeyId, iv: HexType, ciphertext: bytes) -> she_bytes:
+        """
+        CMD_DEC_CBC reference.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of decryption key.
+
+        iv : `HexType`
+            Initialization vector (128bits).
+
+        ciphertext : `bytes`
+            Data to decrypt, multiple of 16 bytes.
+
+        Returns
+        -------
+        `she_bytes`
+            Plaintext.
+
+        """
+        self._check_blocks(ciphertext)
+        iv = _InitializationVector(iv).iv
+        return she_bytes(
+            self._decrypt_cbc_chunk(self._key(key_id, False), iv, ciphertext)
+        )
+
+    def generate_mac(self, key_id: KeyId, message: bytes) -> she_bytes:
+        """
+        CMD_GENERATE_MAC reference.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of MAC key.
+
+        message : `bytes`
+            Message to authenticate.
+
+        Returns
+        -------
+        `she_bytes`
+            CMAC of message.
+
+        """
+        return she_bytes(
+            CMAC.new(self._key(key_id, True), message, ciphermod=AES).digest()
+        )
+
+    def verify_mac(
+        self,
+        key_id: KeyId,
+        message: bytes,
+        mac: bytes,
+        mac_length: Optional[int] = None,
+    ) -> bool:
+        """
+        CMD_VERIFY_MAC reference.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of MAC key.
+
+        message : `bytes`
+            Authenticated message.
+
+        mac : `bytes`
+            MAC to verify.
+
+        mac_length : `int`, optional
+            Number of most significant MAC bits to compare, all bits of ``mac`` by default.
+            0 compares the whole MAC, as MAC_LENGTH of CMD_VERIFY_MAC does.
+
+        Returns
+        -------
+        `bool`
+            Verification status.
+
+        """
+        return self._compare_mac(self.generate_mac(key_id, message), mac, mac_length)
+
+    @staticmethod
+    def _compare_mac(expected: bytes, mac: bytes, mac_length: Optional[int]) -> bool:
+        """
+        Compares most significant bits of MACs in constant time.
+
+        Parameters
+        ----------
+        expected : `bytes`
+            Calculated MAC.
+
+        mac : `bytes`
+            MAC to verify.
+
+        mac_length : `int`, optional
+            Number of bits to compare, 0 for the whole MAC.
+
+        Returns
+        -------
+        `bool`
+            True when bits are equal.
+
+        Raises
+        ------
+        `ValueError`
+            When MAC length is improper.
+
+        """
+        if mac_length is None:
+            mac_length = len(mac) * 8
+        elif mac_length == 0:
+            mac_length = len(expected) * 8
+        max_length = min(len(mac), len(expected)) * 8
+        if not 0 < mac_length <= max_length:
+            raise ValueError(
+                f"mac_length shall be between 1 and {max_length} bits, or 0 for the whole MAC. Value given: {mac_length}."
+            )
+        full_bytes, rest_bits = divmod(mac_length, 8)
+        equal = hmac.compare_digest(expected[:full_bytes], mac[:full_bytes])
+        if rest_bits:
+            mask = (0xFF << (8 - rest_bits)) & 0xFF
+            equal &= not ((expected[full_bytes] ^ mac[full_bytes]) & mask)
+        return equal
+
+    def encrypt_ecb_stream(
+        self, key_id: KeyId, source: StreamType, destination: StreamType
+    ) -> int:
+        """
+        CMD_ENC_ECB reference over stream.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of encryption key.
+
+        source : `StreamType`
+            Path or binary file object to read plaintext from.
+
+        destination : `StreamType`
+            Path or binary file object to write ciphertext to.
+
+        Returns
+        -------
+        `int`
+            Number of processed bytes.
+
+        """
+        cipher = AES.new(self._key(key_id, False), AES.MODE_ECB)
+        return self._transform_stream(source, destination, cipher.encrypt)
+
+    def decrypt_ecb_stream(
+        self, key_id: KeyId, source: StreamType, destination: StreamType
+    ) -> int:
+        """
+        CMD_DEC_ECB reference over stream.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of decryption key.
+
+        source : `StreamType`
+            Path or binary file object to read ciphertext from.
+
+        destination : `StreamType`
+            Path or binary file object to write plaintext to.
+
+        Returns
+        -------
+        `int`
+            Number of processed bytes.
+
+        """
+        cipher = AES.new(self._key(key_id, False), AES.MODE_ECB)
+        return self._transform_stream(source, destination, cipher.decrypt)
+
+    def encrypt_cbc_stream(
+        self,
+        key_id: KeyId,
+        iv: HexType,
+        source: StreamType,
+        destination: StreamType,
+    ) -> int:
+        """
+        CMD_ENC_CBC reference over stream.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of encryption key.
+
+        iv : `HexType`
+            Initialization vector (128bits).
+
+        source : `StreamType`
+            Path or binary file object to read plaintext from.
+
+        destination : `StreamType`
+            Path or binary file object to write ciphertext to.
+
+        Returns
+        -------
+        `int`
+            Number of processed bytes.
+
+        """
+        iv = _InitializationVector(iv).iv
+        cipher = AES.new(self._key(key_id, False), AES.MODE_CBC, iv=iv)
+        return self._transform_stream(source, destination, cipher.encrypt)
+
+    def decrypt_cbc_stream(
+        self,
+        key_id: KeyId,
+        iv: HexType,
+        source: StreamType,
+        destination: StreamType,
+    ) -> int:
+        """
+        CMD_DEC_CBC reference over stream.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of decryption key.
+
+        iv : `HexType`
+            Initialization vector (128bits).
+
+        source : `StreamType`
+            Path or binary file object to read ciphertext from.
+
+        destination : `StreamType`
+            Path or binary file object to write plaintext to.
+
+        Returns
+        -------
+        `int`
+            Number of processed bytes.
+
+        """
+        key = self._key(key_id, False)
+        previous_block = _InitializationVector(iv).iv
+
+        def decrypt(chunk: bytes) -> bytes:
+            nonlocal previous_block
+            plaintext = self._decrypt_cbc_chunk(key, previous_block, chunk)
+            previous_block = chunk[-BLOCK_SIZE:]
+            return plaintext
+
+        return self._transform_stream(source, destination, decrypt)
+
+    def generate_mac_stream(self, key_id: KeyId, source: StreamType) -> she_bytes:
+        """
+        CMD_GENERATE_MAC reference over stream.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of MAC key.
+
+        source : `StreamType`
+            Path or binary file object to read message from.
+
+        Returns
+        -------
+        `she_bytes`
+            CMAC of message.
+
+        """
+        cmac = CMAC.new(self._key(key_id, True), ciphermod=AES)
+        with _open_stream(source, "rb") as reader:
+            for chunk in iter(lambda: reader.read(self.chunk_size), b""):
+                cmac.update(chunk)
+        return she_bytes(cmac.digest())
+
+    def verify_mac_stream(
+        self,
+        key_id: KeyId,
+        source: StreamType,
+        mac: bytes,
+        mac_length: Optional[int] = None,
+    ) -> bool:
+        """
+        CMD_VERIFY_MAC reference over stream.
+
+        Parameters
+        ----------
+        key_id : `KeyId`
+            Key slot of MAC key.
+
+        source : `StreamType`
+            Path or binary file object to read message from.
+
+        mac : `bytes`
+            MAC to verify.
+
+        mac_length : `int`, optional
+            Number of most significant MAC bits to compare, all bits of ``mac`` by default.
+            0 compares the whole MAC, as MAC_LENGTH of CMD_VERIFY_MAC does.
+
+        Returns
+        -------
+        `bool`
+            Verification status.
+
+        """
+        return self._compare_mac(
+            self.generate_mac_stream(key_id, source), mac, mac_length
+        )
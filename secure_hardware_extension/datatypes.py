@@ -3,14 +3,25 @@ Module contains types using within the project.
 
 """
 
-__all__ = ["MemoryUpdateInfo", "MemoryUpdateMessages", "SecurityFlags", "she_bytes"]
-
-from typing import Optional, Union
+__all__ = [
+    "MemoryUpdateInfo",
+    "MemoryUpdateMessageSet",
+    "MemoryUpdateMessages",
+    "SecurityFlags",
+    "SheKeyStore",
+    "UID_SIZE",
+    "she_bytes",
+    "uid_bytes",
+]
+
+import threading
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple, Union
 
 from secure_hardware_extension.key_slots.base import KeySlots
 
 BITS_IN_BYTE = 8
 HexType = Union[str, bytes]
+UID_SIZE = 15
 
 
 class she_bytes(bytes):
@@ -99,6 +110,39 @@ class SheBytes(SheDescriptor):
         setattr(obj, f"_{self._attribute_name}", value)
 
 
+class _Uid:
+    uid: she_bytes = SheBytes(UID_SIZE * BITS_IN_BYTE)
+
+    def __init__(self, uid: HexType) -> None:
+        self.uid = uid
+
+
+def uid_bytes(uid: HexType) -> bytes:
+    """
+    Validates Unique Identification Identifier and converts it to bytes.
+
+    Parameters
+    ----------
+    uid : `HexType`
+        Unique Identification Identifier (120bits).
+
+    Returns
+    -------
+    `bytes`
+        UID as bytes.
+
+    Raises
+    ------
+    `TypeError`
+        When UID has improper type.
+
+    `ValueError`
+        When UID has improper size or isn't a hex string.
+
+    """
+    return bytes(_Uid(uid).uid)
+
+
 class SheInteger(SheDescriptor):
     """
     Descriptor to be used to validate and utilize integer type within SHE datatypes.
@@ -148,10 +192,11 @@ class SecurityFlag(SheDescriptor):
             raise TypeError(
                 f"Security flag {self._attribute_name} shall be type of bool."
             )
-        if value:
-            obj._fid = obj._fid | (1 << self._bit_index)
-        else:
-            obj._fid = obj._fid & ~(1 << self._bit_index)
+        with obj._lock:
+            if value:
+                obj._fid = obj._fid | (1 << self._bit_index)
+            else:
+                obj._fid = obj._fid & ~(1 << self._bit_index)
 
     def __get__(self, obj, objtype=None):
         return bool(obj._fid & (1 << self._bit_index))
@@ -192,9 +237,17 @@ class SecurityFlags:
             Integer representation of chosen bit flags.
 
         """
+        self._lock = threading.Lock()
         self._fid = 0
         self.fid = fid if fid else 0
 
+    def __getstate__(self) -> dict:
+        return {"_fid": self._fid}
+
+    def __setstate__(self, state: dict) -> None:
+        self._lock = threading.Lock()
+        self._fid = state["_fid"]
+
     @property
     def fid(self) -> int:
         """
@@ -231,12 +284,8 @@ class SecurityFlags:
             raise TypeError(f"fid shall be type of int. Type given: {type(value)}")
         if not 0 <= value <= 63:
             raise ValueError(f"fid shall be between 0 and 63. Value {value} given.")
-        self.write_protection = True if value & 0b100000 else False
-        self.boot_protection = True if value & 0b010000 else False
-        self.debugger_protection = True if value & 0b001000 else False
-        self.key_usage = True if value & 0b000100 else False
-        self.wildcard = True if value & 0b000010 else False
-        self.cmac_usage = True if value & 0b000001 else False
+        with self._lock:
+            self._fid = value
 
 
 class MemoryUpdateInfo:
@@ -262,7 +311,7 @@ class MemoryUpdateInfo:
     new_key_id: int = SheKeySlot(4)
     auth_key_id: int = SheKeySlot(4)
     counter: int = SheInteger(28)
-    uid: she_bytes = SheBytes(15 * BITS_IN_BYTE)
+    uid: she_bytes = SheBytes(UID_SIZE * BITS_IN_BYTE)
     fid: int = SheInteger(5)
     flags: SecurityFlags()
 
@@ -349,6 +398,19 @@ class MemoryUpdateInfo:
         self.fid = flags.fid
 
 
+class MemoryUpdateMessageSet(NamedTuple):
+    """
+    Memory update protocol messages M1-M5 of a single update.
+
+    """
+
+    m1: bytes
+    m2: bytes
+    m3: bytes
+    m4: bytes
+    m5: bytes
+
+
 class MemoryUpdateMessages:
     """
     Class holds information about messages which may be used to get memory update info.
@@ -378,3 +440,158 @@ class MemoryUpdateMessages:
         self.auth_key = auth_key
         self.M1 = m1
         self.M2 = m2
+
+
+class SheSecurityFlags(SheDescriptor):
+    """
+    Descriptor to be used to validate optional SecurityFlags within SHE datatypes.
+
+    """
+
+    def __init__(self):
+        pass
+
+    def __set__(self, obj, value):
+        if value is not None and not isinstance(value, SecurityFlags):
+            raise TypeError(
+                f"{self._attribute_name} shall be type of SecurityFlags instead of {type(value)}."
+            )
+        setattr(obj, f"_{self._attribute_name}", value)
+
+
+class SheKeyEntry:
+    """
+    Class holds a single key stored in a key slot.
+
+    """
+
+    key_id: int = SheKeySlot(4)
+    key: she_bytes = SheBytes(16 * BITS_IN_BYTE)
+    flags: Optional[SecurityFlags] = SheSecurityFlags()
+
+    def __init__(
+        self,
+        key_id: Union[KeySlots, int],
+        key: HexType,
+        flags: Optional[SecurityFlags] = None,
+    ) -> None:
+        """
+        Initializes key entry.
+
+        Parameters
+        ----------
+        key_id : `Union` [`KeySlots`, `int`]
+            Key slot of the key.
+
+        key : `HexType`
+            Key value (128bits).
+
+        flags : `SecurityFlags`, optional
+            Flags of key slot. When not given, key usage isn't restricted.
+
+        """
+        self.key_id = key_id
+        self.key = key
+        self.flags = flags
+
+
+class SheKeyStore:
+    """
+    Class holds keys in key slot layout, e.g. `AutosarKeySlots`.
+
+    Examples
+    --------
+    >>> key_store = SheKeyStore({AutosarKeySlots.KEY_1: "000102030405060708090a0b0c0d0e0f"})
+    >>> key_store[AutosarKeySlots.KEY_1]
+        b'\x00\x01\x02\x03\x04\x05\x06\x07\x08\t\n\x0b\x0c\r\x0e\x0f'
+
+    """
+
+    def __init__(
+        self, keys: Optional[Mapping[Union[KeySlots, int], HexType]] = None
+    ) -> None:
+        """
+        Initializes key store.
+
+        Parameters
+        ----------
+        keys : `Mapping` [`Union` [`KeySlots`, `int`], `HexType`], optional
+            Keys to load, indexed by key slot.
+
+        """
+        self._entries: Dict[int, SheKeyEntry] = {}
+        for key_id, key in (keys or {}).items():
+            self.load_key(key_id, key)
+
+    def load_key(
+        self,
+        key_id: Union[KeySlots, int],
+        key: HexType,
+        flags: Optional[SecurityFlags] = None,
+    ) -> None:
+        """
+        Loads key into key slot.
+
+        Parameters
+        ----------
+        key_id : `Union` [`KeySlots`, `int`]
+            Key slot to load key into.
+
+        key : `HexType`
+            Key value (128bits).
+
+        flags : `SecurityFlags`, optional
+            Flags of key slot. When not given, key usage isn't restricted.
+
+        """
+        entry = SheKeyEntry(key_id, key, flags)
+        self._entries[entry.key_id] = entry
+
+    def entry(self, key_id: Union[KeySlots, int]) -> SheKeyEntry:
+        """
+        Gets key entry stored in key slot.
+
+        Parameters
+        ----------
+        key_id : `Union` [`KeySlots`, `int`]
+            Key slot.
+
+        Returns
+        -------
+        `SheKeyEntry`
+            Stored key entry.
+
+        Raises
+        ------
+        `KeyError`
+            When key slot is empty.
+
+        """
+        if isinstance(key_id, KeySlots):
+            key_id = key_id.value
+        try:
+            return self._entries[key_id]
+        except KeyError:
+            raise KeyError(f"Key slot {key_id} is empty.") from None
+
+    def __getitem__(self, key_id: Union[KeySlots, int]) -> she_bytes:
+        return self.entry(key_id).key
+
+    def __contains__(self, key_id: Union[KeySlots, int]) -> bool:
+        if isinstance(key_id, KeySlots):
+            key_id = key_id.value
+        return key_id in self._entries
+
+    def items(self) -> Tuple[Tuple[int, she_bytes], ...]:
+        """
+        Gets stored keys.
+
+        Returns
+        -------
+        `Tuple` [`Tuple` [`int`, `she_bytes`], ...]
+            Pairs of key slot and key value.
+
+        """
+        return tuple(
+            (key_id, entry.key) for key_id, entry in sorted(self._entries.items())
+        )
@@ -0,0 +1,440 @@
+"""
+Module contains batch generation engine of memory update protocol messages.
+
+"""
+
+__all__ = ["BatchGenerator", "fanout_messages", "generate_fanout", "generate_messages"]
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from Crypto.Cipher import AES
+
+from secure_hardware_extension.constants import SheConstants
+from secure_hardware_extension.crypto import (
+    BLOCK_SIZE,
+    KeyDerivationCache,
+    cmac_many,
+    cmac_subkeys,
+    xor_bytes,
+)
+from secure_hardware_extension.datatypes import (
+    HexType,
+    MemoryUpdateInfo,
+    MemoryUpdateMessageSet,
+    uid_bytes,
+)
+
+_MAX_CIPHERS = 4096
+_thread_contexts = threading.local()
+
+
+class _CipherContext:
+    """
+    Per-thread AES contexts, so cipher objects are never shared between threads.
+
+    """
+
+    def __init__(self, cache: KeyDerivationCache) -> None:
+        self.cache = cache
+        self.enc_c = bytes(SheConstants.KEY_UPDATE_ENC_C)
+        self.mac_c = bytes(SheConstants.KEY_UPDATE_MAC_C)
+        self._ciphers: Dict[bytes, Tuple[object, bytes]] = {}
+
+    def cipher(self, key: bytes) -> Tuple[object, bytes]:
+        """
+        Gets AES-ECB object and CMAC K1 subkey of key.
+
+        Parameters
+        ----------
+        key : `bytes`
+            AES-128 key.
+
+        Returns
+        -------
+        `Tuple` [`object`, `bytes`]
+            Cipher object and CMAC subkey.
+
+        """
+        context = self._ciphers.get(key)
+        if context is None:
+            if len(self._ciphers) >= _MAX_CIPHERS:
+                self._ciphers.clear()
+            context = (AES.new(key, AES.MODE_ECB), cmac_subkeys(key)[0])
+            self._ciphers[key] = context
+        return context
+
+    def cmac(self, key: bytes, message: bytes) -> bytes:
+        """
+        Calculates CMAC of message consisting of whole AES blocks.
+
+        Parameters
+        ----------
+        key : `bytes`
+            AES-128 key.
+
+        message : `bytes`
+            Message to authenticate.
+
+        Returns
+        -------
+        `bytes`
+            CMAC tag.
+
+        """
+        cipher, subkey = self.cipher(key)
+        state = bytes(BLOCK_SIZE)
+        last = len(message) - BLOCK_SIZE
+        for offset in range(0, last, BLOCK_SIZE):
+            state = cipher.encrypt(
+                xor_bytes(state, message[offset : offset + BLOCK_SIZE])
+            )
+        return cipher.encrypt(xor_bytes(xor_bytes(state, message[last:]), subkey))
+
+    def generate(self, update_info: MemoryUpdateInfo) -> MemoryUpdateMessageSet:
+        """
+        Calculates M1-M5 messages of update.
+
+        Parameters
+        ----------
+        update_info : `MemoryUpdateInfo`
+            Update to calculate messages of.
+
+        Returns
+        -------
+        `MemoryUpdateMessageSet`
+            Calculated messages.
+
+        """
+        slots, m2, m4_tail, k2, k4 = self.shared_parts(update_info)
+        m1 = bytes(update_info.uid) + slots
+        m3 = self.cmac(k2, m1 + m2)
+        m4 = m1 + m4_tail
+        m5 = self.cmac(k4, m4)
+        return MemoryUpdateMessageSet(m1, m2, m3, m4, m5)
+
+    def shared_parts(
+        self, update_info: MemoryUpdateInfo
+    ) -> Tuple[bytes, bytes, bytes, bytes, bytes]:
+        """
+        Calculates parts of messages which don't depend on UID.
+
+        Parameters
+        ----------
+        update_info : `MemoryUpdateInfo`
+            Update to calculate messages of, its UID is ignored.
+
+        Returns
+        -------
+        `Tuple` [`bytes`, `bytes`, `bytes`, `bytes`, `bytes`]
+            Key slots byte of M1, M2, encrypted block of M4, K2 and K4.
+
+        """
+        k1 = self.cache.derive(update_info.auth_key, self.enc_c)
+        k2 = self.cache.derive(update_info.auth_key, self.mac_c)
+        k3 = self.cache.derive(update_info.new_key, self.enc_c)
+        k4 = self.cache.derive(update_info.new_key, self.mac_c)
+        counter = (update_info.counter & 0xFFFFFFF) << 100
+        slots = ((update_info.new_key_id << 4) + update_info.auth_key_id).to_bytes(
+            1, byteorder="big"
+        )
+        cipher, _ = self.cipher(k1)
+        first = cipher.encrypt(
+            (counter | (update_info.fid & 0b111111) << 95).to_bytes(
+                BLOCK_SIZE, byteorder="big"
+            )
+        )
+        m2 = first + cipher.encrypt(xor_bytes(update_info.new_key, first))
+        cipher, _ = self.cipher(k3)
+        m4_tail = cipher.encrypt((counter | 1 << 99).to_bytes(BLOCK_SIZE, "big"))
+        return slots, m2, m4_tail, k2, k4
+
+    def fanout(
+        self, update_info: MemoryUpdateInfo, uids: List[bytes]
+    ) -> List[MemoryUpdateMessageSet]:
+        """
+        Calculates M1-M5 messages of the same update of many devices.
+
+        Parameters
+        ----------
+        update_info : `MemoryUpdateInfo`
+            Update to calculate messages of, its UID is ignored.
+
+        uids : `List` [`bytes`]
+            UIDs of devices.
+
+        Returns
+        -------
+        `List` [`MemoryUpdateMessageSet`]
+            Messages in order of UIDs.
+
+        """
+        if not uids:
+            return []
+        slots, m2, m4_tail, k2, k4 = self.shared_parts(update_info)
+        m1s = [uid + slots for uid in uids]
+        m3s = cmac_many(k2, b"".join(m1 + m2 for m1 in m1s), 3 * BLOCK_SIZE)
+        m4s = [m1 + m4_tail for m1 in m1s]
+        m5s = cmac_many(k4, b"".join(m4s), 2 * BLOCK_SIZE)
+        return [
+            MemoryUpdateMessageSet(
+                m1,
+                m2,
+                m3s[offset : offset + BLOCK_SIZE],
+                m4,
+                m5s[offset : offset + BLOCK_SIZE],
+            )
+            for m1, m4, offset in zip(m1s, m4s, range(0, len(m3s), BLOCK_SIZE))
+        ]
+
+
+def _context(cache: KeyDerivationCache) -> _CipherContext:
+    context = getattr(_thread_contexts, "context", None)
+    if context is None or context.cache is not cache:
+        context = _CipherContext(cache)
+        _thread_contexts.context = context
+    return context
+
+
+_default_cache = KeyDerivationCache()
+
+
+def generate_messages(
+    update_infos: Iterable[MemoryUpdateInfo],
+    cache: Optional[KeyDerivationCache] = None,
+) -> List[MemoryUpdateMessageSet]:
+    """
+    Calculates M1-M5 messages of updates in the calling thread.
+
+    The function is picklable, so it may be submitted to process pools as well.
+
+    Parameters
+    ----------
+    update_infos : `Iterable` [`MemoryUpdateInfo`]
+        Updates to calculate messages of.
+
+    cache : `KeyDerivationCache`, optional
+        Cache of derived keys, module-wide cache by default.
+
+    Returns
+    -------
+    `List` [`MemoryUpdateMessageSet`]
+        Messages in order of updates.
+
+    """
+    context = _context(cache if cache is not None else _default_cache)
+    return [context.generate(update_info) for update_info in update_infos]
+
+
+def fanout_messages(
+    update_info: MemoryUpdateInfo,
+    uids: Iterable[HexType],
+    cache: Optional[KeyDerivationCache] = None,
+) -> List[MemoryUpdateMessageSet]:
+    """
+    Calculates M1-M5 messages of the same update pushed to many devices.
+
+    K1-K4, M2 and the encrypted block of M4 are calculated once, so every device
+    costs two CMACs (M3 and M5), calculated for all devices with multi-block AES calls.
+
+    Parameters
+    ----------
+    update_info : `MemoryUpdateInfo`
+        Update shared by devices, its UID is ignored.
+
+    uids : `Iterable` [`HexType`]
+        UIDs of devices (120bits).
+
+    cache : `KeyDerivationCache`, optional
+        Cache of derived keys, module-wide cache by default.
+
+    Returns
+    -------
+    `List` [`MemoryUpdateMessageSet`]
+        Messages in order of UIDs.
+
+    Raises
+    ------
+    `TypeError`
+        When UID has improper type.
+
+    `ValueError`
+        When UID has improper size.
+
+    """
+    context = _context(cache if cache is not None else _default_cache)
+    return context.fanout(update_info, [uid_bytes(uid) for uid in uids])
+
+
+def generate_fanout(
+    update_infos: Iterable[MemoryUpdateInfo],
+    cache: Optional[KeyDerivationCache] = None,
+) -> List[MemoryUpdateMessageSet]:
+    """
+    Calculates M1-M5 messages of updates, detecting updates which differ only by UID.
+
+    Updates sharing keys, key slots, counter and flags are calculated together as in
+    `fanout_messages`, other updates as in `generate_messages`.
+
+    Parameters
+    ----------
+    update_infos : `Iterable` [`MemoryUpdateInfo`]
+        Updates to calculate messages of.
+
+    cache : `KeyDerivationCache`, optional
+        Cache of derived keys, module-wide cache by default.
+
+    Returns
+    -------
+    `List` [`MemoryUpdateMessageSet`]
+        Messages in order of updates.
+
+    """
+    context = _context(cache if cache is not None else _default_cache)
+    groups: Dict[tuple, Tuple[MemoryUpdateInfo, List[int]]] = {}
+    update_infos = list(update_infos)
+    for index, update_info in enumerate(update_infos):
+        shared = (
+            bytes(update_info.new_key),
+            bytes(update_info.auth_key),
+            update_info.new_key_id,
+            update_info.auth_key_id,
+            update_info.counter,
+            update_info.fid,
+        )
+        groups.setdefault(shared, (update_info, []))[1].append(index)
+    messages: List[Optional[MemoryUpdateMessageSet]] = [None] * len(update_infos)
+    for update_info, indices in groups.values():
+        if len(indices) == 1:
+            messages[indices[0]] = context.generate(update_info)
+            continue
+        group_messages = context.fanout(
+            update_info, [bytes(update_infos[index].uid) for index in indices]
+        )
+        for index, message_set in zip(indices, group_messages):
+            messages[index] = message_set
+    return messages
+
+
+class BatchGenerator:
+    """
+    Class generates memory update messages on a thread pool.
+
+    Updates are split into chunks processed by worker threads with their own cipher
+    contexts, while derived keys are shared through a thread-safe `KeyDerivationCache`.
+    AES and CMAC run in C, so threads scale with cores on free-threaded builds and
+    avoid inter-process communication overhead of process pools.
+
+    Examples
+    --------
+    >>> with BatchGenerator(workers=4) as generator:
+    ...     for messages in generator.generate(update_infos):
+    ...         send(messages.m1, messages.m2, messages.m3)
+
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        chunk_size: int = 256,
+        cache: Optional[KeyDerivationCache] = None,
+    ) -> None:
+        """
+        Initializes generator.
+
+        Parameters
+        ----------
+        workers : `int`
+            Number of worker threads.
+
+        chunk_size : `int`
+            Number of updates processed by worker at once.
+
+        cache : `KeyDerivationCache`, optional
+            Cache of derived keys shared by workers.
+
+        Raises
+        ------
+        `ValueError`
+            When number of workers or chunk size isn't positive.
+
+        """
+        if workers < 1:
+            raise ValueError(f"workers shall be at least 1. Value given: {workers}.")
+        if chunk_size < 1:
+            raise ValueError(
+                f"chunk_size shall be at least 1. Value given: {chunk_size}."
+            )
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.cache = cache if cache is not None else KeyDerivationCache()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self) -> "BatchGenerator":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shuts down worker threads.
+
+        """
+        self._executor.shutdown()
+
+    def generate(
+        self, update_infos: Iterable[MemoryUpdateInfo]
+    ) -> Iterator[MemoryUpdateMessageSet]:
+        """
+        Calculates M1-M5 messages of updates.
+
+        At most two chunks per worker are in flight, so memory use is bounded for
+        arbitrarily long iterables.
+
+        Parameters
+        ----------
+        update_infos : `Iterable` [`MemoryUpdateInfo`]
+            Updates to calculate messages of.
+
+        Yields
+        ------
+        `MemoryUpdateMessageSet`
+            Messages in order of updates.
+
+        """
+        update_infos = iter(update_infos)
+        pending: Deque = deque()
+        while True:
+            while len(pending) < 2 * self.workers:
+                chunk = list(islice(update_infos, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(
+                    self._executor.submit(generate_messages, chunk, self.cache)
+                )
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+    def generate_all(
+        self, update_infos: Iterable[MemoryUpdateInfo]
+    ) -> List[MemoryUpdateMessageSet]:
+        """
+        Calculates M1-M5 messages of updates.
+
+        Parameters
+        ----------
+        update_infos : `Iterable` [`MemoryUpdateInfo`]
+            Updates to calculate messages of.
+
+        Returns
+        -------
+        `List` [`MemoryUpdateMessageSet`]
+            Messages in order of updates.
+
+        """
+        return list(self.generate(update_infos))
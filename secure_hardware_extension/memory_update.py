@@ -3,17 +3,215 @@ Module contains Secure Hardware Extesion memory update protocol
 
 """
 
-__all__ = ["MemoryUpdateProtocol"]
+__all__ = [
+    "MemoryUpdateProtocol",
+    "MemoryUpdateView",
+    "decode_m2_headers",
+    "unpack_m2_header",
+    "unpack_m4_counter",
+]
 
-from typing import Union
+from functools import cached_property
+from typing import Iterable, List, Optional, Tuple, Union
 
 from Crypto.Cipher import AES
 from Crypto.Hash import CMAC
 
 from secure_hardware_extension.constants import SheConstants
-from secure_hardware_extension.datatypes import (MemoryUpdateInfo,
-                                               MemoryUpdateMessages,
-                                               SecurityFlags, she_bytes)
+from secure_hardware_extension.crypto import (
+    BLOCK_SIZE,
+    KeyDerivationCache,
+    compress,
+    xor_bytes,
+)
+from secure_hardware_extension.datatypes import (
+    MemoryUpdateInfo,
+    MemoryUpdateMessages,
+    SecurityFlags,
+    she_bytes,
+)
+
+_M4_PADDING = 1 << 99
+_M4_PADDING_MASK = (1 << 100) - 1
+_COUNTER_SHIFT = 100
+_FID_SHIFT = 95
+_FID_MASK = 0b11111
+
+
+def unpack_m2_header(block: bytes) -> Tuple[int, int]:
+    """
+    Parses decrypted first M2 block ``CID (28 bits) | FID (5 bits) | 0...0 (95 bits)``.
+
+    Parameters
+    ----------
+    block : `bytes`
+        Decrypted first block of M2 message.
+
+    Returns
+    -------
+    `Tuple` [`int`, `int`]
+        Counter and fid.
+
+    """
+    value = int.from_bytes(block, byteorder="big")
+    return value >> _COUNTER_SHIFT, (value >> _FID_SHIFT) & _FID_MASK
+
+
+def unpack_m4_counter(block: bytes) -> Optional[int]:
+    """
+    Parses decrypted M4 block ``CID (28 bits) | 1 | 0...0 (99 bits)``.
+
+    Parameters
+    ----------
+    block : `bytes`
+        Decrypted second block of M4 message.
+
+    Returns
+    -------
+    `int`, optional
+        Counter, or None when padding doesn't match (e.g. block decrypted with wrong key).
+
+    """
+    value = int.from_bytes(block, byteorder="big")
+    if value & _M4_PADDING_MASK != _M4_PADDING:
+        return None
+    return value >> _COUNTER_SHIFT
+
+
+def _derive(key: bytes, constant: bytes, cache: Optional[KeyDerivationCache]) -> bytes:
+    if cache is None:
+        return compress(key, constant)
+    return cache.derive(key, constant)
+
+
+def decode_m2_headers(
+    auth_key: bytes,
+    m2s: Iterable[bytes],
+    cache: Optional[KeyDerivationCache] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Decodes counters and fids of many M2 messages authenticated by the same key.
+
+    Under CBC with zero IV the first M2 block decrypts on its own, so first blocks of
+    all messages are decrypted with a single AES-ECB call and the new keys are never
+    decrypted.
+
+    Parameters
+    ----------
+    auth_key : `bytes`
+        Key used for authentication of messages.
+
+    m2s : `Iterable` [`bytes`]
+        M2 messages.
+
+    cache : `KeyDerivationCache`, optional
+        Cache of derived keys.
+
+    Returns
+    -------
+    `List` [`Tuple` [`int`, `int`]]
+        Counter and fid of every message, in order of messages.
+
+    """
+    k1 = _derive(bytes(auth_key), SheConstants.KEY_UPDATE_ENC_C, cache)
+    plain = AES.new(k1, AES.MODE_ECB).decrypt(
+        b"".join(bytes(m2[:BLOCK_SIZE]) for m2 in m2s)
+    )
+    return [
+        unpack_m2_header(plain[offset : offset + BLOCK_SIZE])
+        for offset in range(0, len(plain), BLOCK_SIZE)
+    ]
+
+
+class MemoryUpdateView:
+    """
+    Class decodes fields of captured M1 and M2 messages lazily, on first access.
+
+    Fields of M1 need no AES at all, counter and fid need a single block decryption
+    and new key needs another one, so scans reading only some fields do only as much
+    work as those fields require.
+
+    Examples
+    --------
+    >>> view = MemoryUpdateView(messages)
+    >>> view.uid, view.new_key_id  # No AES
+    >>> view.counter  # K1 derivation and single block decryption
+
+    """
+
+    def __init__(
+        self,
+        update_messages: MemoryUpdateMessages,
+        cache: Optional[KeyDerivationCache] = None,
+    ) -> None:
+        """
+        Initializes view of messages.
+
+        Parameters
+        ----------
+        update_messages : `MemoryUpdateMessages`
+            Messages to decode.
+
+        cache : `KeyDerivationCache`, optional
+            Cache of derived keys, may be shared between views.
+
+        """
+        self.messages = update_messages
+        self.cache = cache
+
+    @cached_property
+    def uid(self) -> she_bytes:
+        return she_bytes(self.messages.M1[:15])
+
+    @cached_property
+    def new_key_id(self) -> int:
+        return self.messages.M1[15] >> 4
+
+    @cached_property
+    def auth_key_id(self) -> int:
+        return self.messages.M1[15] & 0b1111
+
+    @cached_property
+    def _cipher(self):
+        k1 = _derive(self.messages.auth_key, SheConstants.KEY_UPDATE_ENC_C, self.cache)
+        return AES.new(k1, AES.MODE_ECB)
+
+    @cached_property
+    def _header(self) -> Tuple[int, int]:
+        return unpack_m2_header(self._cipher.decrypt(self.messages.M2[:BLOCK_SIZE]))
+
+    @property
+    def counter(self) -> int:
+        return self._header[0]
+
+    @property
+    def fid(self) -> int:
+        return self._header[1]
+
+    @property
+    def flags(self) -> SecurityFlags:
+        return SecurityFlags(fid=self.fid)
+
+    @cached_property
+    def new_key(self) -> she_bytes:
+        return she_bytes(
+            xor_bytes(
+                self._cipher.decrypt(self.messages.M2[BLOCK_SIZE:]),
+                self.messages.M2[:BLOCK_SIZE],
+            )
+        )
+
+    @cached_property
+    def update_info(self) -> MemoryUpdateInfo:
+        return MemoryUpdateInfo(
+            new_key=self.new_key,
+            auth_key=self.messages.auth_key,
+            new_key_id=self.new_key_id,
+            auth_key_id=self.auth_key_id,
+            counter=self.counter,
+            uid=self.uid,
+            flags=self.flags,
+        )
 
 
 class MemoryUpdateProtocol:
@@ -22,7 +220,11 @@ class MemoryUpdateProtocol:
 
     """
 
-    def __init__(self, update: Union[MemoryUpdateInfo, MemoryUpdateMessages]) -> None:
+    def __init__(
+        self,
+        update: Union[MemoryUpdateInfo, MemoryUpdateMessages],
+        cache: Optional[KeyDerivationCache] = None,
+    ) -> None:
         """
         Initializes update info by using arguments.
 
@@ -31,12 +233,16 @@ class MemoryUpdateProtocol:
         update : `Union` [`MemoryUpdateInfo`, `MemoryUpdateMessages`]
             Information necessary to create object and fill required update info attributes.
 
+        cache : `KeyDerivationCache`, optional
+            Thread-safe cache of derived keys, may be shared between protocol objects.
+
         Raises
         ------
         `TypeError`
             When argument type doesn't match.
 
         """
+        self.cache = cache
         if isinstance(update, MemoryUpdateMessages):
             self.update_info = self._decrypt_using_messages(update)
         elif isinstance(update, MemoryUpdateInfo):
@@ -62,12 +268,7 @@ class MemoryUpdateProtocol:
             Compressed messages.
 
         """
-        key = she_bytes.fromhex("00" * 16)
-        for message in args:
-            aes_result = AES.new(key, AES.MODE_ECB).encrypt(message)
-            key = key ^ aes_result
-            key = key ^ message
-        return key
+        return she_bytes(compress(*args))
 
     def _decrypt_using_messages(
         self, update_messages: MemoryUpdateMessages
@@ -86,45 +287,45 @@ class MemoryUpdateProtocol:
             Parsed memory update info.
 
         """
-        uid = she_bytes(update_messages.M1[:15])
-        auth_key_id = update_messages.M1[15] & 0b1111
-        new_key_id = (update_messages.M1[15] & 0b11110000) >> 4
-        k1 = self._compress(update_messages.auth_key, SheConstants.KEY_UPDATE_ENC_C)
-        m2_plain = AES.new(k1, AES.MODE_CBC, iv=bytes.fromhex("00" * 16)).decrypt(
-            update_messages.M2
-        )
-        counter = (
-            int.from_bytes(m2_plain[:3], byteorder="big") + (m2_plain[3] & 0b11110000)
-            >> 4
-        )
-        fid = ((m2_plain[3] & 0b1111) << 2) + (m2_plain[4] & 0b11000000 >> 6)
-        flags = SecurityFlags(fid=fid)
-        new_key = m2_plain[16:32]
-        return MemoryUpdateInfo(
-            new_key=new_key,
-            auth_key=update_messages.auth_key,
-            new_key_id=new_key_id,
-            auth_key_id=auth_key_id,
-            counter=counter,
-            uid=uid,
-            flags=flags,
-        )
+        return MemoryUpdateView(update_messages, self.cache).update_info
+
+    def _derive(self, key: she_bytes, constant: she_bytes) -> she_bytes:
+        """
+        Derives key, using cache when available.
+
+        Parameters
+        ----------
+        key : `she_bytes`
+            Key to derive from.
+
+        constant : `she_bytes`
+            Derivation constant.
+
+        Returns
+        -------
+        `she_bytes`
+            Derived key.
+
+        """
+        if self.cache is None:
+            return self._compress(key, constant)
+        return she_bytes(self.cache.derive(key, constant))
 
     @property
     def k1(self):
-        return self._compress(self.update_info.auth_key, SheConstants.KEY_UPDATE_ENC_C)
+        return self._derive(self.update_info.auth_key, SheConstants.KEY_UPDATE_ENC_C)
 
     @property
     def k2(self):
-        return self._compress(self.update_info.auth_key, SheConstants.KEY_UPDATE_MAC_C)
+        return self._derive(self.update_info.auth_key, SheConstants.KEY_UPDATE_MAC_C)
 
     @property
     def k3(self):
-        return self._compress(self.update_info.new_key, SheConstants.KEY_UPDATE_ENC_C)
+        return self._derive(self.update_info.new_key, SheConstants.KEY_UPDATE_ENC_C)
 
     @property
     def k4(self):
-        return self._compress(self.update_info.new_key, SheConstants.KEY_UPDATE_MAC_C)
+        return self._derive(self.update_info.new_key, SheConstants.KEY_UPDATE_MAC_C)
 
     @property
     def m1(self):
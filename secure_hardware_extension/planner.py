@@ -0,0 +1,313 @@
+"""
+Module contains planning of key rotation campaigns.
+
+"""
+
+__all__ = ["CampaignPlan", "CampaignPlanner", "PlanStage", "SlotState", "SlotTarget"]
+
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from secure_hardware_extension.datatypes import (
+    BITS_IN_BYTE,
+    UID_SIZE,
+    HexType,
+    MemoryUpdateInfo,
+    SecurityFlags,
+    SheBytes,
+    SheKeySlot,
+    she_bytes,
+)
+from secure_hardware_extension.key_slots.base import KeySlots
+
+SlotId = Union[KeySlots, int]
+
+
+def _slot_value(slot: SlotId) -> int:
+    return slot.value if isinstance(slot, KeySlots) else slot
+
+
+class SlotTarget:
+    """
+    Class holds desired state of a key slot of a device.
+
+    """
+
+    uid: she_bytes = SheBytes(UID_SIZE * BITS_IN_BYTE)
+    key_id: int = SheKeySlot(4)
+    key: she_bytes = SheBytes(16 * BITS_IN_BYTE)
+
+    def __init__(
+        self,
+        uid: HexType,
+        key_id: SlotId,
+        key: HexType,
+        flags: Optional[SecurityFlags] = None,
+    ) -> None:
+        """
+        Initializes slot target.
+
+        Parameters
+        ----------
+        uid : `HexType`
+            Unique Identification Identifier of device (120bits).
+
+        key_id : `Union` [`KeySlots`, `int`]
+            Key slot to update.
+
+        key : `HexType`
+            Desired key value (128bits).
+
+        flags : `SecurityFlags`, optional
+            Desired flags of key slot, no flags set by default.
+
+        """
+        self.uid = uid
+        self.key_id = key_id
+        self.key = key
+        self.flags = flags if flags is not None else SecurityFlags()
+
+
+class SlotState(NamedTuple):
+    """
+    Current state of a key slot of a device.
+
+    """
+
+    key: bytes
+    counter: int
+
+
+class PlanStage(NamedTuple):
+    """
+    Updates of key slots which may be executed once preceding stages are done.
+
+    """
+
+    slots: Tuple[int, ...]
+    updates: List[MemoryUpdateInfo]
+
+
+class CampaignPlan:
+    """
+    Class holds ordered stages of campaign.
+
+    """
+
+    def __init__(self, stages: List[PlanStage]) -> None:
+        """
+        Initializes plan.
+
+        Parameters
+        ----------
+        stages : `List` [`PlanStage`]
+            Stages in execution order.
+
+        """
+        self.stages = stages
+
+    def __iter__(self) -> Iterator[MemoryUpdateInfo]:
+        for stage in self.stages:
+            yield from stage.updates
+
+    def __len__(self) -> int:
+        return sum(len(stage.updates) for stage in self.stages)
+
+    def groups(self) -> Iterator[Tuple[bytes, bytes, List[MemoryUpdateInfo]]]:
+        """
+        Gets runs of consecutive updates sharing authentication and new key.
+
+        Yields
+        ------
+        `Tuple` [`bytes`, `bytes`, `List` [`MemoryUpdateInfo`]]
+            Authentication key, new key and their updates, in execution order.
+
+        """
+        for stage in self.stages:
+            run: List[MemoryUpdateInfo] = []
+            for update_info in stage.updates:
+                if run and (
+                    update_info.auth_key != run[0].auth_key
+                    or update_info.new_key != run[0].new_key
+                ):
+                    yield bytes(run[0].auth_key), bytes(run[0].new_key), run
+                    run = []
+                run.append(update_info)
+            if run:
+                yield bytes(run[0].auth_key), bytes(run[0].new_key), run
+
+
+class CampaignPlanner:
+    """
+    Class plans execution order of fleet key rotation.
+
+    Key slots are ordered topologically by authentication relationships, so a slot is
+    updated only after the slot authenticating it, e.g. MASTER_ECU_KEY before KEY_n.
+    Slots may authenticate with themselves. Within a stage, updates are sorted by
+    authentication and new key, so derived keys are reused by consecutive updates.
+    Ordering is calculated over slots, while updates are only sorted, so planning
+    scales linearithmically with number of targets.
+
+    Examples
+    --------
+    >>> planner = CampaignPlanner(
+    ...     {
+    ...         AutosarKeySlots.MASTER_ECU_KEY: AutosarKeySlots.MASTER_ECU_KEY,
+    ...         AutosarKeySlots.KEY_1: AutosarKeySlots.MASTER_ECU_KEY,
+    ...     }
+    ... )
+    >>> plan = planner.plan(targets, current_state)
+    >>> for update_info in plan:
+    ...     execute(update_info)
+
+    """
+
+    def __init__(self, auth_slots: Mapping[SlotId, SlotId]) -> None:
+        """
+        Initializes planner.
+
+        Parameters
+        ----------
+        auth_slots : `Mapping` [`Union` [`KeySlots`, `int`], `Union` [`KeySlots`, `int`]]
+            Authentication key slot of every key slot.
+
+        Raises
+        ------
+        `ValueError`
+            When authentication relationships contain cycle other than self
+            authentication.
+
+        """
+        self.auth_slots = {
+            _slot_value(slot): _slot_value(auth_slot)
+            for slot, auth_slot in auth_slots.items()
+        }
+        self.levels = self._levels()
+
+    def _levels(self) -> Dict[int, int]:
+        """
+        Calculates depth of every slot in authentication hierarchy.
+
+        Returns
+        -------
+        `Dict` [`int`, `int`]
+            Level of every slot, slots of lower level are updated first.
+
+        Raises
+        ------
+        `ValueError`
+            When authentication relationships contain cycle.
+
+        """
+        levels: Dict[int, int] = {}
+        for slot in self.auth_slots:
+            path: List[int] = []
+            current = slot
+            while current not in levels:
+                if current in path:
+                    cycle = " -> ".join(str(item) for item in path + [current])
+                    raise ValueError(
+                        f"Authentication relationships contain cycle: {cycle}."
+                    )
+                path.append(current)
+                auth_slot = self.auth_slots.get(current, current)
+                if auth_slot == current:
+                    levels[current] = 0
+                    path.pop()
+                    break
+                current = auth_slot
+            for item in reversed(path):
+                levels[item] = levels[self.auth_slots[item]] + 1
+        return levels
+
+    def plan(
+        self,
+        targets: Iterable[SlotTarget],
+        current_state: Mapping[Tuple[bytes, int], SlotState],
+    ) -> CampaignPlan:
+        """
+        Plans updates of key slots to reach targets.
+
+        Authentication key of an update is the target key of authentication slot when
+        the slot is updated within the campaign, otherwise its current key. Counter of
+        an update is current counter increased by one, or 1 for empty slots.
+
+        Parameters
+        ----------
+        targets : `Iterable` [`SlotTarget`]
+            Desired states of key slots.
+
+        current_state : `Mapping` [`Tuple` [`bytes`, `int`], `SlotState`]
+            Current states of key slots indexed by UID and key slot.
+
+        Returns
+        -------
+        `CampaignPlan`
+            Updates ordered by stages.
+
+        Raises
+        ------
+        `ValueError`
+            When slot has no authentication slot, slot is targeted twice, key of
+            authentication slot is unknown or counter would overflow.
+
+        """
+        desired: Dict[Tuple[bytes, int], SlotTarget] = {}
+        for target in targets:
+            index = (bytes(target.uid), target.key_id)
+            if target.key_id not in self.auth_slots:
+                raise ValueError(
+                    f"No authentication slot defined for slot {target.key_id}."
+                )
+            if index in desired:
+                raise ValueError(
+                    f"Slot {target.key_id} of device {index[0].hex()} is targeted twice."
+                )
+            desired[index] = target
+
+        stages: Dict[int, List[Tuple[bytes, bytes, bytes, int, MemoryUpdateInfo]]] = {}
+        for (uid, key_id), target in desired.items():
+            auth_key_id = self.auth_slots[key_id]
+            auth_index = (uid, auth_key_id)
+            if auth_key_id != key_id and auth_index in desired:
+                auth_key = bytes(desired[auth_index].key)
+            elif auth_index in current_state:
+                auth_key = bytes(current_state[auth_index].key)
+            else:
+                raise ValueError(
+                    f"Key of slot {auth_key_id} of device {uid.hex()} is unknown."
+                )
+            state = current_state.get((uid, key_id))
+            update_info = MemoryUpdateInfo(
+                new_key=target.key,
+                auth_key=auth_key,
+                new_key_id=key_id,
+                auth_key_id=auth_key_id,
+                counter=state.counter + 1 if state is not None else 1,
+                uid=uid,
+                flags=target.flags,
+            )
+            stages.setdefault(self.levels[key_id], []).append(
+                (auth_key, bytes(target.key), uid, key_id, update_info)
+            )
+
+        plan = []
+        for level in sorted(stages):
+            records = stages[level]
+            records.sort(key=lambda record: record[:4])
+            plan.append(
+                PlanStage(
+                    tuple(sorted({record[3] for record in records})),
+                    [record[4] for record in records],
+                )
+            )
+        return CampaignPlan(plan)
@@ -0,0 +1,250 @@
+"""
+Module contains prefetching of memory update messages for end-of-line flashing.
+
+"""
+
+__all__ = ["MessagePrefetcher", "PrefetchMetrics"]
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from secure_hardware_extension.crypto import KeyDerivationCache
+from secure_hardware_extension.datatypes import (
+    HexType,
+    MemoryUpdateInfo,
+    MemoryUpdateMessageSet,
+    uid_bytes,
+)
+from secure_hardware_extension.engine import generate_messages
+
+
+class PrefetchMetrics(NamedTuple):
+    """
+    Snapshot of prefetcher counters.
+
+    """
+
+    hits: int
+    misses: int
+    prefetched: int
+    evicted: int
+    stored: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class MessagePrefetcher:
+    """
+    Class precomputes M1-M5 messages of upcoming devices of a campaign plan.
+
+    Worker threads calculate messages of devices in plan order, ahead of the last
+    served device, into a store of at most ``capacity`` devices. Lookup by UID is
+    a dictionary access; on a miss, messages are calculated synchronously. When a
+    device is served, prefetched entries of devices planned before it are evicted as
+    skipped and workers continue right after it.
+
+    Examples
+    --------
+    >>> with MessagePrefetcher(plan, capacity=256, workers=2) as prefetcher:
+    ...     for uid in line.reported_uids():
+    ...         flash(prefetcher.get(uid))
+    ...     prefetcher.metrics().hit_rate
+
+    """
+
+    def __init__(
+        self,
+        plan: Iterable[MemoryUpdateInfo],
+        capacity: int = 1024,
+        workers: int = 2,
+        chunk_size: int = 16,
+        cache: Optional[KeyDerivationCache] = None,
+    ) -> None:
+        """
+        Initializes prefetcher and starts workers.
+
+        Parameters
+        ----------
+        plan : `Iterable` [`MemoryUpdateInfo`]
+            Updates in planned order, e.g. `CampaignPlan`. Updates of the same device
+            are served together, in plan order.
+
+        capacity : `int`
+            Maximal number of devices with precomputed messages.
+
+        workers : `int`
+            Number of worker threads.
+
+        chunk_size : `int`
+            Maximal number of devices precomputed by worker at once.
+
+        cache : `KeyDerivationCache`, optional
+            Cache of derived keys shared by workers and synchronous fallback.
+
+        Raises
+        ------
+        `ValueError`
+            When capacity, number of workers or chunk size isn't positive.
+
+        """
+        for name, value in (
+            ("capacity", capacity),
+            ("workers", workers),
+            ("chunk_size", chunk_size),
+        ):
+            if value < 1:
+                raise ValueError(f"{name} shall be at least 1. Value given: {value}.")
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.cache = cache if cache is not None else KeyDerivationCache()
+        self._updates: Dict[bytes, List[MemoryUpdateInfo]] = {}
+        for update_info in plan:
+            self._updates.setdefault(bytes(update_info.uid), []).append(update_info)
+        self._order = list(self._updates)
+        self._positions = {uid: position for position, uid in enumerate(self._order)}
+        self._store: "OrderedDict[bytes, List[MemoryUpdateMessageSet]]" = OrderedDict()
+        self._next = 0
+        self._cursor = 0
+        self._in_flight = 0
+        self._closed = False
+        self._hits = self._misses = self._prefetched = self._evicted = 0
+        self._condition = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "MessagePrefetcher":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stops worker threads.
+
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and (
+                    self._next >= len(self._order)
+                    or len(self._store) + self._in_flight >= self.capacity
+                ):
+                    if len(self._store) + self._in_flight >= self.capacity:
+                        self._evict_stale()
+                        if len(self._store) + self._in_flight < self.capacity:
+                            continue
+                    self._condition.wait()
+                if self._closed:
+                    return
+                start = self._next
+                stop = min(
+                    start + self.chunk_size,
+                    len(self._order),
+                    start + self.capacity - len(self._store) - self._in_flight,
+                )
+                self._next = stop
+                self._in_flight += stop - start
+                uids = self._order[start:stop]
+            updates = [
+                update_info for uid in uids for update_info in self._updates[uid]
+            ]
+            messages = iter(generate_messages(updates, self.cache))
+            with self._condition:
+                self._in_flight -= len(uids)
+                for uid in uids:
+                    entry = [next(messages) for _ in self._updates[uid]]
+                    if self._positions[uid] >= self._cursor:
+                        self._store[uid] = entry
+                        self._prefetched += 1
+                self._condition.notify_all()
+
+    def _evict_stale(self) -> None:
+        """
+        Evicts entries of skipped devices stored out of plan order by concurrent
+        workers, which aren't reached by eviction from the front of store.
+
+        """
+        for uid in [uid for uid in self._store if self._positions[uid] < self._cursor]:
+            del self._store[uid]
+            self._evicted += 1
+
+    def get(self, uid: HexType) -> List[MemoryUpdateMessageSet]:
+        """
+        Gets messages of device.
+
+        Parameters
+        ----------
+        uid : `HexType`
+            Unique Identification Identifier of device (120bits).
+
+        Returns
+        -------
+        `List` [`MemoryUpdateMessageSet`]
+            Messages of planned updates of device, in plan order.
+
+        Raises
+        ------
+        `KeyError`
+            When device isn't in plan.
+
+        """
+        uid = uid_bytes(uid)
+        with self._condition:
+            position = self._positions.get(uid)
+            if position is None:
+                raise KeyError(f"Device {uid.hex()} isn't in plan.")
+            entry = self._store.pop(uid, None)
+            if entry is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            if position + 1 > self._cursor:
+                self._cursor = position + 1
+                self._next = max(self._next, self._cursor)
+                while self._store:
+                    oldest = next(iter(self._store))
+                    if self._positions[oldest] >= self._cursor:
+                        break
+                    del self._store[oldest]
+                    self._evicted += 1
+            self._condition.notify_all()
+        if entry is None:
+            entry = generate_messages(self._updates[uid], self.cache)
+        return entry
+
+    def __contains__(self, uid: bytes) -> bool:
+        with self._condition:
+            return bytes(uid) in self._store
+
+    def metrics(self) -> PrefetchMetrics:
+        """
+        Gets snapshot of counters.
+
+        Returns
+        -------
+        `PrefetchMetrics`
+            Hits, misses, prefetched and evicted devices and size of store.
+
+        """
+        with self._condition:
+            return PrefetchMetrics(
+                self._hits,
+                self._misses,
+                self._prefetched,
+                self._evicted,
+                len(self._store),
+            )
@@ -0,0 +1,273 @@
+"""
+Module contains bulk generation of CMD_EXPORT_RAM_KEY message sets.
+
+"""
+
+__all__ = ["RamKeyExportTarget", "RamKeyExporter", "export_update_info"]
+
+import hmac
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from Crypto.Cipher import AES
+
+from secure_hardware_extension.constants import SheConstants
+from secure_hardware_extension.crypto import (
+    BLOCK_SIZE,
+    KeyDerivationCache,
+    cmac_many,
+    xor_bytes,
+)
+from secure_hardware_extension.datatypes import (
+    BITS_IN_BYTE,
+    UID_SIZE,
+    HexType,
+    MemoryUpdateInfo,
+    MemoryUpdateMessageSet,
+    SecurityFlags,
+    SheBytes,
+    SheKeyEntry,
+    she_bytes,
+)
+from secure_hardware_extension.key_slots.autosar import AutosarKeySlots
+
+_KEY_IDS = bytes(
+    [(AutosarKeySlots.RAM_KEY.value << 4) | AutosarKeySlots.SECRET_KEY.value]
+)
+_M4_BLOCK = (1 << 99).to_bytes(BLOCK_SIZE, byteorder="big")
+
+
+class RamKeyExportTarget:
+    """
+    Class holds device the RAM key is exported for.
+
+    """
+
+    uid: she_bytes = SheBytes(UID_SIZE * BITS_IN_BYTE)
+    secret_key: she_bytes = SheBytes(16 * BITS_IN_BYTE)
+
+    def __init__(self, uid: HexType, secret_key: HexType) -> None:
+        """
+        Initializes export target.
+
+        Parameters
+        ----------
+        uid : `HexType`
+            Unique Identification Identifier of device (120bits).
+
+        secret_key : `HexType`
+            SECRET_KEY of device (128bits).
+
+        """
+        self.uid = uid
+        self.secret_key = secret_key
+
+
+def export_update_info(
+    target: RamKeyExportTarget, ram_key: HexType
+) -> MemoryUpdateInfo:
+    """
+    Gets memory update equivalent to RAM key export, i.e. update of RAM_KEY slot
+    authorized by SECRET_KEY with counter and flags set to 0.
+
+    Parameters
+    ----------
+    target : `RamKeyExportTarget`
+        Device the RAM key is exported for.
+
+    ram_key : `HexType`
+        Plain RAM key (128bits).
+
+    Returns
+    -------
+    `MemoryUpdateInfo`
+        Equivalent update, e.g. to be used with `MemoryUpdateProtocol`.
+
+    """
+    return MemoryUpdateInfo(
+        new_key=ram_key,
+        auth_key=target.secret_key,
+        new_key_id=AutosarKeySlots.RAM_KEY,
+        auth_key_id=AutosarKeySlots.SECRET_KEY,
+        counter=0,
+        uid=target.uid,
+        flags=SecurityFlags(),
+    )
+
+
+class RamKeyExporter:
+    """
+    Class generates M1-M5 message sets returned by CMD_EXPORT_RAM_KEY for many devices.
+
+    Counter and flags of export are always 0, so K3, K4 and encrypted part of M4
+    depend only on the RAM key and are calculated once per call, whereas K1, K2 and
+    M2 depend only on SECRET_KEY and are calculated once per distinct SECRET_KEY of
+    a chunk. M3 and M5 are calculated with multi-block CMAC.
+
+    Examples
+    --------
+    >>> exporter = RamKeyExporter()
+    >>> targets = (RamKeyExportTarget(uid, secret_key) for uid, secret_key in devices)
+    >>> for messages in exporter.export(ram_key, targets):
+    ...     send(messages.m1, messages.m2, messages.m3, messages.m4, messages.m5)
+
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 4096,
+        cache: Optional[KeyDerivationCache] = None,
+    ) -> None:
+        """
+        Initializes exporter.
+
+        Parameters
+        ----------
+        chunk_size : `int`
+            Number of targets processed at once.
+
+        cache : `KeyDerivationCache`, optional
+            Cache of derived keys, may be shared with other generators.
+
+        Raises
+        ------
+        `ValueError`
+            When chunk size isn't positive.
+
+        """
+        if chunk_size < 1:
+            raise ValueError(
+                f"chunk_size shall be at least 1. Value given: {chunk_size}."
+            )
+        self.chunk_size = chunk_size
+        self.cache = cache if cache is not None else KeyDerivationCache()
+
+    def export(
+        self, ram_key: HexType, targets: Iterable[RamKeyExportTarget]
+    ) -> Iterator[MemoryUpdateMessageSet]:
+        """
+        Generates export message sets of RAM key.
+
+        Parameters
+        ----------
+        ram_key : `HexType`
+            Plain RAM key (128bits).
+
+        targets : `Iterable` [`RamKeyExportTarget`]
+            Devices to export RAM key for.
+
+        Yields
+        ------
+        `MemoryUpdateMessageSet`
+            Message sets in order of targets.
+
+        """
+        ram_key = SheKeyEntry(AutosarKeySlots.RAM_KEY, ram_key).key
+        k3 = self.cache.derive(ram_key, SheConstants.KEY_UPDATE_ENC_C)
+        k4 = self.cache.derive(ram_key, SheConstants.KEY_UPDATE_MAC_C)
+        m4_tail = AES.new(k3, AES.MODE_ECB).encrypt(_M4_BLOCK)
+        targets = iter(targets)
+        while True:
+            chunk = list(islice(targets, self.chunk_size))
+            if not chunk:
+                return
+            yield from self._export_chunk(ram_key, k4, m4_tail, chunk)
+
+    def check(
+        self,
+        ram_key: HexType,
+        records: Iterable[Tuple[RamKeyExportTarget, MemoryUpdateMessageSet]],
+    ) -> Iterator[bool]:
+        """
+        Checks export message sets of RAM key against regenerated ones.
+
+        Parameters
+        ----------
+        ram_key : `HexType`
+            Plain RAM key (128bits).
+
+        records : `Iterable` [`Tuple` [`RamKeyExportTarget`, `MemoryUpdateMessageSet`]]
+            Devices and their message sets to check.
+
+        Yields
+        ------
+        `bool`
+            Whether all five messages match, in order of records.
+
+        """
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return
+            expected = self.export(ram_key, (target for target, _ in chunk))
+            for reference, (_, messages) in zip(expected, chunk):
+                yield all(
+                    hmac.compare_digest(bytes(received), bytes(calculated))
+                    for received, calculated in zip(messages, reference)
+                )
+
+    def _export_chunk(
+        self,
+        ram_key: bytes,
+        k4: bytes,
+        m4_tail: bytes,
+        chunk: List[RamKeyExportTarget],
+    ) -> List[MemoryUpdateMessageSet]:
+        """
+        Generates export message sets of chunk of targets.
+
+        Parameters
+        ----------
+        ram_key : `bytes`
+            Plain RAM key.
+
+        k4 : `bytes`
+            Key derived from RAM key with KEY_UPDATE_MAC_C.
+
+        m4_tail : `bytes`
+            Encrypted part of M4.
+
+        chunk : `List` [`RamKeyExportTarget`]
+            Targets to generate message sets for.
+
+        Returns
+        -------
+        `List` [`MemoryUpdateMessageSet`]
+            Message sets in order of targets.
+
+        """
+        m1s = [bytes(target.uid) + _KEY_IDS for target in chunk]
+        m4s = b"".join(m1 + m4_tail for m1 in m1s)
+        m5s = cmac_many(k4, m4s, 2 * BLOCK_SIZE)
+
+        groups: Dict[bytes, List[int]] = {}
+        for position, target in enumerate(chunk):
+            groups.setdefault(bytes(target.secret_key), []).append(position)
+        m2s: List[bytes] = [b""] * len(chunk)
+        m3s: List[bytes] = [b""] * len(chunk)
+        for secret_key, positions in groups.items():
+            k1 = self.cache.derive(secret_key, SheConstants.KEY_UPDATE_ENC_C)
+            k2 = self.cache.derive(secret_key, SheConstants.KEY_UPDATE_MAC_C)
+            cipher = AES.new(k1, AES.MODE_ECB)
+            first = cipher.encrypt(bytes(BLOCK_SIZE))
+            m2 = first + cipher.encrypt(xor_bytes(ram_key, first))
+            m3 = cmac_many(
+                k2,
+                b"".join(m1s[position] + m2 for position in positions),
+                3 * BLOCK_SIZE,
+            )
+            for number, position in enumerate(positions):
+                m2s[position] = m2
+                m3s[position] = m3[number * BLOCK_SIZE : (number + 1) * BLOCK_SIZE]
+
+        return [
+            MemoryUpdateMessageSet(
+                m1,
+                m2s[position],
+                m3s[position],
+                m4s[2 * BLOCK_SIZE * position : 2 * BLOCK_SIZE * (position + 1)],
+                m5s[BLOCK_SIZE * position : BLOCK_SIZE * (position + 1)],
+            )
+            for position, m1 in enumerate(m1s)
+        ]
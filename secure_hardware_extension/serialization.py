@@ -0,0 +1,133 @@
+"""
+Module contains compact binary encoding of memory update datatypes.
+
+"""
+
+__all__ = [
+    "MESSAGE_SET_SIZE",
+    "UPDATE_INFO_SIZE",
+    "pack_message_set",
+    "pack_update_info",
+    "unpack_message_set",
+    "unpack_update_info",
+]
+
+import struct
+
+from secure_hardware_extension.datatypes import (
+    MemoryUpdateInfo,
+    MemoryUpdateMessageSet,
+    SecurityFlags,
+)
+
+_UPDATE_INFO = struct.Struct(">16s16sBI15sB")
+_MESSAGE_SET = struct.Struct(">16s32s16s32s16s")
+
+UPDATE_INFO_SIZE = _UPDATE_INFO.size
+MESSAGE_SET_SIZE = _MESSAGE_SET.size
+
+
+def pack_update_info(update_info: MemoryUpdateInfo) -> bytes:
+    """
+    Encodes update info as ``NEW_KEY | AUTH_KEY | ID | AUTH_ID | COUNTER | UID | FID``.
+
+    Parameters
+    ----------
+    update_info : `MemoryUpdateInfo`
+        Update to encode.
+
+    Returns
+    -------
+    `bytes`
+        Encoded update of `UPDATE_INFO_SIZE` bytes.
+
+    """
+    return _UPDATE_INFO.pack(
+        update_info.new_key,
+        update_info.auth_key,
+        (update_info.new_key_id << 4) | update_info.auth_key_id,
+        update_info.counter,
+        update_info.uid,
+        update_info.fid,
+    )
+
+
+def unpack_update_info(data: bytes) -> MemoryUpdateInfo:
+    """
+    Decodes update info encoded by `pack_update_info`.
+
+    Parameters
+    ----------
+    data : `bytes`
+        Encoded update of `UPDATE_INFO_SIZE` bytes.
+
+    Returns
+    -------
+    `MemoryUpdateInfo`
+        Decoded update.
+
+    Raises
+    ------
+    `ValueError`
+        When data has improper size or fields are out of range.
+
+    """
+    if len(data) != UPDATE_INFO_SIZE:
+        raise ValueError(
+            f"Encoded update info shall have {UPDATE_INFO_SIZE} bytes. Size given: {len(data)}."
+        )
+    new_key, auth_key, key_ids, counter, uid, fid = _UPDATE_INFO.unpack(data)
+    return MemoryUpdateInfo(
+        new_key=new_key,
+        auth_key=auth_key,
+        new_key_id=key_ids >> 4,
+        auth_key_id=key_ids & 0b1111,
+        counter=counter,
+        uid=uid,
+        flags=SecurityFlags(fid=fid),
+    )
+
+
+def pack_message_set(messages: MemoryUpdateMessageSet) -> bytes:
+    """
+    Encodes messages as ``M1 | M2 | M3 | M4 | M5``.
+
+    Parameters
+    ----------
+    messages : `MemoryUpdateMessageSet`
+        Messages to encode.
+
+    Returns
+    -------
+    `bytes`
+        Encoded messages of `MESSAGE_SET_SIZE` bytes.
+
+    """
+    return _MESSAGE_SET.pack(*(bytes(message) for message in messages))
+
+
+def unpack_message_set(data: bytes) -> MemoryUpdateMessageSet:
+    """
+    Decodes messages encoded by `pack_message_set`.
+
+    Parameters
+    ----------
+    data : `bytes`
+        Encoded messages of `MESSAGE_SET_SIZE` bytes.
+
+    Returns
+    -------
+    `MemoryUpdateMessageSet`
+        Decoded messages.
+
+    Raises
+    ------
+    `ValueError`
+        When data has improper size.
+
+    """
+    if len(data) != MESSAGE_SET_SIZE:
+        raise ValueError(
+            f"Encoded messages shall have {MESSAGE_SET_SIZE} bytes. Size given: {len(data)}."
+        )
+    return MemoryUpdateMessageSet(*_MESSAGE_SET.unpack(data))
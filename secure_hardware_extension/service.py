@@ -0,0 +1,698 @@
+"""
+Module contains long-running local provisioning service exposing generation, decoding
+and verification of memory update messages over a Unix domain socket or local TCP.
+
+Frames are big endian: ``LENGTH (4) | CODE (1) | REQUEST_ID (4) | PAYLOAD (LENGTH)``,
+where CODE is `Opcode` in requests and `Status` in responses. Requests may be
+pipelined; responses carry the request id and may arrive out of order.
+
+"""
+
+__all__ = [
+    "MicroBatcher",
+    "Opcode",
+    "ProvisioningClient",
+    "ProvisioningService",
+    "ServiceMetrics",
+    "Status",
+]
+
+import asyncio
+import itertools
+import json
+import struct
+from collections import deque
+from enum import IntEnum
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from secure_hardware_extension.crypto import KeyDerivationCache
+from secure_hardware_extension.datatypes import (
+    MemoryUpdateInfo,
+    MemoryUpdateMessages,
+    MemoryUpdateMessageSet,
+)
+from secure_hardware_extension.engine import BatchGenerator
+from secure_hardware_extension.memory_update import MemoryUpdateProtocol
+from secure_hardware_extension.serialization import (
+    UPDATE_INFO_SIZE,
+    pack_message_set,
+    pack_update_info,
+    unpack_message_set,
+    unpack_update_info,
+)
+from secure_hardware_extension.verification import ResponseVerifier
+
+_HEADER = struct.Struct(">IBI")
+_DECODE_SIZE = 16 + 16 + 32
+_VERIFY_SIZE = UPDATE_INFO_SIZE + 32 + 16
+MAX_PAYLOAD_SIZE = 1024 * 1024
+
+
+class Opcode(IntEnum):
+    """
+    Enum holds request codes of provisioning service.
+
+    """
+
+    GENERATE = 0x01
+    DECODE = 0x02
+    VERIFY = 0x03
+    METRICS = 0x04
+
+
+class Status(IntEnum):
+    """
+    Enum holds response codes of provisioning service.
+
+    """
+
+    OK = 0x00
+    ERROR = 0x01
+
+
+class ServiceMetrics:
+    """
+    Class collects latency samples, queue depth and batch sizes of service.
+
+    """
+
+    def __init__(self, samples: int = 10000) -> None:
+        """
+        Initializes metrics.
+
+        Parameters
+        ----------
+        samples : `int`
+            Number of the most recent latency samples kept per operation.
+
+        """
+        self._latencies: Dict[str, Deque[float]] = {
+            opcode.name: deque(maxlen=samples) for opcode in Opcode
+        }
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.queue_depth: Callable[[], int] = lambda: 0
+
+    def record_latency(self, opcode: Opcode, latency: float) -> None:
+        self.requests += 1
+        self._latencies[opcode.name].append(latency)
+
+    def record_batch(self, size: int) -> None:
+        self.batches += 1
+        self.batched_requests += size
+
+    @staticmethod
+    def _percentile(samples: List[float], percent: float) -> float:
+        index = min(len(samples) - 1, max(0, round(percent / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Gets current values of metrics.
+
+        Returns
+        -------
+        `Dict` [`str`, `Any`]
+            Request and error counts, latency percentiles in seconds per operation,
+            current queue depth and mean batch size.
+
+        """
+        latencies = {}
+        for name, samples in self._latencies.items():
+            if samples:
+                ordered = sorted(samples)
+                latencies[name] = {
+                    f"p{percent}": self._percentile(ordered, percent)
+                    for percent in (50, 90, 99)
+                }
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "queue_depth": self.queue_depth(),
+            "batches": self.batches,
+            "mean_batch_size": (
+                self.batched_requests / self.batches if self.batches else 0.0
+            ),
+            "latency": latencies,
+        }
+
+
+class MicroBatcher:
+    """
+    Class coalesces concurrently submitted items into batches processed in a thread.
+
+    A batch is closed when it reaches ``max_batch`` items or ``max_wait`` seconds
+    passed since its first item arrived. When processing of a batch fails, its items are
+    processed one by one, so a single malformed request fails alone.
+
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Any]], List[Any]],
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        metrics: Optional[ServiceMetrics] = None,
+    ) -> None:
+        """
+        Initializes batcher.
+
+        Parameters
+        ----------
+        process : `Callable` [[`List` [`Any`]], `List` [`Any`]]
+            Function processing a batch of items, returning results in order of items.
+
+        max_batch : `int`
+            Maximal number of items in batch.
+
+        max_wait : `float`
+            Maximal time in seconds the first item of batch waits for others.
+
+        metrics : `ServiceMetrics`, optional
+            Metrics to record batch sizes in.
+
+        Raises
+        ------
+        `ValueError`
+            When batch size or wait time is improper.
+
+        """
+        if max_batch < 1:
+            raise ValueError(
+                f"max_batch shall be at least 1. Value given: {max_batch}."
+            )
+        if max_wait < 0:
+            raise ValueError(
+                f"max_wait shall not be negative. Value given: {max_wait}."
+            )
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = metrics
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight = 0
+
+    @property
+    def depth(self) -> int:
+        """
+        Number of items waiting for or under processing.
+
+        """
+        return (self._queue.qsize() if self._queue else 0) + self._in_flight
+
+    def start(self) -> None:
+        """
+        Starts batching task in running event loop.
+
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        Cancels batching task.
+
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Submits item and waits for its result.
+
+        Parameters
+        ----------
+        item : `Any`
+            Item to process.
+
+        Returns
+        -------
+        `Any`
+            Result of processing.
+
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_event_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _process_isolated(self, items: List[Any]) -> List[Tuple[bool, Any]]:
+        try:
+            return [(True, result) for result in self.process(items)]
+        except Exception:
+            if len(items) == 1:
+                raise
+        results = []
+        for item in items:
+            try:
+                results.append((True, self.process([item])[0]))
+            except Exception as error:
+                results.append((False, error))
+        return results
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._collect()
+            self._in_flight = len(batch)
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    None, self._process_isolated, items
+                )
+            except Exception as error:
+                results = [(False, error)] * len(batch)
+            finally:
+                self._in_flight = 0
+            for (_, future), (success, result) in zip(batch, results):
+                if future.done():
+                    continue
+                if success:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+
+class ProvisioningService:
+    """
+    Class serves memory update operations to local stations and keeps derived keys and
+    cipher contexts warm between requests.
+
+    Concurrent single-ECU requests are coalesced into micro-batches before they are
+    passed to the `BatchGenerator`. Latency percentiles and queue depth are available
+    through `metrics` and the METRICS request.
+
+    Examples
+    --------
+    >>> async with ProvisioningService(path="/run/she.sock") as service:
+    ...     await service.serve_forever()
+
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        workers: int = 4,
+        cache: Optional[KeyDerivationCache] = None,
+    ) -> None:
+        """
+        Initializes service.
+
+        Parameters
+        ----------
+        path : `Union` [`str`, `Path`], optional
+            Unix domain socket path. When not given, service listens on local TCP.
+
+        host : `str`
+            TCP host to listen on.
+
+        port : `int`
+            TCP port to listen on, chosen by system when 0.
+
+        max_batch : `int`
+            Maximal number of requests in micro-batch.
+
+        max_wait : `float`
+            Maximal time in seconds a request waits for others to form a micro-batch.
+
+        workers : `int`
+            Number of threads of batch generation engine.
+
+        cache : `KeyDerivationCache`, optional
+            Cache of derived keys kept warm between requests.
+
+        """
+        self.path = Path(path) if path else None
+        self.host = host
+        self.port = port
+        self.cache = cache if cache is not None else KeyDerivationCache(max_size=65536)
+        self.metrics = ServiceMetrics()
+        self._engine = BatchGenerator(
+            workers=workers, chunk_size=max(1, max_batch // workers), cache=self.cache
+        )
+        self._verifier = ResponseVerifier(cache=self.cache)
+        self._batchers = {
+            Opcode.GENERATE: MicroBatcher(
+                self._generate, max_batch, max_wait, self.metrics
+            ),
+            Opcode.DECODE: MicroBatcher(
+                self._decode, max_batch, max_wait, self.metrics
+            ),
+            Opcode.VERIFY: MicroBatcher(
+                self._verify, max_batch, max_wait, self.metrics
+            ),
+        }
+        self.metrics.queue_depth = lambda: sum(
+            batcher.depth for batcher in self._batchers.values()
+        )
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+
+    async def __aenter__(self) -> "ProvisioningService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    @property
+    def address(self) -> Union[str, Tuple[str, int]]:
+        """
+        Address the service listens on, socket path or (host, port).
+
+        """
+        if self.path is not None:
+            return str(self.path)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self) -> None:
+        """
+        Starts listening and batching tasks.
+
+        """
+        for batcher in self._batchers.values():
+            batcher.start()
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(
+                self._handle, path=str(self.path)
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._handle, host=self.host, port=self.port
+            )
+
+    async def serve_forever(self) -> None:
+        """
+        Serves requests until cancelled.
+
+        """
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """
+        Stops listening, closes connections and shuts down engine.
+
+        """
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        for batcher in self._batchers.values():
+            await batcher.stop()
+        self._engine.close()
+        if self.path is not None and self.path.exists():
+            self.path.unlink()
+
+    def _generate(self, update_infos: List[MemoryUpdateInfo]) -> List[bytes]:
+        return [
+            pack_message_set(messages)
+            for messages in self._engine.generate_all(update_infos)
+        ]
+
+    def _decode(self, messages: List[MemoryUpdateMessages]) -> List[bytes]:
+        return [
+            pack_update_info(MemoryUpdateProtocol(item, cache=self.cache).update_info)
+            for item in messages
+        ]
+
+    def _verify(
+        self, items: List[Tuple[MemoryUpdateInfo, bytes, bytes]]
+    ) -> List[bytes]:
+        return [bytes([result.ok]) for result in self._verifier.verify(items)]
+
+    async def _execute(self, opcode: int, payload: bytes) -> bytes:
+        """
+        Executes request.
+
+        Parameters
+        ----------
+        opcode : `int`
+            Request code.
+
+        payload : `bytes`
+            Request payload.
+
+        Returns
+        -------
+        `bytes`
+            Response payload.
+
+        Raises
+        ------
+        `ValueError`
+            When request is malformed.
+
+        """
+        if opcode == Opcode.GENERATE:
+            item = unpack_update_info(payload)
+        elif opcode == Opcode.DECODE:
+            if len(payload) != _DECODE_SIZE:
+                raise ValueError(f"DECODE payload shall have {_DECODE_SIZE} bytes.")
+            item = MemoryUpdateMessages(
+                auth_key=payload[:16], m1=payload[16:32], m2=payload[32:]
+            )
+        elif opcode == Opcode.VERIFY:
+            if len(payload) != _VERIFY_SIZE:
+                raise ValueError(f"VERIFY payload shall have {_VERIFY_SIZE} bytes.")
+            item = (
+                unpack_update_info(payload[:UPDATE_INFO_SIZE]),
+                payload[UPDATE_INFO_SIZE : UPDATE_INFO_SIZE + 32],
+                payload[UPDATE_INFO_SIZE + 32 :],
+            )
+        elif opcode == Opcode.METRICS:
+            return json.dumps(self.metrics.snapshot()).encode()
+        else:
+            raise ValueError(f"Unknown opcode {opcode}.")
+        return await self._batchers[Opcode(opcode)].submit(item)
+
+    async def _respond(
+        self,
+        opcode: int,
+        request_id: int,
+        payload: bytes,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        try:
+            response = await self._execute(opcode, payload)
+            status = Status.OK
+        except Exception as error:
+            response = str(error).encode()
+            status = Status.ERROR
+            self.metrics.errors += 1
+        if opcode in tuple(Opcode):
+            self.metrics.record_latency(Opcode(opcode), loop.time() - started)
+        if not writer.is_closing():
+            writer.write(_HEADER.pack(len(response), status, request_id) + response)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._connections.add(writer)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_HEADER.size)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                length, opcode, request_id = _HEADER.unpack(header)
+                if length > MAX_PAYLOAD_SIZE:
+                    break
+                payload = await reader.readexactly(length)
+                task = asyncio.ensure_future(
+                    self._respond(opcode, request_id, payload, writer)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                await writer.drain()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._connections.discard(writer)
+            writer.close()
+
+
+class ProvisioningClient:
+    """
+    Class connects stations to `ProvisioningService`.
+
+    Examples
+    --------
+    >>> client = await ProvisioningClient.connect(path="/run/she.sock")
+    >>> messages = await client.generate(update_info)
+    >>> await client.close()
+
+    """
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._reader = reader
+        self._writer = writer
+        self._request_ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(
+        cls,
+        path: Optional[Union[str, Path]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> "ProvisioningClient":
+        """
+        Connects to service.
+
+        Parameters
+        ----------
+        path : `Union` [`str`, `Path`], optional
+            Unix domain socket path. When not given, local TCP is used.
+
+        host : `str`
+            TCP host of service.
+
+        port : `int`
+            TCP port of service.
+
+        Returns
+        -------
+        `ProvisioningClient`
+            Connected client.
+
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(str(path))
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def close(self) -> None:
+        """
+        Closes connection.
+
+        """
+        self._receiver.cancel()
+        self._writer.close()
+        try:
+            await self._receiver
+        except asyncio.CancelledError:
+            pass
+
+    async def _receive(self) -> None:
+        try:
+            while True:
+                header = await self._reader.readexactly(_HEADER.size)
+                length, status, request_id = _HEADER.unpack(header)
+                payload = await self._reader.readexactly(length)
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == Status.OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload.decode()))
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(str(error)))
+            self._pending.clear()
+
+    async def request(self, opcode: Opcode, payload: bytes = b"") -> bytes:
+        """
+        Sends request and waits for its response.
+
+        Parameters
+        ----------
+        opcode : `Opcode`
+            Request code.
+
+        payload : `bytes`
+            Request payload.
+
+        Returns
+        -------
+        `bytes`
+            Response payload.
+
+        Raises
+        ------
+        `RuntimeError`
+            When service responds with error.
+
+        """
+        request_id = next(self._request_ids) & 0xFFFFFFFF
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(_HEADER.pack(len(payload), opcode, request_id) + payload)
+        await self._writer.drain()
+        return await future
+
+    async def generate(self, update_info: MemoryUpdateInfo) -> MemoryUpdateMessageSet:
+        """
+        Generates M1-M5 messages of update.
+
+        """
+        return unpack_message_set(
+            await self.request(Opcode.GENERATE, pack_update_info(update_info))
+        )
+
+    async def decode(self, auth_key: bytes, m1: bytes, m2: bytes) -> MemoryUpdateInfo:
+        """
+        Decodes update info from M1 and M2 messages.
+
+        """
+        return unpack_update_info(
+            await self.request(Opcode.DECODE, bytes(auth_key) + bytes(m1) + bytes(m2))
+        )
+
+    async def verify(self, update_info: MemoryUpdateInfo, m4: bytes, m5: bytes) -> bool:
+        """
+        Verifies M4 and M5 messages returned by ECU against expected update.
+
+        """
+        response = await self.request(
+            Opcode.VERIFY, pack_update_info(update_info) + bytes(m4) + bytes(m5)
+        )
+        return response == b"\x01"
+
+    async def metrics(self) -> Dict[str, Any]:
+        """
+        Gets metrics of service.
+
+        """
+        return json.loads(await self.request(Opcode.METRICS))
@@ -0,0 +1,764 @@
+"""
+Module contains sharded execution of memory update campaigns.
+
+"""
+
+__all__ = [
+    "CampaignResult",
+    "ShardBy",
+    "ShardingCoordinator",
+    "SpoolExecutor",
+    "read_result",
+    "run_shard",
+    "spool_worker",
+]
+
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+from concurrent.futures import Executor, Future, wait
+from enum import Enum
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, MemoryUpdateMessageSet
+from secure_hardware_extension.engine import generate_messages
+from secure_hardware_extension.serialization import (
+    MESSAGE_SET_SIZE,
+    UPDATE_INFO_SIZE,
+    pack_message_set,
+    pack_update_info,
+    unpack_message_set,
+    unpack_update_info,
+)
+
+_INDEX = struct.Struct(">Q")
+_INPUT_RECORD_SIZE = _INDEX.size + UPDATE_INFO_SIZE
+_OUTPUT_RECORD_SIZE = _INDEX.size + MESSAGE_SET_SIZE
+_DIGEST_SIZE = hashlib.sha256().digest_size
+_CAMPAIGN_FILE = "campaign.json"
+_RESULT_FILE = "result.dat"
+_READ_RECORDS = 4096
+
+
+class ShardBy(Enum):
+    """
+    Key of shard assignment.
+
+    """
+
+    UID = "uid"
+    AUTH_KEY = "auth_key"
+
+
+class CampaignResult(NamedTuple):
+    """
+    Merged messages of campaign.
+
+    """
+
+    path: Path
+    count: int
+    sha256: str
+
+
+def _create_private(path: Path) -> BinaryIO:
+    """
+    Creates file for writing, readable and writable by its owner only.
+
+    Parameters
+    ----------
+    path : `Path`
+        Path of file, replaced when existing.
+
+    Returns
+    -------
+    `BinaryIO`
+        File opened for binary writing.
+
+    """
+    path.unlink(missing_ok=True)
+    return open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb")
+
+
+def _write_atomically(path: Path, chunks: Iterable[bytes]) -> str:
+    """
+    Writes chunks followed by their SHA-256 digest and renames file into place.
+
+    Parameters
+    ----------
+    path : `Path`
+        Destination path.
+
+    chunks : `Iterable` [`bytes`]
+        Content to write.
+
+    Returns
+    -------
+    `str`
+        Hex digest of content.
+
+    """
+    digest = hashlib.sha256()
+    temporary = path.with_name(path.name + ".tmp")
+    try:
+        with _create_private(temporary) as file:
+            for chunk in chunks:
+                digest.update(chunk)
+                file.write(chunk)
+            file.write(digest.digest())
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+    os.replace(temporary, path)
+    return digest.hexdigest()
+
+
+def _verify_checksum(path: Path, record_size: int) -> Optional[int]:
+    """
+    Verifies trailing SHA-256 digest of file written by `_write_atomically`.
+
+    Parameters
+    ----------
+    path : `Path`
+        Path of file.
+
+    record_size : `int`
+        Size of records of file.
+
+    Returns
+    -------
+    `int`, optional
+        Number of records, or None when file is missing, truncated or corrupted.
+
+    """
+    try:
+        size = path.stat().st_size - _DIGEST_SIZE
+    except FileNotFoundError:
+        return None
+    if size < 0 or size % record_size:
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        remaining = size
+        while remaining:
+            chunk = file.read(min(remaining, record_size * _READ_RECORDS))
+            digest.update(chunk)
+            remaining -= len(chunk)
+        if file.read() != digest.digest():
+            return None
+    return size // record_size
+
+
+def _records(path: Path, record_size: int, count: int) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        while count:
+            chunk = file.read(record_size * min(count, _READ_RECORDS))
+            for offset in range(0, len(chunk), record_size):
+                yield chunk[offset : offset + record_size]
+            count -= len(chunk) // record_size
+
+
+def run_shard(input_path: Union[str, Path], output_path: Union[str, Path]) -> int:
+    """
+    Generates messages of shard, the unit of work of campaign workers.
+
+    The function is picklable, so it may be submitted to process pools as well.
+
+    Parameters
+    ----------
+    input_path : `Union` [`str`, `Path`]
+        Shard written by `ShardingCoordinator.split`.
+
+    output_path : `Union` [`str`, `Path`]
+        Path of messages of shard, written atomically.
+
+    Returns
+    -------
+    `int`
+        Number of processed updates.
+
+    Raises
+    ------
+    `ValueError`
+        When shard is corrupted.
+
+    """
+    input_path = Path(input_path)
+    count = _verify_checksum(input_path, _INPUT_RECORD_SIZE)
+    if count is None:
+        raise ValueError(f"Shard {input_path} is corrupted.")
+
+    def output() -> Iterator[bytes]:
+        records = _records(input_path, _INPUT_RECORD_SIZE, count)
+        while True:
+            chunk = [record for _, record in zip(range(_READ_RECORDS), records)]
+            if not chunk:
+                return
+            updates = [unpack_update_info(record[_INDEX.size :]) for record in chunk]
+            for record, messages in zip(chunk, generate_messages(updates)):
+                yield record[: _INDEX.size] + pack_message_set(messages)
+
+    _write_atomically(Path(output_path), output())
+    return count
+
+
+def read_result(path: Union[str, Path]) -> Iterator[MemoryUpdateMessageSet]:
+    """
+    Reads merged messages of campaign.
+
+    Parameters
+    ----------
+    path : `Union` [`str`, `Path`]
+        Path of result written by `ShardingCoordinator.merge`.
+
+    Yields
+    ------
+    `MemoryUpdateMessageSet`
+        Messages in order of manifest.
+
+    Raises
+    ------
+    `ValueError`
+        When result is corrupted.
+
+    """
+    path = Path(path)
+    count = _verify_checksum(path, MESSAGE_SET_SIZE)
+    if count is None:
+        raise ValueError(f"Result {path} is corrupted.")
+    for record in _records(path, MESSAGE_SET_SIZE, count):
+        yield unpack_message_set(record)
+
+
+class ShardingCoordinator:
+    """
+    Class splits campaign manifest into shards, runs them on workers and merges results.
+
+    Updates are assigned to shards by BLAKE2b hash of UID or authentication key, so
+    assignment is deterministic and sharding by authentication key keeps derived key
+    caches of workers effective. Shards and their outputs are checksummed files in
+    campaign directory, so workers may be local processes or remote hosts, e.g. by
+    `SpoolExecutor`. Shards with valid outputs are never run again, so failed shards
+    are retried without regenerating the whole campaign.
+
+    Shard files hold new and authentication keys in plaintext, so the campaign directory
+    shall be kept as confidential as the keys themselves. Files are created readable
+    and writable by their owner only.
+
+    Examples
+    --------
+    >>> coordinator = ShardingCoordinator("campaign", shards=16, shard_by=ShardBy.AUTH_KEY)
+    >>> coordinator.split(update_infos)
+    >>> with ProcessPoolExecutor() as executor:
+    ...     coordinator.run(executor, retries=2)
+    >>> result = coordinator.merge()
+    >>> result.sha256
+
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        shards: int = 8,
+        shard_by: ShardBy = ShardBy.UID,
+    ) -> None:
+        """
+        Initializes coordinator. Settings of already split campaign are read from its
+        directory.
+
+        Parameters
+        ----------
+        directory : `Union` [`str`, `Path`]
+            Campaign directory, created when missing.
+
+        shards : `int`
+            Number of shards.
+
+        shard_by : `ShardBy`
+            Key of shard assignment.
+
+        Raises
+        ------
+        `ValueError`
+            When number of shards isn't positive.
+
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        campaign = self.directory / _CAMPAIGN_FILE
+        self.count: Optional[int] = None
+        if campaign.exists():
+            settings = json.loads(campaign.read_text())
+            shards = settings["shards"]
+            shard_by = ShardBy(settings["shard_by"])
+            self.count = settings["count"]
+        if shards < 1:
+            raise ValueError(f"shards shall be at least 1. Value given: {shards}.")
+        self.shards = shards
+        self.shard_by = shard_by
+        self.failures: Dict[int, BaseException] = {}
+
+    def input_path(self, shard: int) -> Path:
+        return self.directory / f"shard-{shard:04d}.in"
+
+    def output_path(self, shard: int) -> Path:
+        return self.directory / f"shard-{shard:04d}.out"
+
+    def shard_of(self, update_info: MemoryUpdateInfo) -> int:
+        """
+        Gets shard of update.
+
+        Parameters
+        ----------
+        update_info : `MemoryUpdateInfo`
+            Update to assign.
+
+        Returns
+        -------
+        `int`
+            Shard number.
+
+        """
+        if self.shard_by is ShardBy.UID:
+            key = bytes(update_info.uid)
+        else:
+            key = bytes(update_info.auth_key)
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return int.from_bytes(digest, byteorder="big") % self.shards
+
+    def split(self, manifest: Iterable[MemoryUpdateInfo]) -> int:
+        """
+        Writes shards of manifest, removing outputs of previous split.
+
+        Parameters
+        ----------
+        manifest : `Iterable` [`MemoryUpdateInfo`]
+            Updates of campaign.
+
+        Returns
+        -------
+        `int`
+            Number of updates.
+
+        """
+        for shard in range(self.shards):
+            self.output_path(shard).unlink(missing_ok=True)
+        files: List[BinaryIO] = []
+        digests = [hashlib.sha256() for _ in range(self.shards)]
+        count = 0
+        try:
+            for shard in range(self.shards):
+                files.append(_create_private(self.input_path(shard)))
+            for count, update_info in enumerate(manifest, start=1):
+                shard = self.shard_of(update_info)
+                record = _INDEX.pack(count - 1) + pack_update_info(update_info)
+                digests[shard].update(record)
+                files[shard].write(record)
+            for file, digest in zip(files, digests):
+                file.write(digest.digest())
+        finally:
+            for file in files:
+                file.close()
+        self.count = count
+        settings = {
+            "shards": self.shards,
+            "shard_by": self.shard_by.value,
+            "count": count,
+        }
+        (self.directory / _CAMPAIGN_FILE).write_text(json.dumps(settings))
+        return count
+
+    def pending(self) -> List[int]:
+        """
+        Gets shards without valid output.
+
+        Returns
+        -------
+        `List` [`int`]
+            Shards to run.
+
+        """
+        pending = []
+        for shard in range(self.shards):
+            count = _verify_checksum(self.output_path(shard), _OUTPUT_RECORD_SIZE)
+            if count is None or count != _verify_checksum(
+                self.input_path(shard), _INPUT_RECORD_SIZE
+            ):
+                pending.append(shard)
+        return pending
+
+    def run(self, executor: Executor, retries: int = 0) -> None:
+        """
+        Runs pending shards on executor.
+
+        Parameters
+        ----------
+        executor : `Executor`
+            Executor of `run_shard`, e.g. process pool or `SpoolExecutor`.
+
+        retries : `int`
+            Number of additional attempts of failed shards.
+
+        Raises
+        ------
+        `RuntimeError`
+            When campaign isn't split or shards still fail after retries, failures
+            are available in `failures`.
+
+        """
+        if self.count is None:
+            raise RuntimeError("Campaign shall be split before it is run.")
+        for _ in range(retries + 1):
+            pending = self.pending()
+            if not pending:
+                break
+            futures = {
+                executor.submit(
+                    run_shard, self.input_path(shard), self.output_path(shard)
+                ): shard
+                for shard in pending
+            }
+            wait(futures)
+            for future, shard in futures.items():
+                exception = future.exception()
+                if exception is not None:
+                    self.failures[shard] = exception
+                else:
+                    self.failures.pop(shard, None)
+        pending = self.pending()
+        if pending:
+            raise RuntimeError(f"Shards {pending} failed.")
+
+    def merge(self, path: Optional[Union[str, Path]] = None) -> CampaignResult:
+        """
+        Merges outputs of shards into messages ordered as manifest.
+
+        Result consists of encoded messages (see `pack_message_set`) followed by their
+        SHA-256 digest, which is written to ``.sha256`` file as well.
+
+        Parameters
+        ----------
+        path : `Union` [`str`, `Path`], optional
+            Path of result, ``result.dat`` in campaign directory by default.
+
+        Returns
+        -------
+        `CampaignResult`
+            Merged result.
+
+        Raises
+        ------
+        `RuntimeError`
+            When some shards have no valid output or outputs don't cover manifest.
+
+        """
+        pending = self.pending() if self.count is not None else None
+        if pending is None or pending:
+            raise RuntimeError(f"Shards {pending} have no valid output.")
+        path = Path(path) if path else self.directory / _RESULT_FILE
+        streams = [
+            _records(
+                self.output_path(shard),
+                _OUTPUT_RECORD_SIZE,
+                _verify_checksum(self.output_path(shard), _OUTPUT_RECORD_SIZE),
+            )
+            for shard in range(self.shards)
+        ]
+
+        def merged() -> Iterator[bytes]:
+            expected = 0
+            for record in heapq.merge(*streams):
+                if _INDEX.unpack_from(record)[0] != expected:
+                    raise RuntimeError(f"Record {expected} is missing in shards.")
+                expected += 1
+                yield record[_INDEX.size :]
+            if expected != self.count:
+                raise RuntimeError(f"Records from {expected} are missing in shards.")
+
+        sha256 = _write_atomically(path, merged())
+        path.with_name(path.name + ".sha256").write_text(f"{sha256}  {path.name}\n")
+        return CampaignResult(path, self.count, sha256)
+
+    def execute(
+        self,
+        manifest: Iterable[MemoryUpdateInfo],
+        executor: Executor,
+        retries: int = 0,
+    ) -> CampaignResult:
+        """
+        Splits manifest, runs shards and merges their outputs.
+
+        Parameters
+        ----------
+        manifest : `Iterable` [`MemoryUpdateInfo`]
+            Updates of campaign.
+
+        executor : `Executor`
+            Executor of `run_shard`.
+
+        retries : `int`
+            Number of additional attempts of failed shards.
+
+        Returns
+        -------
+        `CampaignResult`
+            Merged result.
+
+        """
+        self.split(manifest)
+        self.run(executor, retries)
+        return self.merge()
+
+
+class SpoolExecutor(Executor):
+    """
+    Executor handing shards over to remote workers through a spool directory, e.g.
+    a network share. Workers run `spool_worker` on the same directory.
+
+    Shards are placed into ``inbox``, claimed by workers by an atomic rename into
+    ``claimed`` and their outputs or error messages appear in ``outbox``.
+
+    Copied shards hold new and authentication keys in plaintext, so the spool directory
+    shall be shared with trusted workers only, over a confidential transport. Copies
+    are created readable and writable by their owner only, so workers shall run as the
+    same user.
+
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        poll_interval: float = 0.1,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Initializes executor.
+
+        Parameters
+        ----------
+        directory : `Union` [`str`, `Path`]
+            Spool directory shared with workers.
+
+        poll_interval : `float`
+            Interval in seconds of checking outbox.
+
+        timeout : `float`, optional
+            Time in seconds after which unanswered shard fails.
+
+        """
+        self.directory = Path(directory)
+        for name in ("inbox", "claimed", "outbox"):
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._waiting: Dict[str, Tuple[Future, Path, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Hands shard over to workers.
+
+        Parameters
+        ----------
+        fn : `Callable`
+            Shall be `run_shard`.
+
+        *args
+            Input and output path of shard.
+
+        Returns
+        -------
+        `Future`
+            Future resolved when output of shard is received.
+
+        Raises
+        ------
+        `TypeError`
+            When function isn't `run_shard`.
+
+        """
+        if fn is not run_shard or kwargs:
+            raise TypeError("SpoolExecutor executes only run_shard(input, output).")
+        if self._stop.is_set():
+            raise RuntimeError("Cannot submit shards after shutdown.")
+        input_path, output_path = map(Path, args)
+        name = input_path.name
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            (self.directory / "outbox" / _output_name(name)).unlink(missing_ok=True)
+            (self.directory / "outbox" / _error_name(name)).unlink(missing_ok=True)
+            temporary = self.directory / "inbox" / f".{name}.tmp"
+            with open(input_path, "rb") as source:
+                with _create_private(temporary) as destination:
+                    shutil.copyfileobj(source, destination)
+            os.replace(temporary, self.directory / "inbox" / name)
+            self._waiting[name] = (future, output_path, deadline)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, daemon=True)
+                self._poller.start()
+        return future
+
+    def _poll(self) -> None:
+        """
+        Resolves futures of answered or expired shards until shutdown.
+
+        A shard whose output cannot be received fails with the raised exception. When
+        polling itself fails, all outstanding futures fail with the exception, so
+        callers waiting for them never hang, and the next submitted shard starts a new
+        poller.
+
+        """
+        try:
+            while not self._stop.wait(self.poll_interval):
+                with self._lock:
+                    for name, (future, output_path, deadline) in list(
+                        self._waiting.items()
+                    ):
+                        try:
+                            if not self._receive(name, future, output_path, deadline):
+                                continue
+                        except Exception as error:
+                            future.set_exception(error)
+                        del self._waiting[name]
+        except BaseException as error:
+            with self._lock:
+                for future, _, _ in self._waiting.values():
+                    future.set_exception(error)
+                self._waiting.clear()
+                self._poller = None
+
+    def _receive(
+        self,
+        name: str,
+        future: Future,
+        output_path: Path,
+        deadline: Optional[float],
+    ) -> bool:
+        """
+        Resolves future of shard when it's answered or expired.
+
+        Parameters
+        ----------
+        name : `str`
+            Name of shard in inbox.
+
+        future : `Future`
+            Future of shard.
+
+        output_path : `Path`
+            Path the output of shard is moved to.
+
+        deadline : `float`, optional
+            Monotonic time after which shard fails.
+
+        Returns
+        -------
+        `bool`
+            True when future is resolved.
+
+        """
+        outbox = self.directory / "outbox"
+        output, error = outbox / _output_name(name), outbox / _error_name(name)
+        if output.exists():
+            shutil.move(str(output), str(output_path))
+            future.set_result(None)
+        elif error.exists():
+            future.set_exception(RuntimeError(error.read_text()))
+            error.unlink()
+        elif deadline is not None and time.monotonic() > deadline:
+            (self.directory / "inbox" / name).unlink(missing_ok=True)
+            future.set_exception(
+                TimeoutError(f"Shard {name} wasn't processed in time.")
+            )
+        else:
+            return False
+        return True
+
+    def shutdown(self, wait: bool = True, **kwargs) -> None:
+        while wait and self._waiting and self._poller is not None:
+            time.sleep(self.poll_interval)
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+
+
+def _output_name(name: str) -> str:
+    return name[: -len(".in")] + ".out" if name.endswith(".in") else name + ".out"
+
+
+def _error_name(name: str) -> str:
+    return name + ".error"
+
+
+def spool_worker(
+    directory: Union[str, Path],
+    stop: Optional[threading.Event] = None,
+    poll_interval: float = 0.1,
+) -> int:
+    """
+    Processes shards handed over by `SpoolExecutor`.
+
+    Several workers may share the spool directory, every shard is claimed by a
+    single worker.
+
+    Parameters
+    ----------
+    directory : `Union` [`str`, `Path`]
+        Spool directory.
+
+    stop : `threading.Event`, optional
+        Event stopping worker. When not given, worker returns once inbox is empty.
+
+    poll_interval : `float`
+        Interval in seconds of checking inbox.
+
+    Returns
+    -------
+    `int`
+        Number of processed shards.
+
+    """
+    directory = Path(directory)
+    processed = 0
+    while True:
+        for shard in sorted((directory / "inbox").glob("*.in")):
+            claimed = directory / "claimed" / shard.name
+            try:
+                os.replace(shard, claimed)
+            except FileNotFoundError:
+                continue
+            output = directory / "outbox" / _output_name(shard.name)
+            try:
+                run_shard(claimed, directory / "claimed" / output.name)
+                os.replace(directory / "claimed" / output.name, output)
+            except Exception as error:
+                temporary = directory / "claimed" / _error_name(shard.name)
+                temporary.write_text(f"{type(error).__name__}: {error}")
+                os.replace(temporary, directory / "outbox" / temporary.name)
+            finally:
+                claimed.unlink(missing_ok=True)
+            processed += 1
+        if stop is None or stop.wait(poll_interval):
+            return processed
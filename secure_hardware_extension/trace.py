@@ -0,0 +1,320 @@
+"""
+Module contains streaming extraction of memory update messages from trace logs.
+
+"""
+
+__all__ = [
+    "TraceExchange",
+    "TraceFrame",
+    "binary_frames",
+    "extract_exchanges",
+    "read_trace",
+    "text_frames",
+    "verification_records",
+    "write_binary_frames",
+]
+
+import mmap
+import re
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from secure_hardware_extension.crypto import KeyDerivationCache
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, MemoryUpdateMessages
+from secure_hardware_extension.memory_update import MemoryUpdateView
+
+ROUTINE_CONTROL = 0x31
+ROUTINE_CONTROL_RESPONSE = 0x71
+START_ROUTINE = 0x01
+_REQUEST_SIZE = 4 + 64
+_RESPONSE_SIZE = 4 + 48
+
+_TEXT_FRAME = re.compile(
+    rb"^[ \t]*(?P<timestamp>\d+(?:\.\d+)?)[ \t]+(?P<session>\S+)[ \t]+(?:TX|RX)[ \t]+"
+    rb"(?P<data>(?:31|71)[ ]?01(?:[ ]?[0-9A-Fa-f]{2})*)[ \t]*\r?$",
+    re.MULTILINE,
+)
+_BINARY_RECORD = struct.Struct(">dIH")
+
+
+class TraceFrame(NamedTuple):
+    """
+    Diagnostic message of a trace, e.g. reassembled ISO-TP payload.
+
+    """
+
+    timestamp: float
+    session: str
+    data: bytes
+
+
+class TraceExchange(NamedTuple):
+    """
+    Memory update request carrying M1-M3 and device response carrying M4 and M5.
+
+    """
+
+    session: str
+    routine_id: int
+    request_timestamp: float
+    m1: bytes
+    m2: bytes
+    m3: bytes
+    response_timestamp: Optional[float] = None
+    m4: Optional[bytes] = None
+    m5: Optional[bytes] = None
+
+    @property
+    def answered(self) -> bool:
+        return self.m4 is not None
+
+    def view(
+        self, auth_key: bytes, cache: Optional[KeyDerivationCache] = None
+    ) -> MemoryUpdateView:
+        """
+        Gets lazily decoding view of request messages.
+
+        Parameters
+        ----------
+        auth_key : `bytes`
+            Key used for authentication of messages.
+
+        cache : `KeyDerivationCache`, optional
+            Cache of derived keys, may be shared between views.
+
+        Returns
+        -------
+        `MemoryUpdateView`
+            View of M1 and M2 messages.
+
+        """
+        return MemoryUpdateView(
+            MemoryUpdateMessages(auth_key=auth_key, m1=self.m1, m2=self.m2), cache
+        )
+
+
+@contextmanager
+def _mapped(path: Union[str, Path]) -> Iterator[Union[mmap.mmap, bytes]]:
+    with open(path, "rb") as file:
+        if not Path(path).stat().st_size:
+            yield b""
+            return
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def text_frames(path: Union[str, Path]) -> Iterator[TraceFrame]:
+    """
+    Scans text trace of ``TIMESTAMP SESSION TX|RX HEX`` lines, e.g.
+    ``12.5 ecu7 TX 31 01 F0 00 ...``.
+
+    Only RoutineControl start requests and their positive responses are parsed, other
+    lines are skipped by the regular expression engine without decoding.
+
+    Parameters
+    ----------
+    path : `Union` [`str`, `Path`]
+        Path of trace.
+
+    Yields
+    ------
+    `TraceFrame`
+        RoutineControl frames in order of trace.
+
+    """
+    with _mapped(path) as data:
+        for match in _TEXT_FRAME.finditer(data):
+            yield TraceFrame(
+                float(match.group("timestamp")),
+                match.group("session").decode("ascii", errors="replace"),
+                bytes.fromhex(match.group("data").decode("ascii")),
+            )
+
+
+def binary_frames(path: Union[str, Path]) -> Iterator[TraceFrame]:
+    """
+    Scans binary trace of ``TIMESTAMP (double) | SESSION (uint32) | LENGTH (uint16) |
+    DATA`` big endian records.
+
+    Parameters
+    ----------
+    path : `Union` [`str`, `Path`]
+        Path of trace.
+
+    Yields
+    ------
+    `TraceFrame`
+        RoutineControl frames in order of trace.
+
+    Raises
+    ------
+    `ValueError`
+        When the last record is truncated.
+
+    """
+    with _mapped(path) as data:
+        offset = 0
+        while offset < len(data):
+            if offset + _BINARY_RECORD.size > len(data):
+                raise ValueError(f"Truncated trace record at offset {offset}.")
+            timestamp, session, length = _BINARY_RECORD.unpack_from(data, offset)
+            offset += _BINARY_RECORD.size
+            if offset + length > len(data):
+                raise ValueError(f"Truncated trace record at offset {offset}.")
+            if length >= 2 and data[offset + 1] == START_ROUTINE:
+                if data[offset] in (ROUTINE_CONTROL, ROUTINE_CONTROL_RESPONSE):
+                    yield TraceFrame(
+                        timestamp, str(session), bytes(data[offset : offset + length])
+                    )
+            offset += length
+
+
+def write_binary_frames(file: BinaryIO, frames: Iterable[TraceFrame]) -> None:
+    """
+    Writes frames in format read by `binary_frames`.
+
+    Parameters
+    ----------
+    file : `BinaryIO`
+        Binary file opened for writing.
+
+    frames : `Iterable` [`TraceFrame`]
+        Frames to write, sessions shall be decimal numbers.
+
+    """
+    for frame in frames:
+        file.write(
+            _BINARY_RECORD.pack(frame.timestamp, int(frame.session), len(frame.data))
+        )
+        file.write(frame.data)
+
+
+def extract_exchanges(
+    frames: Iterable[TraceFrame], routine_id: Optional[int] = None
+) -> Iterator[TraceExchange]:
+    """
+    Reassembles memory update exchanges from frames.
+
+    Request ``31 01 RID M1 M2 M3`` is paired with the following positive response
+    ``71 01 RID M4 M5`` of the same session and routine. UDS sessions are sequential,
+    so a request still pending when the next request of its session arrives is
+    emitted unanswered, and only one request per session is kept in memory.
+
+    Parameters
+    ----------
+    frames : `Iterable` [`TraceFrame`]
+        Frames in order of trace.
+
+    routine_id : `int`, optional
+        Routine identifier of memory update, any routine with matching payload size
+        by default.
+
+    Yields
+    ------
+    `TraceExchange`
+        Exchanges in order of requests completion.
+
+    """
+    pending: Dict[str, TraceExchange] = {}
+    for frame in frames:
+        data = frame.data
+        if len(data) < 4:
+            continue
+        rid = int.from_bytes(data[2:4], byteorder="big")
+        if routine_id is not None and rid != routine_id:
+            continue
+        if data[0] == ROUTINE_CONTROL and len(data) == _REQUEST_SIZE:
+            previous = pending.pop(frame.session, None)
+            if previous is not None:
+                yield previous
+            pending[frame.session] = TraceExchange(
+                frame.session,
+                rid,
+                frame.timestamp,
+                data[4:20],
+                data[20:52],
+                data[52:68],
+            )
+        elif data[0] == ROUTINE_CONTROL_RESPONSE and len(data) == _RESPONSE_SIZE:
+            request = pending.get(frame.session)
+            if request is not None and request.routine_id == rid:
+                del pending[frame.session]
+                yield request._replace(
+                    response_timestamp=frame.timestamp, m4=data[4:36], m5=data[36:52]
+                )
+    yield from pending.values()
+
+
+def read_trace(
+    path: Union[str, Path], binary: bool = False, routine_id: Optional[int] = None
+) -> Iterator[TraceExchange]:
+    """
+    Streams memory update exchanges of trace file.
+
+    Parameters
+    ----------
+    path : `Union` [`str`, `Path`]
+        Path of trace.
+
+    binary : `bool`
+        Whether trace is binary, see `binary_frames`, or text, see `text_frames`.
+
+    routine_id : `int`, optional
+        Routine identifier of memory update.
+
+    Returns
+    -------
+    `Iterator` [`TraceExchange`]
+        Exchanges of trace.
+
+    """
+    frames = binary_frames(path) if binary else text_frames(path)
+    return extract_exchanges(frames, routine_id)
+
+
+def verification_records(
+    exchanges: Iterable[TraceExchange],
+    auth_key_of: Callable[[bytes, int], bytes],
+    cache: Optional[KeyDerivationCache] = None,
+) -> Iterator[Tuple[MemoryUpdateInfo, bytes, bytes]]:
+    """
+    Decodes answered exchanges into records of `ResponseVerifier`.
+
+    Parameters
+    ----------
+    exchanges : `Iterable` [`TraceExchange`]
+        Exchanges to decode, unanswered ones are skipped.
+
+    auth_key_of : `Callable` [[`bytes`, `int`], `bytes`]
+        Gets authentication key of device UID and key slot.
+
+    cache : `KeyDerivationCache`, optional
+        Cache of derived keys, may be shared with verifier.
+
+    Yields
+    ------
+    `Tuple` [`MemoryUpdateInfo`, `bytes`, `bytes`]
+        Update decoded from M1 and M2, received M4 and received M5.
+
+    """
+    for exchange in exchanges:
+        if not exchange.answered:
+            continue
+        uid, auth_key_id = exchange.m1[:15], exchange.m1[15] & 0b1111
+        view = exchange.view(auth_key_of(uid, auth_key_id), cache)
+        yield view.update_info, exchange.m4, exchange.m5
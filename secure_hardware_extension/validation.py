@@ -0,0 +1,256 @@
+"""
+Module contains exception-free bulk validation of raw memory update fields.
+
+"""
+
+__all__ = [
+    "FIELDS",
+    "FieldError",
+    "ValidationReport",
+    "valid_updates",
+    "validate_rows",
+]
+
+import re
+from enum import IntFlag
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from secure_hardware_extension.datatypes import (
+    UID_SIZE,
+    MemoryUpdateInfo,
+    SecurityFlags,
+)
+from secure_hardware_extension.key_slots.base import KeySlots
+
+FIELDS = ("new_key", "auth_key", "new_key_id", "auth_key_id", "counter", "uid", "fid")
+
+_KEY_HEX = re.compile(r"[0-9A-Fa-f]{32}")
+_UID_HEX = re.compile(f"[0-9A-Fa-f]{{{2 * UID_SIZE}}}")
+_MISSING = object()
+
+Row = Union[Mapping[str, Any], Sequence[Any]]
+
+
+class FieldError(IntFlag):
+    """
+    Flags of invalid fields of a row.
+
+    """
+
+    NONE = 0
+    NEW_KEY = 1
+    AUTH_KEY = 2
+    NEW_KEY_ID = 4
+    AUTH_KEY_ID = 8
+    COUNTER = 16
+    UID = 32
+    FID = 64
+
+
+class ValidationReport:
+    """
+    Class holds error bitmap of every validated row, one byte per row.
+
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes empty report.
+
+        """
+        self.errors = bytearray()
+        self._counts = [0] * len(FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.errors)
+
+    def _add(self, errors: int) -> None:
+        self.errors.append(errors)
+        if errors:
+            for bit in range(len(FIELDS)):
+                if errors >> bit & 1:
+                    self._counts[bit] += 1
+
+    @property
+    def valid(self) -> int:
+        return self.errors.count(0)
+
+    @property
+    def invalid(self) -> int:
+        return len(self.errors) - self.valid
+
+    def counts(self) -> Dict[FieldError, int]:
+        """
+        Gets number of rows with every invalid field.
+
+        Returns
+        -------
+        `Dict` [`FieldError`, `int`]
+            Number of rows per invalid field, fields without errors are omitted.
+
+        """
+        return {
+            FieldError(1 << bit): count
+            for bit, count in enumerate(self._counts)
+            if count
+        }
+
+    def invalid_rows(self) -> Iterator[Tuple[int, FieldError]]:
+        """
+        Gets invalid rows.
+
+        Yields
+        ------
+        `Tuple` [`int`, `FieldError`]
+            Index of row and its invalid fields.
+
+        """
+        for index, errors in enumerate(self.errors):
+            if errors:
+                yield index, FieldError(errors)
+
+    def summary(self) -> str:
+        """
+        Describes report in a single line, e.g. for logs.
+
+        Returns
+        -------
+        `str`
+            Numbers of valid and invalid rows and invalid fields.
+
+        """
+        fields = ", ".join(
+            f"{field.name.lower()}: {count}" for field, count in self.counts().items()
+        )
+        return f"{self.valid} valid, {self.invalid} invalid rows" + (
+            f" ({fields})" if fields else ""
+        )
+
+
+def _hex_field(value: Any, pattern: "re.Pattern", size: int) -> Any:
+    if isinstance(value, str):
+        return bytes.fromhex(value) if pattern.fullmatch(value) else None
+    if isinstance(value, (bytes, bytearray)) and len(value) == size:
+        return bytes(value)
+    return None
+
+
+def _int_field(value: Any, bits: int) -> Any:
+    if isinstance(value, KeySlots):
+        value = value.value
+    if isinstance(value, str):
+        if not value.isdecimal():
+            return None
+        value = int(value)
+    elif not isinstance(value, int) or isinstance(value, bool):
+        return None
+    return value if 0 <= value < 1 << bits else None
+
+
+def _validate(row: Row) -> Tuple[int, Tuple[Any, ...]]:
+    """
+    Validates and normalizes raw fields of row.
+
+    Parameters
+    ----------
+    row : `Row`
+        Mapping with `FIELDS` keys or sequence of fields in `FIELDS` order.
+
+    Returns
+    -------
+    `Tuple` [`int`, `Tuple` [`Any`, ...]]
+        Error bitmap and normalized fields, invalid ones set to None.
+
+    """
+    if isinstance(row, Mapping):
+        raw = [row.get(name, _MISSING) for name in FIELDS]
+    else:
+        raw = list(row)[: len(FIELDS)]
+        raw += [_MISSING] * (len(FIELDS) - len(raw))
+    fields = (
+        _hex_field(raw[0], _KEY_HEX, 16),
+        _hex_field(raw[1], _KEY_HEX, 16),
+        _int_field(raw[2], 4),
+        _int_field(raw[3], 4),
+        _int_field(raw[4], 28),
+        _hex_field(raw[5], _UID_HEX, UID_SIZE),
+        _int_field(raw[6], 5) if raw[6] is not _MISSING else 0,
+    )
+    errors = 0
+    for bit, value in enumerate(fields):
+        if value is None:
+            errors |= 1 << bit
+    return errors, fields
+
+
+def validate_rows(rows: Iterable[Row]) -> ValidationReport:
+    """
+    Validates raw fields of rows in a single pass without raising.
+
+    Keys and UID may be hex strings or bytes of proper size, key slots, counter and
+    fid may be integers or decimal strings. Missing fid is treated as 0.
+
+    Parameters
+    ----------
+    rows : `Iterable` [`Row`]
+        Mappings with `FIELDS` keys, e.g. from `csv.DictReader`, or sequences of
+        fields in `FIELDS` order.
+
+    Returns
+    -------
+    `ValidationReport`
+        Error bitmap of every row.
+
+    """
+    report = ValidationReport()
+    for row in rows:
+        report._add(_validate(row)[0])
+    return report
+
+
+def valid_updates(
+    rows: Iterable[Row], report: Optional[ValidationReport] = None
+) -> Iterator[MemoryUpdateInfo]:
+    """
+    Validates rows in a single pass and constructs updates of valid rows only.
+
+    Parameters
+    ----------
+    rows : `Iterable` [`Row`]
+        Rows accepted by `validate_rows`.
+
+    report : `ValidationReport`, optional
+        Report filled with error bitmap of every row.
+
+    Yields
+    ------
+    `MemoryUpdateInfo`
+        Updates of valid rows, in order of rows.
+
+    """
+    for row in rows:
+        errors, fields = _validate(row)
+        if report is not None:
+            report._add(errors)
+        if errors:
+            continue
+        new_key, auth_key, new_key_id, auth_key_id, counter, uid, fid = fields
+        yield MemoryUpdateInfo(
+            new_key=new_key,
+            auth_key=auth_key,
+            new_key_id=new_key_id,
+            auth_key_id=auth_key_id,
+            counter=counter,
+            uid=uid,
+            flags=SecurityFlags(fid=fid),
+        )
@@ -0,0 +1,362 @@
+"""
+Module contains batch verification of M4 and M5 messages returned by ECUs.
+
+"""
+
+__all__ = [
+    "RecoveredCounter",
+    "ResponseVerifier",
+    "VerificationError",
+    "VerificationResult",
+]
+
+import hmac
+from enum import IntFlag
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from Crypto.Cipher import AES
+
+from secure_hardware_extension.constants import SheConstants
+from secure_hardware_extension.crypto import BLOCK_SIZE, KeyDerivationCache, cmac_many
+from secure_hardware_extension.datatypes import MemoryUpdateInfo
+from secure_hardware_extension.memory_update import unpack_m4_counter
+from secure_hardware_extension.planner import SlotState
+
+ResponseRecord = Tuple[MemoryUpdateInfo, bytes, bytes]
+CaptureRecord = Tuple[bytes, bytes, bytes]
+
+
+class VerificationError(IntFlag):
+    """
+    Flags of mismatches found in ECU response.
+
+    MALFORMED marks M4 or M5 of improper length. UNDECRYPTABLE marks counter block of
+    M4 without valid padding, which usually means M4 was calculated with another key.
+
+    """
+
+    NONE = 0
+    MALFORMED = 1
+    WRONG_UID = 2
+    WRONG_KEY_ID = 4
+    WRONG_COUNTER = 8
+    BAD_MAC = 16
+    UNDECRYPTABLE = 32
+
+
+class VerificationResult(NamedTuple):
+    """
+    Result of verification of a single ECU response.
+
+    """
+
+    index: int
+    uid: bytes
+    new_key_id: int
+    errors: VerificationError
+    received_counter: Optional[int]
+
+    @property
+    def ok(self) -> bool:
+        return self.errors == VerificationError.NONE
+
+
+class RecoveredCounter(NamedTuple):
+    """
+    Counter of a key slot recovered from M4 and M5 messages.
+
+    """
+
+    index: int
+    uid: bytes
+    key_id: int
+    counter: Optional[int]
+
+    @property
+    def ok(self) -> bool:
+        return self.counter is not None
+
+
+class ResponseVerifier:
+    """
+    Class verifies M4 and M5 messages returned by ECUs after memory update.
+
+    Records are processed in chunks. Within a chunk, K3 and K4 are derived once per
+    distinct new key, all M4 ciphertext blocks of a key are decrypted with a single AES
+    call and all M5 are recalculated with multi-block CMAC. MACs and M4 prefixes are
+    compared in constant time. The same way counters held by devices are recovered
+    from captured M4 and M5 messages, e.g. to resynchronize counter records.
+
+    Examples
+    --------
+    >>> verifier = ResponseVerifier()
+    >>> for result in verifier.mismatches(zip(update_infos, received_m4, received_m5)):
+    ...     print(result.uid.hex(), result.errors)
+    >>> current_state = verifier.recover_slot_states(zip(slot_keys, captured_m4, captured_m5))
+
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 65536,
+        cache: Optional[KeyDerivationCache] = None,
+    ) -> None:
+        """
+        Initializes verifier.
+
+        Parameters
+        ----------
+        chunk_size : `int`
+            Number of records processed at once.
+
+        cache : `KeyDerivationCache`, optional
+            Cache of derived keys, may be shared with generation.
+
+        Raises
+        ------
+        `ValueError`
+            When chunk size isn't positive.
+
+        """
+        if chunk_size < 1:
+            raise ValueError(
+                f"chunk_size shall be at least 1. Value given: {chunk_size}."
+            )
+        self.chunk_size = chunk_size
+        self.cache = cache if cache is not None else KeyDerivationCache()
+
+    def verify(self, records: Iterable[ResponseRecord]) -> Iterator[VerificationResult]:
+        """
+        Verifies ECU responses.
+
+        Parameters
+        ----------
+        records : `Iterable` [`ResponseRecord`]
+            Tuples of expected update, received M4 and received M5.
+
+        Yields
+        ------
+        `VerificationResult`
+            Result of every record, in order of records.
+
+        """
+        records = iter(records)
+        offset = 0
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return
+            yield from self._verify_chunk(chunk, offset)
+            offset += len(chunk)
+
+    def mismatches(
+        self, records: Iterable[ResponseRecord]
+    ) -> Iterator[VerificationResult]:
+        """
+        Verifies ECU responses and yields only failed ones.
+
+        Parameters
+        ----------
+        records : `Iterable` [`ResponseRecord`]
+            Tuples of expected update, received M4 and received M5.
+
+        Yields
+        ------
+        `VerificationResult`
+            Results of records with mismatches.
+
+        """
+        return (result for result in self.verify(records) if not result.ok)
+
+    def _verify_chunk(
+        self, chunk: List[ResponseRecord], offset: int
+    ) -> List[VerificationResult]:
+        """
+        Verifies chunk of records grouped by new key.
+
+        Parameters
+        ----------
+        chunk : `List` [`ResponseRecord`]
+            Records to verify.
+
+        offset : `int`
+            Index of the first record of chunk.
+
+        Returns
+        -------
+        `List` [`VerificationResult`]
+            Results in order of records.
+
+        """
+        results: List[Optional[VerificationResult]] = [None] * len(chunk)
+        groups: Dict[bytes, List[int]] = {}
+        for position, (update_info, m4, m5) in enumerate(chunk):
+            if len(m4) != 2 * BLOCK_SIZE or len(m5) != BLOCK_SIZE:
+                results[position] = VerificationResult(
+                    offset + position,
+                    bytes(update_info.uid),
+                    update_info.new_key_id,
+                    VerificationError.MALFORMED,
+                    None,
+                )
+            else:
+                groups.setdefault(bytes(update_info.new_key), []).append(position)
+
+        for new_key, positions in groups.items():
+            counter_blocks, macs = self._open(
+                new_key, b"".join(bytes(chunk[position][1]) for position in positions)
+            )
+            for number, position in enumerate(positions):
+                update_info, m4, m5 = chunk[position]
+                start = number * BLOCK_SIZE
+                counter = unpack_m4_counter(counter_blocks[start : start + BLOCK_SIZE])
+                errors = VerificationError.NONE
+                if not hmac.compare_digest(bytes(m4[:15]), bytes(update_info.uid)):
+                    errors |= VerificationError.WRONG_UID
+                if m4[15] != (update_info.new_key_id << 4) | update_info.auth_key_id:
+                    errors |= VerificationError.WRONG_KEY_ID
+                if counter is None:
+                    errors |= VerificationError.UNDECRYPTABLE
+                elif counter != update_info.counter:
+                    errors |= VerificationError.WRONG_COUNTER
+                if not hmac.compare_digest(macs[start : start + BLOCK_SIZE], bytes(m5)):
+                    errors |= VerificationError.BAD_MAC
+                results[position] = VerificationResult(
+                    offset + position,
+                    bytes(update_info.uid),
+                    update_info.new_key_id,
+                    errors,
+                    counter,
+                )
+        return results
+
+    def _open(self, key: bytes, m4s: bytes) -> Tuple[bytes, bytes]:
+        """
+        Decrypts counter blocks and calculates MACs of M4 messages of the same key.
+
+        Parameters
+        ----------
+        key : `bytes`
+            Key M4 messages were calculated with.
+
+        m4s : `bytes`
+            Concatenated M4 messages.
+
+        Returns
+        -------
+        `Tuple` [`bytes`, `bytes`]
+            Concatenated decrypted counter blocks and concatenated expected M5.
+
+        """
+        k3 = self.cache.derive(key, SheConstants.KEY_UPDATE_ENC_C)
+        k4 = self.cache.derive(key, SheConstants.KEY_UPDATE_MAC_C)
+        counter_blocks = AES.new(k3, AES.MODE_ECB).decrypt(
+            b"".join(
+                m4s[start + BLOCK_SIZE : start + 2 * BLOCK_SIZE]
+                for start in range(0, len(m4s), 2 * BLOCK_SIZE)
+            )
+        )
+        return counter_blocks, cmac_many(k4, m4s, 2 * BLOCK_SIZE)
+
+    def recover_counters(
+        self, records: Iterable[CaptureRecord]
+    ) -> Iterator[RecoveredCounter]:
+        """
+        Recovers counters of key slots from captured M4 and M5 messages.
+
+        Counter blocks of all messages of the same key are decrypted with a single AES
+        call and authenticated by recalculated M5.
+
+        Parameters
+        ----------
+        records : `Iterable` [`CaptureRecord`]
+            Tuples of key stored in slot, captured M4 and captured M5.
+
+        Yields
+        ------
+        `RecoveredCounter`
+            Recovered counter of every record, None when messages aren't authentic.
+
+        """
+        offset = 0
+        for chunk, counters in self._recover_chunks(records):
+            for position, (_, m4, _) in enumerate(chunk):
+                yield RecoveredCounter(
+                    offset + position,
+                    bytes(m4[:15]),
+                    m4[15] >> 4 if len(m4) > 15 else 0,
+                    counters[position],
+                )
+            offset += len(chunk)
+
+    def _recover_chunks(
+        self, records: Iterable[CaptureRecord]
+    ) -> Iterator[Tuple[List[CaptureRecord], List[Optional[int]]]]:
+        """
+        Recovers counters chunk by chunk, see `recover_counters`.
+
+        Parameters
+        ----------
+        records : `Iterable` [`CaptureRecord`]
+            Tuples of key stored in slot, captured M4 and captured M5.
+
+        Yields
+        ------
+        `Tuple` [`List` [`CaptureRecord`], `List` [`Optional` [`int`]]]
+            Records of chunk and their counters, None when messages aren't authentic.
+
+        """
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return
+            counters: List[Optional[int]] = [None] * len(chunk)
+            groups: Dict[bytes, List[int]] = {}
+            for position, (key, m4, m5) in enumerate(chunk):
+                if len(m4) == 2 * BLOCK_SIZE and len(m5) == BLOCK_SIZE:
+                    groups.setdefault(bytes(key), []).append(position)
+            for key, positions in groups.items():
+                counter_blocks, macs = self._open(
+                    key, b"".join(bytes(chunk[position][1]) for position in positions)
+                )
+                for number, position in enumerate(positions):
+                    start = number * BLOCK_SIZE
+                    if hmac.compare_digest(
+                        macs[start : start + BLOCK_SIZE], bytes(chunk[position][2])
+                    ):
+                        counters[position] = unpack_m4_counter(
+                            counter_blocks[start : start + BLOCK_SIZE]
+                        )
+            yield chunk, counters
+
+    def recover_slot_states(
+        self, records: Iterable[CaptureRecord]
+    ) -> Dict[Tuple[bytes, int], SlotState]:
+        """
+        Recovers states of key slots to seed `CampaignPlanner`.
+
+        When a slot is captured several times, the highest authentic counter is kept.
+
+        Parameters
+        ----------
+        records : `Iterable` [`CaptureRecord`]
+            Tuples of key stored in slot, captured M4 and captured M5.
+
+        Returns
+        -------
+        `Dict` [`Tuple` [`bytes`, `int`], `SlotState`]
+            States of slots with authentic messages, indexed by UID and key slot.
+
+        """
+        states: Dict[Tuple[bytes, int], SlotState] = {}
+        for chunk, counters in self._recover_chunks(records):
+            for (key, m4, _), counter in zip(chunk, counters):
+                if counter is None:
+                    continue
+                index = (bytes(m4[:15]), m4[15] >> 4)
+                state = states.get(index)
+                if state is None or state.counter < counter:
+                    states[index] = SlotState(bytes(key), counter)
+        return states
@@ -15,6 +15,9 @@ setup(
     install_requires=[
         "pycryptodome",
     ],
+    extras_require={
+        "numpy": ["numpy"],
+    },
     python_requires=">=3.8",
     author="Michał Juszczyk",
     author_email="michaljuszczyk2@gmail.com",
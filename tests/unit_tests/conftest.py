@@ -0,0 +1,53 @@
+import random
+
+from pytest import fixture
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, SecurityFlags
+from secure_hardware_extension.memory_update import MemoryUpdateProtocol
+
+
+@fixture
+def random_bytes():
+    def generate(generator, size):
+        return generator.getrandbits(size * 8).to_bytes(size, byteorder="big")
+
+    yield generate
+
+
+@fixture
+def random_update_infos(random_bytes):
+    def generate(seed, count, keys=4, auth_keys=None, uids=None, **fields):
+        generator = random.Random(seed)
+        new_keys = [random_bytes(generator, 16) for _ in range(keys)]
+        if auth_keys is None:
+            auth_keys = new_keys
+        else:
+            auth_keys = [random_bytes(generator, 16) for _ in range(auth_keys)]
+        update_infos = []
+        for index in range(count):
+            values = dict(
+                new_key=generator.choice(new_keys),
+                auth_key=generator.choice(auth_keys),
+                new_key_id=generator.randrange(16),
+                auth_key_id=generator.randrange(16),
+                counter=generator.randrange(2**28),
+                uid=(
+                    random_bytes(generator, 15)
+                    if uids is None
+                    else uids[index % len(uids)]
+                ),
+                flags=SecurityFlags(fid=generator.randrange(32)),
+            )
+            values.update(fields)
+            update_infos.append(MemoryUpdateInfo(**values))
+        return update_infos
+
+    yield generate
+
+
+@fixture
+def expected_messages():
+    def generate(update_info):
+        protocol = MemoryUpdateProtocol(update_info)
+        return (protocol.m1, protocol.m2, protocol.m3, protocol.m4, protocol.m5)
+
+    yield generate
@@ -0,0 +1,108 @@
+from pytest import fixture, raises
+from secure_hardware_extension.archive import UpdateArchive
+from secure_hardware_extension.datatypes import MemoryUpdateMessageSet
+
+
+def uid(number):
+    return number.to_bytes(15, byteorder="big")
+
+
+def messages(uid_number, new_key_id, auth_key_id=1, tag=0):
+    m1 = uid(uid_number) + bytes([(new_key_id << 4) | auth_key_id])
+    return MemoryUpdateMessageSet(
+        m1=m1,
+        m2=bytes([tag]) * 32,
+        m3=bytes([tag]) * 16,
+        m4=m1 + bytes([tag]) * 16,
+        m5=bytes([tag]) * 16,
+    )
+
+
+@fixture
+def archive_path(tmp_path):
+    yield tmp_path / "archive"
+
+
+@fixture
+def archive(archive_path):
+    with UpdateArchive(archive_path, flush_threshold=7, merge_factor=3) as archive:
+        for counter in range(1, 11):
+            for uid_number in range(20):
+                for new_key_id in (4, 5):
+                    archive.append(
+                        messages(uid_number, new_key_id, tag=counter),
+                        counter=counter,
+                        timestamp=float(counter),
+                    )
+        yield archive
+
+
+def test_archive_find_by_uid(archive):
+    found = archive.find(uid(3))
+    assert 20 == len(found)
+    assert [(4, counter) for counter in range(1, 11)] + [
+        (5, counter) for counter in range(1, 11)
+    ] == [(update.new_key_id, update.counter) for update in found]
+    assert all(uid(3) == update.uid for update in found)
+    assert all(1 == update.auth_key_id for update in found)
+    assert bytes([7]) * 32 == found[6].messages.m2
+
+
+def test_archive_find_by_slot_and_ranges(archive):
+    found = archive.find(uid(7).hex(), new_key_id=5, counters=(3, 5))
+    assert [3, 4, 5] == [update.counter for update in found]
+    found = archive.find(uid(7), timestamps=(9.0, 20.0))
+    assert [(4, 9), (4, 10), (5, 9), (5, 10)] == [
+        (update.new_key_id, update.counter) for update in found
+    ]
+    assert [] == archive.find(uid(99))
+
+
+def test_archive_bounded_segments(archive):
+    archive.wait_for_compaction()
+    tiers = [archive._tier(segment.count) for segment in archive._segments]
+    assert all(tiers.count(tier) < 3 for tier in tiers)
+    archive.compact()
+    assert 1 == len(archive._segments)
+    assert 20 == len(archive.find(uid(0)))
+
+
+def test_archive_size_tiered_merges(archive_path):
+    with UpdateArchive(archive_path, flush_threshold=100, merge_factor=4) as archive:
+        for number in range(20000):
+            archive.append(messages(number % 5000, 4), counter=number, timestamp=1.0)
+        archive.wait_for_compaction()
+        assert archive.merged_entries <= 4 * 20000
+        assert len(archive._segments) <= 3 * 4
+        assert 4 == len(archive.find(uid(17)))
+    with UpdateArchive(archive_path) as reopened:
+        assert 20000 == sum(segment.count for segment in reopened._segments)
+
+
+def test_archive_reopen_indexes_unflushed_records(archive_path):
+    archive = UpdateArchive(archive_path, flush_threshold=1000)
+    for counter in range(3):
+        archive.append(messages(1, 4), counter=counter, timestamp=1.0)
+    archive._data.flush()
+    reopened = UpdateArchive(archive_path)
+    assert 3 == len(reopened)
+    assert [0, 1, 2] == [update.counter for update in reopened.find(uid(1), 4)]
+    reopened.close()
+
+
+def test_archive_scan_time(archive):
+    scanned = list(archive.scan_time(3.0, 4.0))
+    assert 80 == len(scanned)
+    assert {3.0, 4.0} == {update.timestamp for update in scanned}
+
+
+def test_archive_improper_append(archive):
+    with raises(ValueError):
+        archive.append(messages(1, 4), counter=2**28, timestamp=11.0)
+    with raises(ValueError):
+        archive.append(messages(1, 4), counter=1, timestamp=1.0)
+
+
+def test_archive_counter_range_requires_slot(archive):
+    with raises(ValueError):
+        archive.find(uid(1), counters=(1, 2))
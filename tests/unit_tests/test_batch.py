@@ -0,0 +1,148 @@
+import random
+
+from pytest import fixture, importorskip, mark, raises
+
+np = importorskip("numpy")
+
+from secure_hardware_extension.batch import (  # noqa: E402
+    UpdateBatch,
+    diversify_keys,
+    fids_from_flags,
+    flags_from_fids,
+)
+from secure_hardware_extension.constants import SheConstants  # noqa: E402
+from secure_hardware_extension.crypto import compress, diversify  # noqa: E402
+from secure_hardware_extension.datatypes import SecurityFlags  # noqa: E402
+from secure_hardware_extension.memory_update import MemoryUpdateProtocol  # noqa: E402
+
+
+@fixture
+def update_infos(random_update_infos):
+    yield random_update_infos(0, 50, keys=4, auth_keys=3)
+
+
+def test_batch_messages(update_infos, expected_messages):
+    messages = UpdateBatch.from_update_infos(update_infos).messages()
+    for index, update_info in enumerate(update_infos):
+        assert expected_messages(update_info) == tuple(
+            message[index].tobytes() for message in messages
+        )
+
+
+def test_batch_update_infos_round_trip(update_infos):
+    converted = UpdateBatch.from_update_infos(update_infos).to_update_infos()
+    for expected, update_info in zip(update_infos, converted):
+        for attribute in (
+            "new_key",
+            "auth_key",
+            "new_key_id",
+            "auth_key_id",
+            "counter",
+            "uid",
+            "fid",
+        ):
+            assert getattr(expected, attribute) == getattr(update_info, attribute)
+
+
+def test_batch_take(update_infos):
+    batch = UpdateBatch.from_update_infos(update_infos)
+    selected = batch.take([3, 1])
+    assert 2 == len(selected)
+    assert np.array_equal(batch.messages().m3[[3, 1]], selected.messages().m3)
+
+
+def test_empty_batch():
+    batch = UpdateBatch.from_update_infos([])
+    assert 0 == len(batch)
+    assert (0, 16) == batch.messages().m1.shape
+
+
+@mark.parametrize("fid", range(64))
+def test_flags_round_trip(fid):
+    flags = flags_from_fids([fid])
+    expected = SecurityFlags(fid=fid)
+    for name, column in flags.items():
+        assert getattr(expected, name) == column[0]
+    assert fid == fids_from_flags(flags)[0]
+
+
+def test_fids_from_flags_unknown_flag():
+    with raises(ValueError):
+        fids_from_flags({"secure": [True]})
+
+
+def test_diversify_keys(random_bytes):
+    generator = random.Random(3)
+    master_key = random_bytes(generator, 16)
+    uids = [random_bytes(generator, 15) for _ in range(20)]
+    keys = diversify_keys(master_key, SheConstants.KEY_UPDATE_ENC_C, b"".join(uids))
+    assert (20, 16) == keys.shape
+    for uid, key in zip(uids, keys):
+        expected = compress(master_key, SheConstants.KEY_UPDATE_ENC_C, uid + b"\x80")
+        assert expected == key.tobytes()
+        assert expected == diversify(master_key, SheConstants.KEY_UPDATE_ENC_C, uid)
+    uid_column = np.frombuffer(b"".join(uids), dtype=np.uint8).reshape(-1, 15)
+    assert np.array_equal(
+        keys, diversify_keys(master_key, SheConstants.KEY_UPDATE_ENC_C, uid_column)
+    )
+    assert (0, 16) == diversify_keys(master_key, bytes(16), b"").shape
+
+
+def test_diversified_batch_messages(random_bytes):
+    generator = random.Random(4)
+    uids = random_bytes(generator, 15 * 10)
+    new_keys = diversify_keys(random_bytes(generator, 16), bytes(16), uids)
+    auth_keys = diversify_keys(random_bytes(generator, 16), bytes(15) + b"\x01", uids)
+    batch = UpdateBatch(
+        new_keys, auth_keys, [4] * 10, [1] * 10, [1] * 10, uids, [0] * 10
+    )
+    messages = batch.messages()
+    for index, update_info in enumerate(batch.to_update_infos()):
+        assert new_keys[index].tobytes() == update_info.new_key
+        assert MemoryUpdateProtocol(update_info).m5 == messages.m5[index].tobytes()
+
+
+@mark.parametrize(
+    "master_key, constant, uids",
+    (
+        (bytes(15), bytes(16), bytes(15)),
+        (bytes(16), bytes(17), bytes(15)),
+        (bytes(16), bytes(16), bytes(16)),
+    ),
+)
+def test_diversify_keys_improper_sizes(master_key, constant, uids):
+    with raises(ValueError):
+        diversify_keys(master_key, constant, uids)
+
+
+def batch_columns(**overrides):
+    columns = dict(
+        new_keys=bytes(32),
+        auth_keys=bytes(32),
+        new_key_ids=[4, 5],
+        auth_key_ids=[1, 1],
+        counters=[1, 2],
+        uids=bytes(30),
+        fids=[0, 0],
+    )
+    columns.update(overrides)
+    return columns
+
+
+@mark.parametrize(
+    "overrides, errortype",
+    (
+        (dict(new_keys=bytes(31)), ValueError),
+        (dict(auth_keys=np.zeros((2, 15), dtype=np.uint8)), ValueError),
+        (dict(uids=np.zeros((2, 15), dtype=np.int64)), TypeError),
+        (dict(new_key_ids=[4, 16]), ValueError),
+        (dict(auth_key_ids=[-1, 1]), ValueError),
+        (dict(counters=[1, 2**28]), ValueError),
+        (dict(counters=[1.0, 2.0]), TypeError),
+        (dict(fids=[0, 32]), ValueError),
+        (dict(fids=[0]), ValueError),
+    ),
+)
+def test_batch_improper_columns(overrides, errortype):
+    with raises(errortype):
+        UpdateBatch(**batch_columns(**overrides))
@@ -0,0 +1,74 @@
+from Crypto.Cipher import AES
+from Crypto.Hash import CMAC
+from pytest import fixture, mark, raises
+from secure_hardware_extension.boot_mac import BootMacCalculator
+
+BOOT_MAC_KEY = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+
+
+def reference_boot_mac(bootloader):
+    prefix = (len(bootloader) * 8).to_bytes(16, byteorder="big")
+    return CMAC.new(BOOT_MAC_KEY, prefix + bootloader, ciphermod=AES).digest()
+
+
+@fixture
+def image():
+    yield bytes(range(256)) * 64 + b"\xaa" * 7
+
+
+@fixture
+def checkpoint_path(tmp_path):
+    yield tmp_path / "image.bmac"
+
+
+@mark.parametrize("size", (0, 1, 15, 16, 17, 32, 1000, 1024))
+def test_boot_mac_matches_cmac(size):
+    bootloader = bytes(index % 251 for index in range(size))
+    calculator = BootMacCalculator(BOOT_MAC_KEY, checkpoint_interval=64)
+    assert reference_boot_mac(bootloader) == calculator.calculate(bootloader)
+
+
+def test_boot_mac_resumes_from_checkpoint(image, checkpoint_path):
+    calculator = BootMacCalculator(
+        BOOT_MAC_KEY, checkpoint_path=checkpoint_path, checkpoint_interval=1024
+    )
+    assert reference_boot_mac(image) == calculator.calculate(image)
+    assert calculator.resumed_from is None
+
+    patched = bytearray(image)
+    patched[10000] ^= 0xFF
+    patched = bytes(patched)
+    assert reference_boot_mac(patched) == calculator.calculate(patched)
+    assert calculator.resumed_from == 9216
+
+
+def test_boot_mac_resumes_from_given_offset(image, checkpoint_path):
+    calculator = BootMacCalculator(
+        BOOT_MAC_KEY, checkpoint_path=checkpoint_path, checkpoint_interval=1024
+    )
+    calculator.calculate(image)
+    patched = image[:-3] + b"\x00\x01\x02"
+    assert reference_boot_mac(patched) == calculator.calculate(
+        patched, changed_from=len(image) - 3
+    )
+    assert calculator.resumed_from == 15360
+
+
+def test_boot_mac_ignores_stale_checkpoints(image, checkpoint_path):
+    BootMacCalculator(
+        "ff" * 16, checkpoint_path=checkpoint_path, checkpoint_interval=1024
+    ).calculate(image)
+    calculator = BootMacCalculator(
+        BOOT_MAC_KEY, checkpoint_path=checkpoint_path, checkpoint_interval=1024
+    )
+    assert reference_boot_mac(image) == calculator.calculate(image)
+    assert calculator.resumed_from is None
+    resized = image + b"\x00"
+    assert reference_boot_mac(resized) == calculator.calculate(resized)
+    assert calculator.resumed_from is None
+
+
+@mark.parametrize("interval", (0, -16, 15, 100))
+def test_boot_mac_improper_interval(interval):
+    with raises(ValueError):
+        BootMacCalculator(BOOT_MAC_KEY, checkpoint_interval=interval)
@@ -0,0 +1,114 @@
+import random
+
+from pytest import mark, raises
+from secure_hardware_extension.counter_monitor import (
+    CounterMonitor,
+    CounterStatus,
+    CounterViolation,
+)
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, SecurityFlags
+from secure_hardware_extension.key_slots.autosar import AutosarKeySlots
+
+UID = bytes(15)
+
+
+def update(uid, key_id, counter):
+    return MemoryUpdateInfo(
+        new_key="0f0e0d0c0b0a09080706050403020100",
+        auth_key="000102030405060708090a0b0c0d0e0f",
+        new_key_id=key_id,
+        auth_key_id=1,
+        counter=counter,
+        uid=uid,
+        flags=SecurityFlags(),
+    )
+
+
+def test_observe():
+    with CounterMonitor() as monitor:
+        assert monitor.observe(UID, AutosarKeySlots.KEY_1, 5) == CounterStatus.NEW
+        assert monitor.observe(UID, AutosarKeySlots.KEY_1, 6) == CounterStatus.INCREASED
+        assert monitor.observe(UID, AutosarKeySlots.KEY_1, 6) == CounterStatus.DUPLICATE
+        assert (
+            monitor.observe(UID, AutosarKeySlots.KEY_1, 3) == CounterStatus.REGRESSION
+        )
+        assert monitor.observe(UID, AutosarKeySlots.KEY_2, 3) == CounterStatus.NEW
+        assert monitor.observe(UID, AutosarKeySlots.KEY_1, 7) == CounterStatus.INCREASED
+        assert (monitor.records, monitor.violations) == (6, 2)
+
+
+@mark.parametrize("max_entries", [1, 3, 1000])
+def test_observe_spills(max_entries):
+    generator = random.Random(7)
+    uids = [generator.getrandbits(120).to_bytes(15, "big") for _ in range(50)]
+    expected = {}
+    with CounterMonitor(max_entries=max_entries, expected_keys=100) as monitor:
+        for _ in range(2000):
+            uid, key_id = generator.choice(uids), generator.randrange(16)
+            counter = generator.randrange(40)
+            mark_ = expected.get((uid, key_id))
+            if mark_ is None:
+                status = CounterStatus.NEW
+            elif counter > mark_:
+                status = CounterStatus.INCREASED
+            elif counter == mark_:
+                status = CounterStatus.DUPLICATE
+            else:
+                status = CounterStatus.REGRESSION
+            expected[(uid, key_id)] = max(counter, mark_ or 0)
+            assert monitor.observe(uid, key_id, counter) == status
+        assert len(monitor._marks) <= max_entries
+        if max_entries < 800:
+            assert monitor.spills > 0
+
+
+def test_bloom_filter_skips_disk_for_new_slots():
+    with CounterMonitor(max_entries=1, expected_keys=10000) as monitor:
+        for number in range(1000):
+            monitor.observe(number.to_bytes(15, "big"), 4, 1)
+        assert monitor.disk_lookups < 50
+
+
+def test_persistent_marks(tmp_path):
+    path = tmp_path / "marks.sqlite"
+    with CounterMonitor(path) as monitor:
+        monitor.observe(UID, 4, 10)
+    with CounterMonitor(path) as monitor:
+        assert monitor.observe(UID, 4, 10) == CounterStatus.DUPLICATE
+        assert monitor.observe(UID, 4, 11) == CounterStatus.INCREASED
+
+
+def test_watch_raises():
+    updates = [update(UID, 4, 1), update(UID, 4, 2), update(UID, 4, 2)]
+    with CounterMonitor() as monitor:
+        watched = monitor.watch(updates)
+        assert next(watched) is updates[0]
+        assert next(watched) is updates[1]
+        with raises(ValueError):
+            next(watched)
+
+
+def test_watch_callback():
+    violations = []
+    updates = [update(UID, 4, 5), update(UID, 5, 1), update(UID, 4, 2)]
+    with CounterMonitor(on_violation=violations.append) as monitor:
+        assert list(monitor.watch(updates)) == updates
+    assert violations == [CounterViolation(UID, 4, 2, 5, CounterStatus.REGRESSION)]
+
+
+def test_watch_messages():
+    m1s = [UID + bytes([0x41]), UID + bytes([0x41]), UID + bytes([0x51])]
+    with CounterMonitor() as monitor:
+        assert list(monitor.watch_messages(m1s, [1, 1, 1])) == [
+            CounterStatus.NEW,
+            CounterStatus.DUPLICATE,
+            CounterStatus.NEW,
+        ]
+
+
+@mark.parametrize(
+    "kwargs", [{"max_entries": 0}, {"expected_keys": 0}, {"error_rate": 1.0}]
+)
+def test_invalid_parameters(kwargs):
+    with raises(ValueError):
+        CounterMonitor(**kwargs)
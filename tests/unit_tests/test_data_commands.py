@@ -0,0 +1,167 @@
+"""
+Test vectors found in NIST SP 800-38A and NIST SP 800-38B.
+
+"""
+
+import io
+
+from pytest import fixture, mark, raises
+from secure_hardware_extension.data_commands import SheDataCommands
+from secure_hardware_extension.datatypes import SecurityFlags, SheKeyStore, she_bytes
+from secure_hardware_extension.key_slots.autosar import AutosarKeySlots
+
+KEY = she_bytes.fromhex("2b7e151628aed2a6abf7158809cf4f3c")
+IV = she_bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+PLAINTEXT = she_bytes.fromhex(
+    "6bc1bee22e409f96e93d7e117393172a"
+    "ae2d8a571e03ac9c9eb76fac45af8e51"
+    "30c81c46a35ce411e5fbc1191a0a52ef"
+    "f69f2445df4f9b17ad2b417be66c3710"
+)
+ECB_CIPHERTEXT = she_bytes.fromhex(
+    "3ad77bb40d7a3660a89ecaf32466ef97"
+    "f5d3d58503b9699de785895a96fdbaaf"
+    "43b1cd7f598ece23881b00e3ed030688"
+    "7b0c785e27e8ad3f8223207104725dd4"
+)
+CBC_CIPHERTEXT = she_bytes.fromhex(
+    "7649abac8119b246cee98e9b12e9197d"
+    "5086cb9b507219ee95db113a917678b2"
+    "73bed6b8e3c1743b7116e69e22229516"
+    "3ff1caa1681fac09120eca307586e1a7"
+)
+CMAC = she_bytes.fromhex("51f0bebf7e3b9d92fc49741779363cfe")
+
+
+@fixture
+def commands():
+    key_store = SheKeyStore({AutosarKeySlots.KEY_1: KEY})
+    with SheDataCommands(key_store, chunk_size=32, workers=2) as commands:
+        yield commands
+
+
+def test_ecb(commands):
+    assert ECB_CIPHERTEXT == commands.encrypt_ecb(AutosarKeySlots.KEY_1, PLAINTEXT)
+    assert PLAINTEXT == commands.decrypt_ecb(AutosarKeySlots.KEY_1, ECB_CIPHERTEXT)
+
+
+def test_cbc(commands):
+    assert CBC_CIPHERTEXT == commands.encrypt_cbc(AutosarKeySlots.KEY_1, IV, PLAINTEXT)
+    assert PLAINTEXT == commands.decrypt_cbc(AutosarKeySlots.KEY_1, IV, CBC_CIPHERTEXT)
+
+
+@mark.parametrize("workers", (1, 2, 3, 8))
+def test_cbc_parallel_decryption(workers):
+    plaintext = bytes(range(256)) * 17
+    key_store = SheKeyStore({4: KEY})
+    with SheDataCommands(key_store, workers=workers) as commands:
+        ciphertext = commands.encrypt_cbc(4, IV, plaintext)
+        assert plaintext == commands.decrypt_cbc(4, IV, ciphertext)
+
+
+def test_mac(commands):
+    assert CMAC == commands.generate_mac(AutosarKeySlots.KEY_1, PLAINTEXT)
+    assert commands.verify_mac(AutosarKeySlots.KEY_1, PLAINTEXT, CMAC)
+    assert commands.verify_mac(AutosarKeySlots.KEY_1, PLAINTEXT, CMAC[:4])
+    assert commands.verify_mac(
+        AutosarKeySlots.KEY_1,
+        PLAINTEXT,
+        CMAC[:1] + bytes([CMAC[1] ^ 0x0F]),
+        mac_length=12,
+    )
+    assert not commands.verify_mac(
+        AutosarKeySlots.KEY_1,
+        PLAINTEXT,
+        CMAC[:1] + bytes([CMAC[1] ^ 0x10]),
+        mac_length=12,
+    )
+    assert not commands.verify_mac(AutosarKeySlots.KEY_1, PLAINTEXT, bytes(16))
+
+
+def test_mac_length_zero_compares_whole_mac(commands):
+    assert commands.verify_mac(AutosarKeySlots.KEY_1, PLAINTEXT, CMAC, mac_length=0)
+    assert not commands.verify_mac(
+        AutosarKeySlots.KEY_1, PLAINTEXT, CMAC[:15] + bytes(1), mac_length=0
+    )
+
+
+@mark.parametrize("mac, mac_length", ((CMAC, 129), (CMAC[:4], 33), (CMAC[:4], 0)))
+def test_improper_mac_length(commands, mac, mac_length):
+    with raises(ValueError, match=f"between 1 and {len(mac) * 8} bits"):
+        commands.verify_mac(AutosarKeySlots.KEY_1, PLAINTEXT, mac, mac_length)
+
+
+def test_key_entry_improper_flags():
+    with raises(TypeError):
+        SheKeyStore().load_key(AutosarKeySlots.KEY_1, KEY, 4)
+
+
+@mark.parametrize(
+    "method, data, expected",
+    (
+        ("encrypt_ecb_stream", PLAINTEXT, ECB_CIPHERTEXT),
+        ("decrypt_ecb_stream", ECB_CIPHERTEXT, PLAINTEXT),
+    ),
+)
+def test_ecb_streams(commands, method, data, expected):
+    destination = io.BytesIO()
+    processed = getattr(commands, method)(
+        AutosarKeySlots.KEY_1, io.BytesIO(data), destination
+    )
+    assert len(data) == processed
+    assert expected == destination.getvalue()
+
+
+@mark.parametrize(
+    "method, data, expected",
+    (
+        ("encrypt_cbc_stream", PLAINTEXT, CBC_CIPHERTEXT),
+        ("decrypt_cbc_stream", CBC_CIPHERTEXT, PLAINTEXT),
+    ),
+)
+def test_cbc_streams(commands, tmp_path, method, data, expected):
+    source = tmp_path / "source.bin"
+    destination = tmp_path / "destination.bin"
+    source.write_bytes(data)
+    getattr(commands, method)(AutosarKeySlots.KEY_1, IV, source, destination)
+    assert expected == destination.read_bytes()
+
+
+def test_mac_streams(commands):
+    assert CMAC == commands.generate_mac_stream(
+        AutosarKeySlots.KEY_1, io.BytesIO(PLAINTEXT)
+    )
+    assert commands.verify_mac_stream(
+        AutosarKeySlots.KEY_1, io.BytesIO(PLAINTEXT), CMAC
+    )
+
+
+def test_improper_data_size(commands):
+    with raises(ValueError):
+        commands.encrypt_ecb(AutosarKeySlots.KEY_1, PLAINTEXT[:-1])
+    with raises(ValueError):
+        commands.decrypt_cbc_stream(
+            AutosarKeySlots.KEY_1, IV, io.BytesIO(PLAINTEXT[:-1]), io.BytesIO()
+        )
+
+
+def test_empty_key_slot(commands):
+    with raises(KeyError):
+        commands.encrypt_ecb(AutosarKeySlots.KEY_2, PLAINTEXT)
+
+
+def test_key_usage_flag():
+    flags = SecurityFlags()
+    flags.key_usage = True
+    key_store = SheKeyStore()
+    key_store.load_key(AutosarKeySlots.KEY_1, KEY, flags)
+    commands = SheDataCommands(key_store)
+    assert CMAC == commands.generate_mac(AutosarKeySlots.KEY_1, PLAINTEXT)
+    with raises(ValueError):
+        commands.encrypt_ecb(AutosarKeySlots.KEY_1, PLAINTEXT)
+
+
+@mark.parametrize("chunk_size, workers", ((0, 1), (17, 1), (16, 0)))
+def test_improper_configuration(chunk_size, workers):
+    with raises(ValueError):
+        SheDataCommands(SheKeyStore(), chunk_size=chunk_size, workers=workers)
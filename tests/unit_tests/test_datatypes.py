@@ -1,3 +1,6 @@
+import copy
+import pickle
+
 from pytest import fixture, mark, raises
 from secure_hardware_extension.datatypes import (
     MemoryUpdateInfo,
@@ -146,6 +149,34 @@ def test_security_flags_improper_fid(fid, errortype):
         SecurityFlags(fid=fid)
 
 
+def test_security_flags_fid_set_under_lock():
+    class RecordingLock:
+        def __init__(self):
+            self.acquired = 0
+
+        def __enter__(self):
+            self.acquired += 1
+
+        def __exit__(self, *args):
+            pass
+
+    flags = SecurityFlags()
+    flags._lock = RecordingLock()
+    flags.fid = 20
+    flags.wildcard = True
+    assert 2 == flags._lock.acquired
+    assert 22 == flags.fid
+
+
+def test_security_flags_copy():
+    flags = SecurityFlags(fid=20)
+    copied = pickle.loads(pickle.dumps(flags))
+    copied.cmac_usage = True
+    assert (20, 21) == (flags.fid, copied.fid)
+    assert flags._lock is not copied._lock
+    assert 20 == copy.deepcopy(flags).fid
+
+
 @mark.parametrize(
     "new_key, auth_key, new_key_id, auth_key_id, counter, uid, flags",
     (
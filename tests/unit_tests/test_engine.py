@@ -0,0 +1,141 @@
+import random
+import threading
+
+from pytest import fixture, mark, raises
+from secure_hardware_extension.constants import SheConstants
+from secure_hardware_extension.crypto import KeyDerivationCache, compress
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, SecurityFlags
+from secure_hardware_extension.engine import (
+    BatchGenerator,
+    fanout_messages,
+    generate_fanout,
+    generate_messages,
+)
+from secure_hardware_extension.memory_update import MemoryUpdateProtocol
+
+
+@fixture
+def update_infos(random_update_infos):
+    yield random_update_infos(1, 200, keys=5)
+
+
+def test_generate_messages(update_infos, expected_messages):
+    for update_info, messages in zip(update_infos, generate_messages(update_infos)):
+        assert expected_messages(update_info) == tuple(messages)
+
+
+@mark.parametrize("workers, chunk_size", ((1, 1), (4, 7), (8, 256)))
+def test_batch_generator(update_infos, workers, chunk_size, expected_messages):
+    cache = KeyDerivationCache()
+    with BatchGenerator(workers=workers, chunk_size=chunk_size, cache=cache) as engine:
+        results = engine.generate_all(update_infos)
+    assert len(update_infos) == len(results)
+    for update_info, messages in zip(update_infos, results):
+        assert expected_messages(update_info) == tuple(messages)
+    assert 10 == len(cache)
+
+
+@mark.parametrize("workers, chunk_size", ((0, 1), (1, 0)))
+def test_batch_generator_improper_configuration(workers, chunk_size):
+    with raises(ValueError):
+        BatchGenerator(workers=workers, chunk_size=chunk_size)
+
+
+def test_key_derivation_cache_concurrent_use():
+    cache = KeyDerivationCache(max_size=8)
+    keys = [bytes([index]) * 16 for index in range(32)]
+    expected = {key: compress(key, SheConstants.KEY_UPDATE_ENC_C) for key in keys}
+    errors = []
+
+    def derive():
+        for key in keys * 10:
+            if cache.derive(key, SheConstants.KEY_UPDATE_ENC_C) != expected[key]:
+                errors.append(key)
+
+    threads = [threading.Thread(target=derive) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert 8 == len(cache)
+
+
+def test_protocol_shared_cache(update_infos, expected_messages):
+    cache = KeyDerivationCache()
+    for update_info in update_infos:
+        assert expected_messages(update_info) == (
+            MemoryUpdateProtocol(update_info, cache=cache).m1,
+            MemoryUpdateProtocol(update_info, cache=cache).m2,
+            MemoryUpdateProtocol(update_info, cache=cache).m3,
+            MemoryUpdateProtocol(update_info, cache=cache).m4,
+            MemoryUpdateProtocol(update_info, cache=cache).m5,
+        )
+    assert cache.hits
+
+
+def test_security_flags_concurrent_set():
+    flags = SecurityFlags()
+    names = (
+        "write_protection",
+        "boot_protection",
+        "debugger_protection",
+        "key_usage",
+        "wildcard",
+        "cmac_usage",
+    )
+
+    def toggle(name):
+        for _ in range(2000):
+            setattr(flags, name, False)
+            setattr(flags, name, True)
+
+    threads = [threading.Thread(target=toggle, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 0b111111 == flags.fid
+
+
+def test_fanout_messages(random_bytes, expected_messages):
+    generator = random.Random(5)
+    template = MemoryUpdateInfo(
+        new_key=random_bytes(generator, 16),
+        auth_key=random_bytes(generator, 16),
+        new_key_id=4,
+        auth_key_id=1,
+        counter=7,
+        uid=bytes(15),
+        flags=SecurityFlags(fid=20),
+    )
+    uids = [random_bytes(generator, 15) for _ in range(10)]
+    messages = fanout_messages(template, [uids[0].hex()] + uids[1:])
+    assert len(uids) == len(messages)
+    for uid, message_set in zip(uids, messages):
+        template.uid = uid
+        assert expected_messages(template) == tuple(message_set)
+    assert [] == fanout_messages(template, [])
+    with raises(ValueError):
+        fanout_messages(template, [bytes(16)])
+
+
+def test_generate_fanout(update_infos, random_update_infos, expected_messages):
+    template = update_infos[0]
+    shared = random_update_infos(
+        6,
+        30,
+        new_key=template.new_key,
+        auth_key=template.auth_key,
+        new_key_id=template.new_key_id,
+        auth_key_id=template.auth_key_id,
+        counter=template.counter,
+        flags=template.flags,
+    )
+    generator = random.Random(6)
+    mixed = update_infos[:20] + shared + update_infos[20:40]
+    generator.shuffle(mixed)
+    messages = generate_fanout(mixed)
+    assert generate_messages(mixed) == messages
+    for update_info, message_set in zip(mixed, messages):
+        assert expected_messages(update_info) == tuple(message_set)
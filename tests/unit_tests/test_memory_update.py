@@ -4,14 +4,19 @@ https://www.autosar.org/fileadmin/user_upload/standards/foundation/19-11/AUTOSAR
 
 """
 
-from pytest import fixture, raises
+from pytest import fixture, mark, raises
+from secure_hardware_extension.crypto import KeyDerivationCache
 from secure_hardware_extension.datatypes import (
     MemoryUpdateInfo,
     MemoryUpdateMessages,
     SecurityFlags,
     she_bytes,
 )
-from secure_hardware_extension.memory_update import MemoryUpdateProtocol
+from secure_hardware_extension.memory_update import (
+    MemoryUpdateProtocol,
+    MemoryUpdateView,
+    decode_m2_headers,
+)
 
 
 @fixture
@@ -93,3 +98,54 @@ def test_update_from_messages():
     assert update_protocol.update_info.counter == expected_counter
     assert update_protocol.update_info.uid == expected_uid
     assert update_protocol.update_info.fid == expected_fid
+
+
+def messages_of(update_info):
+    protocol = MemoryUpdateProtocol(update_info)
+    return MemoryUpdateMessages(
+        auth_key=update_info.auth_key, m1=protocol.m1, m2=protocol.m2
+    )
+
+
+def update_with(counter, fid):
+    return MemoryUpdateInfo(
+        new_key="0f0e0d0c0b0a09080706050403020100",
+        auth_key="000102030405060708090a0b0c0d0e0f",
+        new_key_id=4,
+        auth_key_id=1,
+        counter=counter,
+        uid="00" * 14 + "01",
+        flags=SecurityFlags(fid=fid),
+    )
+
+
+@mark.parametrize(
+    "counter, fid", [(1, 0), (0x1234567, 0b10101), (2**28 - 1, 0b11111), (16, 1)]
+)
+def test_update_from_messages_roundtrip(counter, fid):
+    update_info = MemoryUpdateProtocol(
+        messages_of(update_with(counter, fid))
+    ).update_info
+    assert update_info.counter == counter
+    assert update_info.fid == fid
+    assert update_info.new_key == she_bytes.fromhex("0f0e0d0c0b0a09080706050403020100")
+
+
+def test_view_decodes_lazily():
+    cache = KeyDerivationCache()
+    view = MemoryUpdateView(messages_of(update_with(0x1234567, 0b10101)), cache)
+    assert view.uid == she_bytes.fromhex("00" * 14 + "01")
+    assert (view.new_key_id, view.auth_key_id) == (4, 1)
+    assert cache.misses == 0
+    assert (view.counter, view.fid) == (0x1234567, 0b10101)
+    assert view.flags.fid == 0b10101
+    assert "new_key" not in view.__dict__
+    assert view.new_key == she_bytes.fromhex("0f0e0d0c0b0a09080706050403020100")
+    assert view.update_info.counter == 0x1234567
+    assert cache.misses == 1
+
+
+def test_decode_m2_headers():
+    fields = [(1, 0), (0x1234567, 0b10101), (2**28 - 1, 0b11111)]
+    m2s = [messages_of(update_with(*item)).M2 for item in fields]
+    assert decode_m2_headers(bytes(range(16)), m2s) == fields
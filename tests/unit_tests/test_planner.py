@@ -0,0 +1,118 @@
+import random
+
+from pytest import fixture, mark, raises
+from secure_hardware_extension.datatypes import SecurityFlags
+from secure_hardware_extension.key_slots.autosar import AutosarKeySlots
+from secure_hardware_extension.planner import CampaignPlanner, SlotState, SlotTarget
+
+MASTER = AutosarKeySlots.MASTER_ECU_KEY
+AUTH_SLOTS = {
+    MASTER: MASTER,
+    AutosarKeySlots.KEY_1: MASTER,
+    AutosarKeySlots.KEY_2: AutosarKeySlots.KEY_1,
+    AutosarKeySlots.KEY_3: AutosarKeySlots.KEY_3,
+}
+
+
+@fixture
+def fleet(random_bytes, random_update_infos):
+    uids = [bytes(update_info.uid) for update_info in random_update_infos(4, 20)]
+    generator = random.Random(4)
+    new_keys = {slot: random_bytes(generator, 16) for slot in AUTH_SLOTS}
+    current_state = {
+        (uid, slot.value): SlotState(
+            random_bytes(generator, 16), generator.randrange(100)
+        )
+        for uid in uids
+        for slot in AUTH_SLOTS
+    }
+    targets = [
+        SlotTarget(uid, slot, new_keys[slot], SecurityFlags(fid=4))
+        for uid in uids
+        for slot in AUTH_SLOTS
+    ]
+    generator.shuffle(targets)
+    yield targets, current_state
+
+
+def test_plan_orders_stages(fleet):
+    targets, current_state = fleet
+    plan = CampaignPlanner(AUTH_SLOTS).plan(targets, current_state)
+    assert [stage.slots for stage in plan.stages] == [
+        (MASTER.value, AutosarKeySlots.KEY_3.value),
+        (AutosarKeySlots.KEY_1.value,),
+        (AutosarKeySlots.KEY_2.value,),
+    ]
+    assert len(plan) == len(targets)
+
+    done = set()
+    for update_info in plan:
+        if update_info.auth_key_id != update_info.new_key_id:
+            assert (bytes(update_info.uid), update_info.auth_key_id) in done
+        done.add((bytes(update_info.uid), update_info.new_key_id))
+
+
+def test_plan_assigns_keys_and_counters(fleet):
+    targets, current_state = fleet
+    plan = CampaignPlanner(AUTH_SLOTS).plan(targets, current_state)
+    desired = {(bytes(target.uid), target.key_id): target for target in targets}
+    for update_info in plan:
+        uid = bytes(update_info.uid)
+        state = current_state[(uid, update_info.new_key_id)]
+        assert update_info.counter == state.counter + 1
+        assert update_info.fid == 4
+        if update_info.auth_key_id == update_info.new_key_id:
+            assert update_info.auth_key == state.key
+        else:
+            assert update_info.auth_key == desired[(uid, update_info.auth_key_id)].key
+
+
+def test_plan_groups_keys(fleet):
+    targets, current_state = fleet
+    plan = CampaignPlanner(AUTH_SLOTS).plan(targets, current_state)
+    runs = [(auth_key, new_key) for auth_key, new_key, _ in plan.groups()]
+    assert len(runs) == len(set(runs))
+    assert sum(len(updates) for _, _, updates in plan.groups()) == len(targets)
+
+
+def test_plan_uses_current_auth_key():
+    uid = "00" * 15
+    current_state = {(bytes(15), MASTER.value): SlotState(bytes(range(16)), 3)}
+    plan = CampaignPlanner(AUTH_SLOTS).plan(
+        [SlotTarget(uid, AutosarKeySlots.KEY_1, "ff" * 16)], current_state
+    )
+    (update_info,) = plan
+    assert update_info.auth_key == bytes(range(16))
+    assert update_info.counter == 1
+
+
+@mark.parametrize(
+    "auth_slots",
+    [
+        {1: 2, 2: 1},
+        {1: 2, 2: 3, 3: 1},
+    ],
+)
+def test_planner_cycle(auth_slots):
+    with raises(ValueError):
+        CampaignPlanner(auth_slots)
+
+
+def test_plan_unknown_auth_key():
+    with raises(ValueError):
+        CampaignPlanner(AUTH_SLOTS).plan(
+            [SlotTarget("00" * 15, AutosarKeySlots.KEY_1, "ff" * 16)], {}
+        )
+
+
+def test_plan_undefined_auth_slot():
+    with raises(ValueError):
+        CampaignPlanner(AUTH_SLOTS).plan(
+            [SlotTarget("00" * 15, AutosarKeySlots.KEY_9, "ff" * 16)], {}
+        )
+
+
+def test_plan_duplicated_target():
+    target = SlotTarget("00" * 15, MASTER, "ff" * 16)
+    with raises(ValueError):
+        CampaignPlanner(AUTH_SLOTS).plan([target, target], {})
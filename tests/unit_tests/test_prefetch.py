@@ -0,0 +1,91 @@
+import time
+
+from pytest import fixture, mark, raises
+from secure_hardware_extension.datatypes import SecurityFlags
+from secure_hardware_extension.engine import generate_messages
+from secure_hardware_extension.prefetch import MessagePrefetcher
+
+
+@fixture
+def plan(random_update_infos):
+    fields = dict(auth_key_id=1, flags=SecurityFlags())
+    first = random_update_infos(8, 40, new_key_id=1, **fields)
+    uids = [update_info.uid for update_info in first]
+    yield first + random_update_infos(9, 40, uids=uids, new_key_id=4, **fields)
+
+
+def uids_of(plan):
+    return list(dict.fromkeys(bytes(update_info.uid) for update_info in plan))
+
+
+def expected(plan, uid):
+    return generate_messages(
+        [update_info for update_info in plan if bytes(update_info.uid) == uid]
+    )
+
+
+def wait_for(prefetcher, stored):
+    deadline = time.monotonic() + 5
+    while prefetcher.metrics().stored < stored and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def wait_for_uid(prefetcher, uid):
+    deadline = time.monotonic() + 5
+    while uid not in prefetcher and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+@mark.parametrize("workers", [1, 3])
+def test_prefetch_in_plan_order(plan, workers):
+    with MessagePrefetcher(
+        plan, capacity=8, workers=workers, chunk_size=3
+    ) as prefetcher:
+        for uid in uids_of(plan):
+            wait_for_uid(prefetcher, uid)
+            assert prefetcher.get(uid) == expected(plan, uid)
+            assert prefetcher.metrics().stored <= 8
+        metrics = prefetcher.metrics()
+    assert metrics.hits + metrics.misses == len(uids_of(plan))
+    assert metrics.hit_rate == 1.0
+
+
+def test_prefetch_bounded(plan):
+    with MessagePrefetcher(plan, capacity=5, workers=2) as prefetcher:
+        wait_for(prefetcher, 5)
+        time.sleep(0.01)
+        assert prefetcher.metrics().stored == 5
+        assert prefetcher.metrics().prefetched == 5
+
+
+def test_prefetch_skips_evicted(plan):
+    uids = uids_of(plan)
+    with MessagePrefetcher(plan, capacity=6, workers=1) as prefetcher:
+        wait_for(prefetcher, 6)
+        assert prefetcher.get(uids[3]) == expected(plan, uids[3])
+        metrics = prefetcher.metrics()
+        assert metrics.evicted == 3
+        assert uids[0] not in prefetcher
+        wait_for(prefetcher, 6)
+        assert uids[9] in prefetcher
+        assert prefetcher.get(uids[0]) == expected(plan, uids[0])
+        assert prefetcher.metrics().misses == 1
+
+
+def test_prefetch_miss_fallback(plan):
+    uids = uids_of(plan)
+    with MessagePrefetcher(plan, capacity=1, workers=1) as prefetcher:
+        assert prefetcher.get(uids[-1].hex()) == expected(plan, uids[-1])
+        assert prefetcher.metrics().misses == 1
+
+
+def test_prefetch_unknown_uid(plan):
+    with MessagePrefetcher(plan) as prefetcher:
+        with raises(KeyError):
+            prefetcher.get(bytes(15))
+
+
+@mark.parametrize("kwargs", [{"capacity": 0}, {"workers": 0}, {"chunk_size": 0}])
+def test_prefetch_invalid_parameters(plan, kwargs):
+    with raises(ValueError):
+        MessagePrefetcher(plan, **kwargs)
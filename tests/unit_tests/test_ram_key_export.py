@@ -0,0 +1,77 @@
+from pytest import fixture, mark, raises
+from secure_hardware_extension.crypto import KeyDerivationCache
+from secure_hardware_extension.key_slots.autosar import AutosarKeySlots
+from secure_hardware_extension.ram_key_export import (
+    RamKeyExporter,
+    RamKeyExportTarget,
+    export_update_info,
+)
+
+RAM_KEY = "0f0e0d0c0b0a09080706050403020100"
+
+
+@fixture
+def targets(random_update_infos):
+    yield [
+        RamKeyExportTarget(update_info.uid, update_info.auth_key)
+        for update_info in random_update_infos(3, 40, keys=1, auth_keys=3)
+    ]
+
+
+def test_export_update_info():
+    target = RamKeyExportTarget("00" * 15, "000102030405060708090a0b0c0d0e0f")
+    update_info = export_update_info(target, RAM_KEY)
+    assert update_info.new_key_id == AutosarKeySlots.RAM_KEY.value
+    assert update_info.auth_key_id == AutosarKeySlots.SECRET_KEY.value
+    assert update_info.counter == 0
+    assert update_info.fid == 0
+    assert update_info.new_key == bytes.fromhex(RAM_KEY)
+
+
+@mark.parametrize("chunk_size", [1, 7, 4096])
+def test_export(targets, chunk_size, expected_messages):
+    messages = list(RamKeyExporter(chunk_size=chunk_size).export(RAM_KEY, targets))
+    assert len(messages) == len(targets)
+    for target, message_set in zip(targets, messages):
+        assert tuple(message_set) == expected_messages(
+            export_update_info(target, RAM_KEY)
+        )
+
+
+def test_export_derives_once_per_key(targets):
+    cache = KeyDerivationCache()
+    list(RamKeyExporter(cache=cache).export(RAM_KEY, targets))
+    secret_keys = {bytes(target.secret_key) for target in targets}
+    assert cache.misses == 2 * (len(secret_keys) + 1)
+
+
+def test_export_is_lazy(targets):
+    consumed = []
+
+    def source():
+        for target in targets:
+            consumed.append(target)
+            yield target
+
+    messages = RamKeyExporter(chunk_size=5).export(RAM_KEY, source())
+    next(messages)
+    assert len(consumed) == 5
+
+
+def test_check(targets):
+    exporter = RamKeyExporter(chunk_size=8)
+    messages = list(exporter.export(RAM_KEY, targets))
+    messages[4] = messages[4]._replace(m5=bytes(16))
+    messages[9] = messages[9]._replace(m2=messages[10].m2[::-1])
+    results = list(exporter.check(RAM_KEY, zip(targets, messages)))
+    assert [index for index, valid in enumerate(results) if not valid] == [4, 9]
+
+
+def test_export_invalid_ram_key(targets):
+    with raises(ValueError):
+        list(RamKeyExporter().export("00", targets))
+
+
+def test_exporter_invalid_chunk_size():
+    with raises(ValueError):
+        RamKeyExporter(chunk_size=0)
@@ -0,0 +1,146 @@
+import asyncio
+import sys
+
+from pytest import fixture, mark, raises
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, SecurityFlags
+from secure_hardware_extension.memory_update import MemoryUpdateProtocol
+from secure_hardware_extension.service import (
+    MicroBatcher,
+    Opcode,
+    ProvisioningClient,
+    ProvisioningService,
+)
+
+
+@fixture
+def update_info():
+    yield MemoryUpdateInfo(
+        new_key="0f0e0d0c0b0a09080706050403020100",
+        auth_key="000102030405060708090a0b0c0d0e0f",
+        new_key_id=4,
+        auth_key_id=1,
+        counter=1,
+        uid="00" * 14 + "01",
+        flags=SecurityFlags(),
+    )
+
+
+def updates(count):
+    return [
+        MemoryUpdateInfo(
+            new_key=bytes([index % 3]) * 16,
+            auth_key=bytes([7]) * 16,
+            new_key_id=4,
+            auth_key_id=1,
+            counter=index + 1,
+            uid=index.to_bytes(15, byteorder="big"),
+            flags=SecurityFlags(),
+        )
+        for index in range(count)
+    ]
+
+
+async def with_service(scenario, **options):
+    async with ProvisioningService(**options) as service:
+        host, port = service.address
+        client = await ProvisioningClient.connect(host=host, port=port)
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+
+
+def test_service_generate_batches_concurrent_requests():
+    update_infos = updates(40)
+
+    async def scenario(client):
+        results = await asyncio.gather(
+            *(client.generate(info) for info in update_infos)
+        )
+        return results, await client.metrics()
+
+    results, metrics = asyncio.run(with_service(scenario, max_wait=0.05))
+    for update_info, messages in zip(update_infos, results):
+        protocol = MemoryUpdateProtocol(update_info)
+        assert (
+            protocol.m1,
+            protocol.m2,
+            protocol.m3,
+            protocol.m4,
+            protocol.m5,
+        ) == tuple(messages)
+    assert metrics["batches"] < len(update_infos)
+    assert {"p50", "p90", "p99"} == set(metrics["latency"]["GENERATE"])
+    assert 0 == metrics["queue_depth"]
+
+
+def test_service_decode_and_verify(update_info):
+    protocol = MemoryUpdateProtocol(update_info)
+
+    async def scenario(client):
+        decoded = await client.decode(update_info.auth_key, protocol.m1, protocol.m2)
+        verified = await client.verify(update_info, protocol.m4, protocol.m5)
+        rejected = await client.verify(update_info, protocol.m4, bytes(16))
+        return decoded, verified, rejected
+
+    decoded, verified, rejected = asyncio.run(with_service(scenario))
+    assert update_info.new_key == decoded.new_key
+    assert update_info.counter == decoded.counter
+    assert update_info.uid == decoded.uid
+    assert verified
+    assert not rejected
+
+
+def test_service_malformed_request():
+    async def scenario(client):
+        with raises(RuntimeError):
+            await client.request(Opcode.GENERATE, b"\x00" * 3)
+        with raises(RuntimeError):
+            await client.request(0x7F, b"")
+        return await client.metrics()
+
+    metrics = asyncio.run(with_service(scenario))
+    assert 2 == metrics["errors"]
+
+
+@mark.skipif(sys.platform == "win32", reason="Unix domain sockets only")
+def test_service_unix_socket(tmp_path, update_info):
+    path = tmp_path / "she.sock"
+
+    async def scenario():
+        async with ProvisioningService(path=path):
+            client = await ProvisioningClient.connect(path=path)
+            messages = await client.generate(update_info)
+            await client.close()
+            return messages
+
+    messages = asyncio.run(scenario())
+    assert MemoryUpdateProtocol(update_info).m5 == messages.m5
+    assert not path.exists()
+
+
+def test_micro_batcher_isolates_failures():
+    def process(items):
+        if any(item < 0 for item in items):
+            raise ValueError("negative")
+        return [item * 2 for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(process, max_batch=8, max_wait=0.05)
+        batcher.start()
+        results = await asyncio.gather(
+            *(batcher.submit(item) for item in (1, -1, 3)), return_exceptions=True
+        )
+        await batcher.stop()
+        return results
+
+    first, second, third = asyncio.run(scenario())
+    assert 2 == first
+    assert isinstance(second, ValueError)
+    assert 6 == third
+
+
+@mark.parametrize("max_batch, max_wait", ((0, 0.1), (1, -1)))
+def test_micro_batcher_improper_configuration(max_batch, max_wait):
+    with raises(ValueError):
+        MicroBatcher(lambda items: items, max_batch=max_batch, max_wait=max_wait)
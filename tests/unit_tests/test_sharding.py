@@ -0,0 +1,222 @@
+import os
+import stat
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from pytest import fixture, mark, raises
+from secure_hardware_extension.engine import generate_messages
+from secure_hardware_extension.sharding import (
+    ShardBy,
+    ShardingCoordinator,
+    SpoolExecutor,
+    read_result,
+    run_shard,
+    spool_worker,
+)
+
+
+@fixture
+def manifest(random_update_infos):
+    yield random_update_infos(6, 120)
+
+
+class FlakyExecutor(ThreadPoolExecutor):
+    def __init__(self, failing):
+        super().__init__(max_workers=2)
+        self.failing = set(failing)
+        self.submitted = []
+
+    def submit(self, fn, input_path, output_path):
+        self.submitted.append(input_path.name)
+        if input_path.name in self.failing:
+            self.failing.remove(input_path.name)
+            future = Future()
+            future.set_exception(OSError("Worker lost."))
+            return future
+        return super().submit(fn, input_path, output_path)
+
+
+def check_result(result, manifest):
+    assert result.count == len(manifest)
+    assert list(read_result(result.path)) == generate_messages(manifest)
+    assert (
+        result.path.with_name("result.dat.sha256").read_text().startswith(result.sha256)
+    )
+
+
+@mark.parametrize("shard_by", list(ShardBy))
+def test_execute_threads(tmp_path, manifest, shard_by):
+    coordinator = ShardingCoordinator(tmp_path, shards=5, shard_by=shard_by)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        result = coordinator.execute(manifest, executor)
+    check_result(result, manifest)
+
+
+def test_execute_processes(tmp_path, manifest):
+    coordinator = ShardingCoordinator(tmp_path, shards=3)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        result = coordinator.execute(manifest, executor)
+    check_result(result, manifest)
+
+
+def test_deterministic_shards(tmp_path, manifest):
+    first = ShardingCoordinator(tmp_path / "first", shards=4, shard_by=ShardBy.AUTH_KEY)
+    second = ShardingCoordinator(
+        tmp_path / "second", shards=4, shard_by=ShardBy.AUTH_KEY
+    )
+    first.split(manifest)
+    second.split(manifest)
+    for shard in range(4):
+        assert (
+            first.input_path(shard).read_bytes()
+            == second.input_path(shard).read_bytes()
+        )
+    for update_info in manifest:
+        shards = {
+            first.shard_of(other)
+            for other in manifest
+            if other.auth_key == update_info.auth_key
+        }
+        assert shards == {first.shard_of(update_info)}
+
+
+def test_retry_failed_shards(tmp_path, manifest):
+    coordinator = ShardingCoordinator(tmp_path, shards=4)
+    coordinator.split(manifest)
+    with FlakyExecutor({"shard-0001.in"}) as executor:
+        coordinator.run(executor, retries=1)
+        assert sorted(executor.submitted) == sorted(
+            [f"shard-{shard:04d}.in" for shard in range(4)] + ["shard-0001.in"]
+        )
+    check_result(coordinator.merge(), manifest)
+
+
+def test_failed_shards_raise(tmp_path, manifest):
+    coordinator = ShardingCoordinator(tmp_path, shards=4)
+    coordinator.split(manifest)
+    with FlakyExecutor({"shard-0002.in"}) as executor:
+        with raises(RuntimeError):
+            coordinator.run(executor)
+    assert coordinator.pending() == [2]
+    assert isinstance(coordinator.failures[2], OSError)
+    with raises(RuntimeError):
+        coordinator.merge()
+
+
+def test_corrupted_output_rerun(tmp_path, manifest):
+    coordinator = ShardingCoordinator(tmp_path, shards=4)
+    coordinator.split(manifest)
+    with ThreadPoolExecutor() as executor:
+        coordinator.run(executor)
+    output = coordinator.output_path(3)
+    data = bytearray(output.read_bytes())
+    data[10] ^= 1
+    output.write_bytes(bytes(data))
+
+    resumed = ShardingCoordinator(tmp_path)
+    assert resumed.shards == 4
+    assert resumed.pending() == [3]
+    with FlakyExecutor(()) as executor:
+        resumed.run(executor)
+        assert executor.submitted == ["shard-0003.in"]
+    check_result(resumed.merge(), manifest)
+
+
+def test_spool_handoff(tmp_path, manifest):
+    stop = threading.Event()
+    workers = [
+        threading.Thread(
+            target=spool_worker, args=(tmp_path / "spool", stop, 0.01), daemon=True
+        )
+        for _ in range(2)
+    ]
+    coordinator = ShardingCoordinator(tmp_path / "campaign", shards=4)
+    with SpoolExecutor(tmp_path / "spool", poll_interval=0.01) as executor:
+        for worker in workers:
+            worker.start()
+        result = coordinator.execute(manifest, executor)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    check_result(result, manifest)
+
+
+def test_spool_worker_reports_errors(tmp_path):
+    spool = tmp_path / "spool"
+    (tmp_path / "shard-0000.in").write_bytes(b"corrupted")
+    with SpoolExecutor(spool, poll_interval=0.01) as executor:
+        future = executor.submit(
+            run_shard, tmp_path / "shard-0000.in", tmp_path / "shard-0000.out"
+        )
+        assert spool_worker(spool) == 1
+        with raises(RuntimeError):
+            future.result(timeout=5)
+
+
+def test_spool_receive_error_fails_future(tmp_path):
+    spool = tmp_path / "spool"
+    (tmp_path / "shard-0000.in").write_bytes(b"")
+    with SpoolExecutor(spool, poll_interval=0.01) as executor:
+        future = executor.submit(
+            run_shard, tmp_path / "shard-0000.in", tmp_path / "missing" / "shard.out"
+        )
+        (spool / "outbox" / "shard-0000.out").write_bytes(b"")
+        with raises(OSError):
+            future.result(timeout=5)
+
+
+def test_spool_poller_failure_fails_futures(tmp_path, monkeypatch):
+    spool = tmp_path / "spool"
+    (tmp_path / "shard-0000.in").write_bytes(b"")
+    with SpoolExecutor(spool, poll_interval=0.01) as executor:
+
+        def failing_wait(timeout):
+            raise OSError("Spool directory unavailable.")
+
+        monkeypatch.setattr(executor._stop, "wait", failing_wait)
+        future = executor.submit(
+            run_shard, tmp_path / "shard-0000.in", tmp_path / "shard-0000.out"
+        )
+        with raises(OSError):
+            future.result(timeout=5)
+        monkeypatch.undo()
+
+
+def file_mode(path):
+    return stat.S_IMODE(path.stat().st_mode)
+
+
+@mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_private_files(tmp_path, manifest):
+    coordinator = ShardingCoordinator(tmp_path / "campaign", shards=2)
+    coordinator.split(manifest)
+    (tmp_path / "spool" / "inbox").mkdir(parents=True)
+    (tmp_path / "spool" / "inbox" / "shard-0000.in").write_bytes(b"")
+    with SpoolExecutor(tmp_path / "spool", poll_interval=0.01) as executor:
+        future = executor.submit(
+            run_shard, coordinator.input_path(0), coordinator.output_path(0)
+        )
+        assert file_mode(tmp_path / "spool" / "inbox" / "shard-0000.in") == 0o600
+        assert spool_worker(tmp_path / "spool") == 1
+        future.result(timeout=5)
+    with ThreadPoolExecutor() as executor:
+        coordinator.run(executor)
+    result = coordinator.merge()
+    for path in (
+        coordinator.input_path(0),
+        coordinator.input_path(1),
+        coordinator.output_path(0),
+        coordinator.output_path(1),
+        result.path,
+    ):
+        assert file_mode(path) == 0o600
+
+
+def test_run_before_split(tmp_path):
+    with raises(RuntimeError):
+        ShardingCoordinator(tmp_path).run(ThreadPoolExecutor())
+
+
+def test_invalid_shards(tmp_path):
+    with raises(ValueError):
+        ShardingCoordinator(tmp_path, shards=0)
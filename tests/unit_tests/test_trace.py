@@ -0,0 +1,120 @@
+from pytest import fixture, raises
+from secure_hardware_extension.datatypes import SecurityFlags
+from secure_hardware_extension.memory_update import MemoryUpdateProtocol
+from secure_hardware_extension.trace import (
+    TraceFrame,
+    binary_frames,
+    extract_exchanges,
+    read_trace,
+    text_frames,
+    verification_records,
+    write_binary_frames,
+)
+from secure_hardware_extension.verification import ResponseVerifier
+
+ROUTINE_ID = 0xF000
+AUTH_KEY = bytes(range(16))
+
+
+@fixture
+def updates(random_update_infos):
+    yield random_update_infos(
+        5, 3, keys=3, auth_key=AUTH_KEY, auth_key_id=1, flags=SecurityFlags()
+    )
+
+
+@fixture
+def frames(updates):
+    protocols = [MemoryUpdateProtocol(update_info) for update_info in updates]
+    rid = ROUTINE_ID.to_bytes(2, byteorder="big")
+
+    def request(protocol):
+        return bytes([0x31, 0x01]) + rid + protocol.m1 + protocol.m2 + protocol.m3
+
+    def response(protocol):
+        return bytes([0x71, 0x01]) + rid + protocol.m4 + protocol.m5
+
+    yield [
+        TraceFrame(1.0, "1", request(protocols[0])),
+        TraceFrame(1.5, "2", request(protocols[1])),
+        TraceFrame(1.6, "2", bytes([0x7F, 0x31, 0x78])),
+        TraceFrame(2.0, "1", response(protocols[0])),
+        TraceFrame(2.5, "2", response(protocols[1])),
+        TraceFrame(3.0, "1", bytes([0x22, 0xF1, 0x90])),
+        TraceFrame(3.5, "3", request(protocols[2])),
+    ]
+
+
+@fixture
+def text_trace(tmp_path, frames):
+    path = tmp_path / "trace.log"
+    lines = ["# capture of station 4", "0.5 1 TX 10 03", "0.6 1 RX 50 03 00 32 01 f4"]
+    lines += [
+        f"{frame.timestamp} {frame.session} TX {frame.data.hex(' ')}"
+        for frame in frames
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    yield path
+
+
+def check_exchanges(exchanges, updates):
+    assert [exchange.session for exchange in exchanges] == ["1", "2", "3"]
+    assert [exchange.answered for exchange in exchanges] == [True, True, False]
+    for exchange, update_info in zip(exchanges, updates):
+        protocol = MemoryUpdateProtocol(update_info)
+        assert exchange.routine_id == ROUTINE_ID
+        assert (exchange.m1, exchange.m2, exchange.m3) == (
+            protocol.m1,
+            protocol.m2,
+            protocol.m3,
+        )
+    assert exchanges[0].m4 == MemoryUpdateProtocol(updates[0]).m4
+    assert exchanges[1].m5 == MemoryUpdateProtocol(updates[1]).m5
+    assert exchanges[1].response_timestamp == 2.5
+
+
+def test_text_trace(text_trace, updates):
+    check_exchanges(list(read_trace(text_trace)), updates)
+
+
+def test_text_frames_skip_other_services(text_trace):
+    assert {frame.data[0] for frame in text_frames(text_trace)} == {0x31, 0x71}
+
+
+def test_binary_trace(tmp_path, frames, updates):
+    path = tmp_path / "trace.bin"
+    with open(path, "wb") as file:
+        write_binary_frames(file, frames)
+    check_exchanges(list(read_trace(path, binary=True)), updates)
+
+
+def test_binary_trace_truncated(tmp_path, frames):
+    path = tmp_path / "trace.bin"
+    with open(path, "wb") as file:
+        write_binary_frames(file, frames)
+    path.write_bytes(path.read_bytes()[:-1])
+    with raises(ValueError):
+        list(binary_frames(path))
+
+
+def test_empty_trace(tmp_path):
+    path = tmp_path / "empty.log"
+    path.write_bytes(b"")
+    assert list(read_trace(path)) == []
+    assert list(read_trace(path, binary=True)) == []
+
+
+def test_extract_exchanges_routine_id(frames):
+    assert list(extract_exchanges(frames, routine_id=0x0201)) == []
+
+
+def test_unanswered_request_replaced(frames):
+    exchanges = list(extract_exchanges([frames[0], frames[0], frames[3]]))
+    assert [exchange.answered for exchange in exchanges] == [False, True]
+
+
+def test_verification_records(text_trace, updates):
+    records = verification_records(read_trace(text_trace), lambda uid, slot: AUTH_KEY)
+    results = list(ResponseVerifier().verify(records))
+    assert len(results) == 2
+    assert all(result.ok for result in results)
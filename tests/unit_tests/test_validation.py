@@ -0,0 +1,102 @@
+from pytest import fixture, mark
+from secure_hardware_extension.datatypes import MemoryUpdateInfo
+from secure_hardware_extension.key_slots.autosar import AutosarKeySlots
+from secure_hardware_extension.validation import (
+    FIELDS,
+    FieldError,
+    ValidationReport,
+    valid_updates,
+    validate_rows,
+)
+
+
+@fixture
+def row():
+    yield {
+        "new_key": "0f0e0d0c0b0a09080706050403020100",
+        "auth_key": "000102030405060708090A0B0C0D0E0F",
+        "new_key_id": "4",
+        "auth_key_id": AutosarKeySlots.MASTER_ECU_KEY,
+        "counter": 1,
+        "uid": "00" * 15,
+        "fid": "3",
+    }
+
+
+def test_valid_row(row):
+    report = validate_rows([row, tuple(row[name] for name in FIELDS)])
+    assert list(report.errors) == [0, 0]
+    assert (report.valid, report.invalid, len(report)) == (2, 0, 2)
+    assert report.counts() == {}
+    assert report.summary() == "2 valid, 0 invalid rows"
+
+
+@mark.parametrize(
+    "field, value, error",
+    [
+        ("new_key", "0f0e", FieldError.NEW_KEY),
+        ("new_key", "zz" * 16, FieldError.NEW_KEY),
+        ("auth_key", bytes(15), FieldError.AUTH_KEY),
+        ("auth_key", None, FieldError.AUTH_KEY),
+        ("new_key_id", 16, FieldError.NEW_KEY_ID),
+        ("new_key_id", "-1", FieldError.NEW_KEY_ID),
+        ("auth_key_id", True, FieldError.AUTH_KEY_ID),
+        ("counter", 2**28, FieldError.COUNTER),
+        ("counter", "0x10", FieldError.COUNTER),
+        ("uid", "00" * 16, FieldError.UID),
+        ("fid", 32, FieldError.FID),
+    ],
+)
+def test_invalid_field(row, field, value, error):
+    row[field] = value
+    report = validate_rows([row])
+    assert list(report.invalid_rows()) == [(0, error)]
+    assert report.counts() == {error: 1}
+
+
+def test_missing_fields(row):
+    del row["fid"]
+    del row["counter"]
+    report = validate_rows([row, ["00" * 16]])
+    assert list(report.invalid_rows()) == [
+        (0, FieldError.COUNTER),
+        (
+            1,
+            FieldError.AUTH_KEY
+            | FieldError.NEW_KEY_ID
+            | FieldError.AUTH_KEY_ID
+            | FieldError.COUNTER
+            | FieldError.UID,
+        ),
+    ]
+    assert report.summary() == (
+        "0 valid, 2 invalid rows "
+        "(auth_key: 1, new_key_id: 1, auth_key_id: 1, counter: 2, uid: 1)"
+    )
+
+
+def test_valid_updates(row):
+    invalid = dict(row, counter=-1)
+    report = ValidationReport()
+    updates = list(valid_updates([invalid, row, invalid], report))
+    assert list(report.errors) == [FieldError.COUNTER, 0, FieldError.COUNTER]
+    assert len(updates) == 1
+    update_info = updates[0]
+    assert isinstance(update_info, MemoryUpdateInfo)
+    assert (
+        update_info.new_key,
+        update_info.auth_key,
+        update_info.new_key_id,
+        update_info.auth_key_id,
+        update_info.counter,
+        update_info.uid,
+        update_info.fid,
+    ) == (
+        bytes.fromhex(row["new_key"]),
+        bytes.fromhex(row["auth_key"]),
+        4,
+        AutosarKeySlots.MASTER_ECU_KEY.value,
+        1,
+        bytes(15),
+        3,
+    )
@@ -0,0 +1,163 @@
+from pytest import fixture, mark, raises
+from secure_hardware_extension.crypto import KeyDerivationCache
+from secure_hardware_extension.datatypes import MemoryUpdateInfo, SecurityFlags
+from secure_hardware_extension.memory_update import (
+    MemoryUpdateProtocol,
+    unpack_m4_counter,
+)
+from secure_hardware_extension.planner import SlotState
+from secure_hardware_extension.verification import (
+    ResponseVerifier,
+    VerificationError,
+)
+
+
+@fixture
+def records(random_update_infos):
+    records = []
+    for update_info in random_update_infos(2, 50, flags=SecurityFlags()):
+        protocol = MemoryUpdateProtocol(update_info)
+        records.append((update_info, protocol.m4, protocol.m5))
+    yield records
+
+
+def tamper(records, index, m4=None, m5=None):
+    update_info, old_m4, old_m5 = records[index]
+    records[index] = (update_info, m4 or old_m4, m5 or old_m5)
+
+
+def test_unpack_m4_counter():
+    assert unpack_m4_counter(((5 << 100) | (1 << 99)).to_bytes(16, "big")) == 5
+    assert unpack_m4_counter((5 << 100).to_bytes(16, "big")) is None
+
+
+@mark.parametrize("chunk_size", [1, 7, 65536])
+def test_verify_valid(records, chunk_size):
+    results = list(ResponseVerifier(chunk_size=chunk_size).verify(records))
+    assert [result.index for result in results] == list(range(len(records)))
+    assert all(result.ok for result in results)
+    assert [result.received_counter for result in results] == [
+        update_info.counter for update_info, _, _ in records
+    ]
+
+
+def test_verify_derives_once_per_key(records):
+    cache = KeyDerivationCache()
+    list(ResponseVerifier(cache=cache).verify(records))
+    distinct_keys = {bytes(update_info.new_key) for update_info, _, _ in records}
+    assert cache.misses == 2 * len(distinct_keys)
+
+
+def test_verify_mismatches(records):
+    update_info, m4, m5 = records[3]
+    tamper(records, 3, m4=bytes([m4[0] ^ 1]) + m4[1:])
+    tamper(records, 5, m5=bytes(16))
+    tamper(records, 8, m4=records[8][1][:-1])
+    other = records[10][0]
+    tamper(
+        records,
+        10,
+        m4=MemoryUpdateProtocol(
+            MemoryUpdateInfo(
+                new_key=other.new_key,
+                auth_key=other.auth_key,
+                new_key_id=other.new_key_id,
+                auth_key_id=other.auth_key_id,
+                counter=(other.counter + 1) % 2**28,
+                uid=other.uid,
+                flags=SecurityFlags(),
+            )
+        ).m4,
+    )
+
+    mismatches = {
+        result.index: result for result in ResponseVerifier().mismatches(records)
+    }
+
+    assert set(mismatches) == {3, 5, 8, 10}
+    assert (
+        mismatches[3].errors == VerificationError.WRONG_UID | VerificationError.BAD_MAC
+    )
+    assert mismatches[5].errors == VerificationError.BAD_MAC
+    assert mismatches[8].errors == VerificationError.MALFORMED
+    assert not mismatches[8].errors & VerificationError.UNDECRYPTABLE
+    assert mismatches[10].errors == (
+        VerificationError.WRONG_COUNTER | VerificationError.BAD_MAC
+    )
+    assert mismatches[10].received_counter == (other.counter + 1) % 2**28
+
+
+def test_verify_wrong_key_id(records):
+    update_info, m4, m5 = records[0]
+    tamper(records, 0, m4=m4[:15] + bytes([m4[15] ^ 0x10]) + m4[16:])
+    (result,) = ResponseVerifier().mismatches(records)
+    assert result.errors & VerificationError.WRONG_KEY_ID
+
+
+def test_verify_wrong_new_key(records):
+    update_info, m4, m5 = records[0]
+    _, foreign_m4, _ = next(
+        record for record in records if record[0].new_key != update_info.new_key
+    )
+    tamper(records, 0, m4=m4[:16] + foreign_m4[16:])
+    (result,) = ResponseVerifier().mismatches(records)
+    assert result.errors & VerificationError.UNDECRYPTABLE
+    assert not result.errors & VerificationError.MALFORMED
+    assert result.received_counter is None
+
+
+def test_verifier_invalid_chunk_size():
+    with raises(ValueError):
+        ResponseVerifier(chunk_size=0)
+
+
+def captures(records):
+    return [(update_info.new_key, m4, m5) for update_info, m4, m5 in records]
+
+
+@mark.parametrize("chunk_size", [1, 7, 65536])
+def test_recover_counters(records, chunk_size):
+    recovered = list(
+        ResponseVerifier(chunk_size=chunk_size).recover_counters(captures(records))
+    )
+    assert [
+        (item.index, item.uid, item.key_id, item.counter) for item in recovered
+    ] == [
+        (index, bytes(update_info.uid), update_info.new_key_id, update_info.counter)
+        for index, (update_info, _, _) in enumerate(records)
+    ]
+
+
+def test_recover_counters_unauthentic(records):
+    items = captures(records)
+    key, m4, m5 = items[2]
+    items[2] = (key, m4, bytes(16))
+    items[4] = (bytes(16), items[4][1], items[4][2])
+    items[6] = (key, m4[:-1], m5)
+    recovered = list(ResponseVerifier().recover_counters(items))
+    assert [item.index for item in recovered if not item.ok] == [2, 4, 6]
+
+
+def test_recover_slot_states(records):
+    update_info, m4, m5 = records[0]
+    newer = MemoryUpdateProtocol(
+        MemoryUpdateInfo(
+            new_key=update_info.new_key,
+            auth_key=update_info.auth_key,
+            new_key_id=update_info.new_key_id,
+            auth_key_id=update_info.auth_key_id,
+            counter=(update_info.counter + 5) % 2**28,
+            uid=update_info.uid,
+            flags=SecurityFlags(),
+        )
+    )
+    items = captures(records) + [(update_info.new_key, newer.m4, newer.m5)]
+    items.append((update_info.new_key, m4, bytes(16)))
+    states = ResponseVerifier().recover_slot_states(items)
+
+    assert len(states) == len(
+        {(bytes(item.uid), item.new_key_id) for item, _, _ in records}
+    )
+    assert states[(bytes(update_info.uid), update_info.new_key_id)] == SlotState(
+        bytes(update_info.new_key), max(update_info.counter, newer.update_info.counter)
+    )